@@ -0,0 +1,43 @@
+"""
+gunicorn 配置
+用法 (在 backend/ 目录下): gunicorn -c config/gunicorn.py config.wsgi
+每个工作进程的 torch 线程数按 可用核心数 / 工作进程数 划分 (见 detection/services/threading_profile.py)；
+PIN_WORKER_CPUS=True 时每个工作进程绑定到互不重叠的核心集合。
+合适的 INFERENCE_WORKERS / TORCH_INTRA_OP_THREADS 组合可用 `python manage.py benchmark_threads` 测得。
+"""
+import os
+
+from detection.services.threading_profile import available_cpus, plan_threads, thread_env, worker_cpu_set, pin_to_cpus
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('INFERENCE_WORKERS', os.getenv('WEB_CONCURRENCY', '1')))
+# gthread: 同一进程内的并发请求共享模型，并由推理流水线合批 (见 detection/services/pipeline.py)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+PIN_WORKER_CPUS = os.getenv('PIN_WORKER_CPUS', 'False').lower() == 'true'
+CPUS = available_cpus()
+
+
+def pre_fork(server, worker):
+    """ (主进程) 为新工作进程分配最小的空闲核心槽位，重启的工作进程沿用退出者的槽位 """
+    used = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    """ (工作进程) 在导入 torch 之前确定线程数，并按需绑定核心 """
+    os.environ['INFERENCE_WORKERS'] = str(server.num_workers)
+    if PIN_WORKER_CPUS:
+        cpu_set = worker_cpu_set(CPUS, server.num_workers, worker.cpu_slot)
+        if pin_to_cpus(cpu_set):
+            # 绑定后本进程只在自己的核心集合上运行，线程数等于集合大小
+            os.environ.setdefault('TORCH_INTRA_OP_THREADS', str(len(cpu_set)))
+            server.log.info(f"Worker {worker.pid} (slot {worker.cpu_slot}) pinned to CPUs {cpu_set}")
+    profile = plan_threads(
+        len(CPUS), server.num_workers,
+        int(os.getenv('TORCH_INTRA_OP_THREADS', '0')), int(os.getenv('TORCH_INTER_OP_THREADS', '1')),
+    )
+    for key, value in thread_env(profile).items():
+        os.environ.setdefault(key, value)
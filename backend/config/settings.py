@@ -126,15 +126,66 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', None)
 MODEL_FILENAME = 'best_text_image_model.pth'
 DEVICE = 'cuda' if os.getenv('USE_GPU', 'False').lower() == 'true' else 'cpu' # 可通过环境变量USE_GPU=True启用GPU
 MODEL_PATH = os.path.join(MODEL_STORAGE_PATH, MODEL_FILENAME) # 现在 MODEL_STORAGE_PATH 已定义
+# 版本化模型存储 (见 detection/services/model_store.py)：ACTIVE 文件存在时优先于 MODEL_PATH
+MODEL_VERSIONS_DIR = os.path.join(MODEL_STORAGE_PATH, 'versions')
+MODEL_ACTIVE_POINTER = os.path.join(MODEL_STORAGE_PATH, 'ACTIVE')
+# 工作进程检查 ACTIVE 是否变化的间隔 (秒)，0 表示只在处理检测请求时检查
+MODEL_RELOAD_INTERVAL = int(os.getenv('MODEL_RELOAD_INTERVAL', '10'))
+# 影子推理 (见 detection/services/shadow.py)：按比例抽样的检测在主结果保存后，用候选版本再推理一次并记录两者概率
+SHADOW_MODEL_VERSION = os.getenv('SHADOW_MODEL_VERSION', '') # 候选模型版本号，留空则关闭
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0.1'))
+# 影子推理可占用的 CPU 比例 (以单核计)，超出预算的任务直接丢弃
+SHADOW_CPU_BUDGET = float(os.getenv('SHADOW_CPU_BUDGET', '0.25'))
+SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', '16'))
+SHADOW_LOG_PATH = os.path.join(BASE_DIR, 'logs', 'shadow_inference.jsonl')
+# 推理流水线 (见 detection/services/pipeline.py)：预处理线程数、单批最大请求数、攒批最长等待时间 (毫秒)
+INFERENCE_PREPROCESS_WORKERS = int(os.getenv('INFERENCE_PREPROCESS_WORKERS', '2'))
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '8'))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv('INFERENCE_BATCH_WAIT_MS', '5'))
+# 快速图像预处理 (见 detection/ml/fast_image.py)：图像保持 uint8 直到成批后一次性归一化
+FAST_IMAGE_PREPROCESSING = os.getenv('FAST_IMAGE_PREPROCESSING', 'True').lower() == 'true'
+# JPEG 以 draft 模式按比例缩小解码 (结果与全尺寸解码相差约 3 个灰度级)
+JPEG_DRAFT_DECODING = os.getenv('JPEG_DRAFT_DECODING', 'True').lower() == 'true'
+# 发送给视觉 LLM 的图像长边上限 (像素)，0 表示保持原尺寸
+LLM_IMAGE_MAX_SIDE = int(os.getenv('LLM_IMAGE_MAX_SIDE', '1024'))
+# 图像感知哈希 (见 detection/services/image_hash.py)：训练数据目录 (processed/processed_data.csv 和 processed/images)，
+# 视为同一图像 (重新发布) 的最大 pHash 汉明距离
+DATASET_DIR = os.getenv('DATASET_DIR', os.path.join(BASE_DIR, '..', 'data'))
+IMAGE_MATCH_MAX_DISTANCE = int(os.getenv('IMAGE_MATCH_MAX_DISTANCE', '8'))
+# 融合特征相似度索引 (见 detection/services/embedding_index.py)：flat (float16 全量矩阵乘) 或 ivfpq (倒排 + 乘积量化，
+# 行数达到 EMBEDDING_IVF_MIN_ROWS 后启用，此前仍用 flat)；聚类数、每次查询探查的聚类数、乘积量化的子向量数
+EMBEDDING_INDEX = os.getenv('EMBEDDING_INDEX', 'flat').lower()
+EMBEDDING_IVF_MIN_ROWS = int(os.getenv('EMBEDDING_IVF_MIN_ROWS', '100000'))
+EMBEDDING_IVF_LISTS = int(os.getenv('EMBEDDING_IVF_LISTS', '1024'))
+EMBEDDING_IVF_PROBE = int(os.getenv('EMBEDDING_IVF_PROBE', '16'))
+EMBEDDING_PQ_SUBVECTORS = int(os.getenv('EMBEDDING_PQ_SUBVECTORS', '32'))
+# 推理精度 (见 detection/ml/precision.py)：fp32 或 bf16 (autocast)；bf16 需要 checkpoint 的 .json 配置中记录了
+# 通过的精度校验 (scripts/model_evaluation.py --precision bf16 --accuracy_guard)，否则回退到 fp32
+INFERENCE_PRECISION = os.getenv('INFERENCE_PRECISION', 'fp32').lower()
+INFERENCE_PRECISION_REQUIRE_GUARD = os.getenv('INFERENCE_PRECISION_REQUIRE_GUARD', 'True').lower() == 'true'
+# 图像分支使用 channels_last 内存格式 (卷积权重会被复制，不再与其他工作进程共享内存映射)
+CHANNELS_LAST = os.getenv('CHANNELS_LAST', 'False').lower() == 'true'
+# 推理线程划分 (见 detection/services/threading_profile.py)：本机工作进程数、每个进程的 intra-op/inter-op 线程数 (0 表示按 可用核心数 / 工作进程数 自动计算)
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', os.getenv('WEB_CONCURRENCY', '1')))
+TORCH_INTRA_OP_THREADS = int(os.getenv('TORCH_INTRA_OP_THREADS', '0'))
+TORCH_INTER_OP_THREADS = int(os.getenv('TORCH_INTER_OP_THREADS', '1'))
+# 把每个 gunicorn 工作进程绑定到互不重叠的核心集合 (见 config/gunicorn.py)
+PIN_WORKER_CPUS = os.getenv('PIN_WORKER_CPUS', 'False').lower() == 'true'
 NUM_METADATA_FEATURES = 0 # 设置为 0
 # 确认模型训练时的参数 (与 train_model.py/model_evaluation.py 保持一致)
-TEXT_MODEL_NAME = 'bert-base-chinese'
-IMAGE_MODEL_NAME = 'resnet50'
+# 骨干网络与 scripts/backbones.py 读取相同的环境变量；嵌入维度由骨干网络推断。
+# checkpoint 旁的 model.json (训练时写入) 优先于这里的默认值
+TEXT_MODEL_NAME = os.getenv('TEXT_MODEL_NAME', 'bert-base-chinese')
+IMAGE_MODEL_NAME = os.getenv('IMAGE_MODEL_NAME', 'resnet50') # 可选: resnet50, efficientnet_b0, mobilenet_v3_large, mobilenet_v3_small
 IMAGE_MODEL_INPUT_SIZE = 224
 MAX_TEXT_LEN = 128
-IMG_EMBEDDING_DIM = 2048
-TEXT_EMBEDDING_DIM = 768
 FUSION_OUTPUT_DIM = 256
+# 以只读内存映射 (写时复制) 方式加载模型权重，多个工作进程共享同一份物理内存页 (仅CPU)
+MODEL_WEIGHTS_MMAP = os.getenv('MODEL_WEIGHTS_MMAP', 'True').lower() == 'true'
+# 工作进程启动时后台预热模型 (见 config/wsgi.py)，预热完成前就绪探针返回 503
+MODEL_WARMUP_ON_STARTUP = os.getenv('MODEL_WARMUP_ON_STARTUP', 'True').lower() == 'true'
+# 预热时执行前向推理的序列长度 (preprocess_text 总是填充到 MAX_TEXT_LEN，服务中只会出现这一种长度)
+MODEL_WARMUP_SEQ_LENGTHS = [int(n) for n in os.getenv('MODEL_WARMUP_SEQ_LENGTHS', str(MAX_TEXT_LEN)).split(',')]
 # --- 结束模型和路径配置 ---
 
 # REST Framework设置
@@ -158,6 +209,9 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # 在开发环境中允许所有来源
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:8080').split(',')
 
+# 系统设置 (SystemSettings) 进程内缓存的校验间隔 (秒)：其他进程的修改最多延迟这么久生效，0 表示每次读取都校验版本号
+SETTINGS_CACHE_TTL = float(os.getenv('SETTINGS_CACHE_TTL', '5'))
+
 # 自定义用户模型
 AUTH_USER_MODEL = 'users.User'
 
@@ -9,3 +9,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# 工作进程启动后在后台预热模型，避免首个检测请求承担冷启动开销
+from django.conf import settings
+
+if settings.MODEL_WARMUP_ON_STARTUP:
+    from detection.services.detection_service import start_warmup
+    start_warmup()
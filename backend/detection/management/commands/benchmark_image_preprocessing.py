@@ -0,0 +1,111 @@
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+class Command(BaseCommand):
+    help = '对比现有图像变换与快速图像预处理 (uint8 批量 + JPEG draft 解码) 的吞吐量和结果差异'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='图像文件或目录 (默认生成合成 JPEG)')
+        parser.add_argument('--model', default=settings.IMAGE_MODEL_NAME, help='图像骨干网络名称')
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次')
+        parser.add_argument('--synthetic', type=int, default=32, help='未指定图像时生成的合成图像数量')
+        parser.add_argument('--size', default='1600x1200', help='合成图像尺寸 (宽x高)')
+
+    def handle(self, *args, **options):
+        import torch
+        from PIL import Image
+        from detection.ml.data_utils import get_image_transforms
+        from detection.ml.fast_image import FastImagePreprocessor
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = self._collect_paths(options['paths']) or self._synthetic_images(
+                Path(tmp_dir), options['synthetic'], options['size']
+            )
+            if not paths:
+                raise CommandError("没有找到图像")
+
+            transform = get_image_transforms(options['model'])
+            batch_size = options['batch_size']
+
+            def reference():
+                outputs = []
+                for start in range(0, len(paths), batch_size):
+                    images = [transform(Image.open(p).convert('RGB')) for p in paths[start:start + batch_size]]
+                    outputs.append(torch.stack(images))
+                return torch.cat(outputs)
+
+            def fast(preprocessor):
+                def run():
+                    outputs = []
+                    for start in range(0, len(paths), batch_size):
+                        pixels = [preprocessor.load(p) for p in paths[start:start + batch_size]]
+                        outputs.append(preprocessor.to_batch(pixels, 'cpu')[0])
+                    return torch.cat(outputs)
+                return run
+
+            candidates = [('torchvision transforms', reference)]
+            for use_draft, label in ((False, 'fast (full decode)'), (True, 'fast (JPEG draft)')):
+                preprocessor = FastImagePreprocessor.for_backbone(
+                    options['model'], settings.IMAGE_MODEL_INPUT_SIZE, use_draft=use_draft
+                )
+                if preprocessor is None:
+                    raise CommandError(f"不支持的图像骨干网络: {options['model']}")
+                candidates.append((label, fast(preprocessor)))
+
+            self.stdout.write(f"{len(paths)} 张图像, 批大小 {batch_size}, 骨干网络 {options['model']}")
+            self.stdout.write(f"{'方式':<24}{'图像/秒':>10}{'毫秒/张':>10}{'最大差异':>10}{'平均差异':>12}")
+            baseline = None
+            for label, fn in candidates:
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    output = fn()
+                    best = min(best, time.perf_counter() - start)
+                if baseline is None:
+                    baseline = output
+                diff = (output - baseline).abs()
+                self.stdout.write(
+                    f"{label:<24}{len(paths) / best:>10.1f}{best * 1000 / len(paths):>10.2f}"
+                    f"{diff.max().item():>10.4f}{diff.mean().item():>12.6f}"
+                )
+
+    def _collect_paths(self, inputs):
+        paths = []
+        for item in inputs:
+            path = Path(item)
+            if path.is_dir():
+                paths.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES))
+            elif path.is_file():
+                paths.append(path)
+        return paths
+
+    def _synthetic_images(self, directory, count, size):
+        """ 生成带渐变和噪声的合成照片 (JPEG) """
+        from PIL import Image
+
+        width, height = (int(v) for v in size.lower().split('x'))
+        rng = np.random.default_rng(0)
+        x = np.linspace(0, 1, width)[None, :, None]
+        y = np.linspace(0, 1, height)[:, None, None]
+        paths = []
+        for i in range(count):
+            phase = rng.uniform(0, 10)
+            base = np.concatenate([
+                255 * x * np.ones_like(y),
+                255 * y * np.ones_like(x),
+                128 + 60 * np.sin(x * 30 + y * 20 + phase),
+            ], axis=2)
+            pixels = (base + rng.normal(0, 8, base.shape)).clip(0, 255).astype(np.uint8)
+            path = directory / f'synthetic_{i}.jpg'
+            Image.fromarray(pixels).save(path, quality=90)
+            paths.append(path)
+        return paths
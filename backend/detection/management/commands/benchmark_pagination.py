@@ -0,0 +1,101 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from detection.models import Detection
+from detection.pagination import DETECTION_ORDERING, DetectionCursorPagination
+
+
+class Rollback(Exception):
+    """ 结束基准测试并回滚合成数据 """
+
+
+class Command(BaseCommand):
+    help = '对比页码分页 (OFFSET) 与游标分页 (created_at, id) 在不同翻页深度下的单页耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='合成检测记录数 (指定 --user 时不生成)')
+        parser.add_argument('--user', default=None, help='使用该用户已有的检测记录，不生成合成数据')
+        parser.add_argument('--all', action='store_true', help='管理员视角: 分页全部用户的记录')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--pages', default='1,10,100,1000,4000', help='逗号分隔的页码 (翻页深度)')
+        parser.add_argument('--repeat', type=int, default=5, help='每个深度重复次数，取中位数')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['user']:
+                    user = get_user_model().objects.filter(username=options['user']).first()
+                    if user is None:
+                        raise CommandError(f"用户不存在: {options['user']}")
+                else:
+                    user = self._synthetic_history(options['rows'])
+                self._benchmark(user, options)
+                # 合成数据不保留
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _synthetic_history(self, rows):
+        """ 在当前事务中生成一个带 rows 条检测记录的临时用户 """
+        user = get_user_model().objects.create_user(username='__pagination_benchmark__')
+        batch = 5000
+        for start in range(0, rows, batch):
+            Detection.objects.bulk_create([
+                Detection(user=user, title=f'benchmark {i}', content='benchmark',
+                          status=Detection.STATUS_COMPLETED, result=Detection.RESULT_REAL)
+                for i in range(start, min(rows, start + batch))
+            ])
+        self.stdout.write(f"已生成 {rows} 条合成检测记录 (结束后回滚)")
+        return user
+
+    def _benchmark(self, user, options):
+        queryset = Detection.objects.order_by(*DETECTION_ORDERING)
+        if not options['all']:
+            queryset = queryset.filter(user=user)
+        page_size = options['page_size']
+        total = queryset.count()
+        factory = APIRequestFactory()
+
+        def median_ms(fn):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                page = fn()
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            return timings[len(timings) // 2], page
+
+        self.stdout.write(f"{total} 条记录, 每页 {page_size} 条, 范围: {'全部用户' if options['all'] else user.username}")
+        self.stdout.write(f"{'页码':>8}{'OFFSET (毫秒)':>16}{'游标 (毫秒)':>14}{'结果一致':>10}")
+        for page_number in (int(p) for p in options['pages'].split(',') if p.strip()):
+            offset = (page_number - 1) * page_size
+            if offset >= total:
+                self.stdout.write(f"{page_number:>8}  (超出记录数，跳过)")
+                continue
+
+            def offset_page():
+                paginator = PageNumberPagination()
+                paginator.page_size = page_size
+                request = Request(factory.get('/', {'page': page_number}))
+                return paginator.paginate_queryset(queryset, request)
+
+            # 游标取自上一页的最后一条记录 (不计时)，与客户端沿 next 链接翻页时一致
+            cursor = DetectionCursorPagination.cursor_token(False, queryset[offset - 1]) if offset else None
+
+            def cursor_page():
+                paginator = DetectionCursorPagination()
+                params = {'page_size': page_size}
+                if cursor:
+                    params['cursor'] = cursor
+                return paginator.paginate_queryset(queryset, Request(factory.get('/', params)))
+
+            offset_ms, offset_rows = median_ms(offset_page)
+            cursor_ms, cursor_rows = median_ms(cursor_page)
+            same = [d.pk for d in offset_rows] == [d.pk for d in cursor_rows]
+            self.stdout.write(f"{page_number:>8}{offset_ms:>16.2f}{cursor_ms:>14.2f}{'是' if same else '否':>10}")
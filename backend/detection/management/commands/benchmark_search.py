@@ -0,0 +1,128 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from detection.models import Detection
+from detection.services.search import BigramIndex, search_detections
+
+# 合成文本使用的常用汉字
+COMMON_CHARS = (
+    '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所'
+    '民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那'
+    '社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通'
+    '并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区'
+    '强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清'
+    '己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步'
+    '群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团'
+    '往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县'
+    '局照参红细引听该铁价严谣言疫苗地震专家网传辟谣警方官方通报视频图片'
+)
+STATUSES = [Detection.STATUS_COMPLETED] * 8 + [Detection.STATUS_FAILED, Detection.STATUS_PENDING]
+RESULTS = [Detection.RESULT_FAKE, Detection.RESULT_REAL, Detection.RESULT_UNKNOWN]
+
+
+class SyntheticCorpus:
+    """ 按 Zipf 分布抽取 2-3 字词语拼成的合成新闻 """
+
+    def __init__(self, seed, vocabulary_size=20000):
+        self.random = random.Random(seed)
+        self.words = [
+            ''.join(self.random.choices(COMMON_CHARS, k=self.random.choice((2, 2, 3))))
+            for _ in range(vocabulary_size)
+        ]
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+
+    def text(self, min_words, max_words):
+        count = self.random.randint(min_words, max_words)
+        return ''.join(self.random.choices(self.words, cum_weights=self.cum_weights, k=count))
+
+    def query(self):
+        # 检索词偏向中低频词语 (高频词语几乎匹配全部记录)
+        rank = int(self.random.paretovariate(0.6)) + 20
+        words = [self.words[min(rank, len(self.words) - 1)]]
+        if self.random.random() < 0.3:
+            words.append(self.random.choice(self.words[:500]))
+        return ' '.join(words)
+
+
+class Command(BaseCommand):
+    help = '合成检测记录 (默认 100 万条)，测量全文检索的延迟 (MySQL ngram FULLTEXT 或进程内二元组倒排索引)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--backend', choices=['auto', 'index', 'database'], default='auto',
+            help='index: 只在内存中构建倒排索引，不写数据库; database: 合成记录写入数据库 (结束后删除)，'
+                 '经 search_detections 检索; auto: MySQL 用 database，其他数据库用 index'
+        )
+
+    def handle(self, *args, **options):
+        if options['queries'] < 1:
+            raise CommandError('--queries 必须大于 0')
+        backend = options['backend']
+        if backend == 'auto':
+            backend = 'database' if connection.vendor == 'mysql' else 'index'
+        corpus = SyntheticCorpus(options['seed'])
+        queries = [corpus.query() for _ in range(options['queries'])]
+        filters = [{}, {'result': Detection.RESULT_FAKE}, {'status': Detection.STATUS_COMPLETED}]
+
+        if backend == 'index':
+            index = BigramIndex()
+            start = time.perf_counter()
+            now = timezone.now()
+            for pk in range(1, options['rows'] + 1):
+                created_at = now - timedelta(minutes=pk)
+                index.add(
+                    pk, corpus.text(3, 6), corpus.text(15, 40), pk % 100,
+                    corpus.random.choice(STATUSES), corpus.random.choice(RESULTS), created_at, created_at,
+                )
+            postings = sum(len(p) for field in index.postings.values() for p in field.values())
+            self.stdout.write(f"索引构建: {options['rows']} 条记录, {postings} 个倒排项, 耗时 {time.perf_counter() - start:.1f} 秒")
+            self._run(queries, filters, lambda query, extra: index.search(query, **extra))
+            return
+
+        user = get_user_model().objects.create_user(username='__search_benchmark__')
+        try:
+            start = time.perf_counter()
+            batch = 5000
+            for offset in range(0, options['rows'], batch):
+                Detection.objects.bulk_create([
+                    Detection(
+                        user=user, title=corpus.text(3, 6), content=corpus.text(15, 40),
+                        status=corpus.random.choice(STATUSES), result=corpus.random.choice(RESULTS),
+                    )
+                    for _ in range(min(batch, options['rows'] - offset))
+                ])
+            self.stdout.write(f"写入 {options['rows']} 条合成记录, 耗时 {time.perf_counter() - start:.1f} 秒")
+            # 首次检索 (进程内索引的全量加载 / InnoDB 全文索引的缓存预热) 不计入
+            start = time.perf_counter()
+            search_detections(queries[0])
+            self.stdout.write(f"首次检索耗时 {time.perf_counter() - start:.1f} 秒")
+            self._run(queries, filters, lambda query, extra: search_detections(query, **extra))
+        finally:
+            # 级联删除合成记录 (InnoDB 全文索引只在提交后可见，因此不能用回滚的事务)
+            user.delete()
+
+    def _run(self, queries, filters, search):
+        self.stdout.write(f"{'过滤条件':<24}{'P50 (毫秒)':>12}{'P95 (毫秒)':>12}{'最大 (毫秒)':>12}{'平均命中':>10}")
+        for extra in filters:
+            timings, hits = [], []
+            for query in queries:
+                start = time.perf_counter()
+                total, _ = search(query, extra)
+                timings.append((time.perf_counter() - start) * 1000)
+                hits.append(total)
+            timings.sort()
+            label = ', '.join(f'{k}={v}' for k, v in extra.items()) or '无'
+            self.stdout.write(
+                f"{label:<24}{timings[len(timings) // 2]:>12.2f}{timings[int(len(timings) * 0.95)]:>12.2f}"
+                f"{timings[-1]:>12.2f}{sum(hits) / len(hits):>10.0f}"
+            )
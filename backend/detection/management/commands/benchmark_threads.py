@@ -0,0 +1,158 @@
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.services.model_store import get_active_version
+from detection.services.threading_profile import available_cpus, pin_to_cpus, worker_cpu_set
+
+
+def _powers_of_two(limit):
+    values, n = [], 1
+    while n <= limit:
+        values.append(n)
+        n *= 2
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def _parse_list(value):
+    return [int(v) for v in value.split(',') if v.strip()] if value else None
+
+
+def _run_worker(slot, config, barrier, results):
+    """ 子进程: 按给定线程数加载模型，与其他工作进程同时执行前向推理并记录延迟 """
+    if config['pin']:
+        pin_to_cpus(worker_cpu_set(config['cpus'], config['workers'], slot))
+
+    import torch
+    from detection.ml.checkpoint import load_model
+
+    torch.set_num_threads(config['intra_op_threads'])
+    torch.set_num_interop_threads(config['inter_op_threads'])
+    model = load_model(config['weights'], torch.device('cpu'), mmap=settings.MODEL_WEIGHTS_MMAP)
+    model.eval()
+
+    batch_size, seq_len, input_size = config['batch_size'], config['seq_len'], settings.IMAGE_MODEL_INPUT_SIZE
+    vocab_size = model.text_encoder.config.vocab_size
+    generator = torch.Generator().manual_seed(slot)
+    inputs = {
+        'input_ids': torch.randint(0, vocab_size, (batch_size, seq_len), generator=generator),
+        'attention_mask': torch.ones((batch_size, seq_len), dtype=torch.long),
+        'image': torch.randn((batch_size, 3, input_size, input_size), generator=generator),
+        'image_available': torch.ones(batch_size, dtype=torch.bool),
+    }
+    latencies = []
+    with torch.no_grad():
+        for _ in range(config['warmup']):
+            model(**inputs)
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(config['requests']):
+            step_start = time.perf_counter()
+            model(**inputs)
+            latencies.append(time.perf_counter() - step_start)
+        end = time.perf_counter()
+    results.put({'slot': slot, 'start': start, 'end': end, 'latencies': latencies})
+
+
+class Command(BaseCommand):
+    help = '在本机测量不同 工作进程数 × intra-op 线程数 组合下 MultimodalFakeNewsModel 的吞吐量和延迟，并推荐最佳组合'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', help='模型权重 (默认当前生效版本)')
+        parser.add_argument('--workers', help='要测试的工作进程数，逗号分隔 (默认 1,2,4,... 直到核心数)')
+        parser.add_argument('--threads', help='要测试的 intra-op 线程数，逗号分隔 (默认 1,2,4,... 直到核心数)')
+        parser.add_argument('--inter-op-threads', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=20, help='每个工作进程的推理次数')
+        parser.add_argument('--warmup', type=int, default=2, help='每个工作进程计时前的预热次数')
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--seq-len', type=int, default=settings.MAX_TEXT_LEN)
+        parser.add_argument('--pin', action='store_true', help='把每个工作进程绑定到互不重叠的核心集合')
+        parser.add_argument('--oversubscribe', action='store_true',
+                            help='同时测试 工作进程数 × 线程数 超过核心数的组合')
+        parser.add_argument('--max-p95-ms', type=float, help='推荐时要求的 p95 延迟上限 (毫秒)')
+
+    def handle(self, *args, **options):
+        cpus = available_cpus()
+        weights = options['weights'] or str(get_active_version()[1])
+        worker_counts = _parse_list(options['workers']) or _powers_of_two(len(cpus))
+        thread_counts = _parse_list(options['threads']) or _powers_of_two(len(cpus))
+        combos = [
+            (w, t) for w in worker_counts for t in thread_counts
+            if options['oversubscribe'] or w * t <= len(cpus)
+        ]
+        if not combos:
+            raise CommandError("没有可测试的组合 (可使用 --oversubscribe)")
+
+        self.stdout.write(
+            f"{len(cpus)} 个可用核心, 权重 {weights}, 批大小 {options['batch_size']}, "
+            f"序列长度 {options['seq_len']}, 绑核 {'是' if options['pin'] else '否'}"
+        )
+        self.stdout.write(f"{'进程':>6}{'线程':>6}{'请求/秒':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        rows = []
+        for workers, threads in combos:
+            row = self._measure(workers, threads, cpus, weights, options)
+            rows.append(row)
+            self.stdout.write(
+                f"{workers:>6}{threads:>6}{row['throughput']:>10.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            )
+
+        eligible = [r for r in rows if options['max_p95_ms'] is None or r['p95_ms'] <= options['max_p95_ms']]
+        if not eligible:
+            self.stdout.write(self.style.WARNING(f"没有组合满足 p95 <= {options['max_p95_ms']} ms"))
+            return
+        best = max(eligible, key=lambda r: r['throughput'])
+        self.stdout.write(self.style.SUCCESS(
+            f"推荐: {best['workers']} 个工作进程 × {best['threads']} 个 intra-op 线程 "
+            f"({best['throughput']:.2f} 请求/秒, p95 {best['p95_ms']:.1f} ms)"
+        ))
+        self.stdout.write(f"INFERENCE_WORKERS={best['workers']}")
+        self.stdout.write(f"TORCH_INTRA_OP_THREADS={best['threads']}")
+        self.stdout.write(f"TORCH_INTER_OP_THREADS={options['inter_op_threads']}")
+        if options['pin']:
+            self.stdout.write("PIN_WORKER_CPUS=True")
+
+    def _measure(self, workers, threads, cpus, weights, options):
+        """ 启动 workers 个子进程同时推理，返回吞吐量和延迟分位数 """
+        # fork: 子进程继承已初始化的 Django；父进程从不执行 torch 运算，不会继承已启动的 OpenMP 线程池
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        config = {
+            'workers': workers, 'cpus': cpus, 'pin': options['pin'], 'weights': weights,
+            'intra_op_threads': threads, 'inter_op_threads': options['inter_op_threads'],
+            'requests': options['requests'], 'warmup': options['warmup'],
+            'batch_size': options['batch_size'], 'seq_len': options['seq_len'],
+        }
+        processes = [
+            context.Process(target=_run_worker, args=(slot, config, barrier, results))
+            for slot in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outputs = []
+        while len(outputs) < workers:
+            try:
+                outputs.append(results.get(timeout=1))
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    for process in processes:
+                        process.terminate() # 其余子进程可能正阻塞在 barrier 上
+                    raise CommandError(f"基准测试子进程异常退出 (进程数 {workers}, 线程数 {threads})")
+        for process in processes:
+            process.join()
+
+        latencies = np.concatenate([o['latencies'] for o in outputs]) * 1000
+        elapsed = max(o['end'] for o in outputs) - min(o['start'] for o in outputs)
+        return {
+            'workers': workers,
+            'threads': threads,
+            'throughput': len(latencies) * options['batch_size'] / elapsed,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+        }
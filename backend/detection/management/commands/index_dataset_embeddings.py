@@ -0,0 +1,81 @@
+import csv
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.models import Detection, FeatureEmbedding
+from detection.services.embedding_index import encode_vector
+from detection.services.model_loader import get_registry
+from detection.services.pipeline import get_pipeline
+
+# processed_data.csv 的标签 (见 scripts/preprocess_data.py): 1 为虚假，0 为真实
+LABELS = {'1': Detection.RESULT_FAKE, '0': Detection.RESULT_REAL}
+TEXT_PREVIEW_LENGTH = 255
+
+
+class Command(BaseCommand):
+    help = '用当前生效的模型计算训练数据集条目 (processed_data.csv) 的融合特征，存入 FeatureEmbedding 供相似案例查询'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset-dir', default=settings.DATASET_DIR)
+        parser.add_argument('--limit', type=int, default=0, help='最多处理的条目数，0 表示全部')
+        parser.add_argument('--batch-size', type=int, default=256, help='同时提交给推理流水线并批量写入的条目数')
+        parser.add_argument('--rebuild', action='store_true', help='删除当前模型版本已有的数据集特征后重新计算')
+
+    def handle(self, *args, **options):
+        dataset_dir = Path(options['dataset_dir'])
+        csv_path = dataset_dir / 'processed' / 'processed_data.csv'
+        if not csv_path.is_file():
+            raise CommandError(f"数据文件不存在: {csv_path}")
+
+        registry = get_registry()
+        bundle = registry.snapshot()
+        if bundle['model'] is None:
+            raise CommandError('本地模型未加载')
+        version = bundle['version']
+
+        existing = FeatureEmbedding.objects.filter(source=FeatureEmbedding.SOURCE_DATASET, model_version=version)
+        if options['rebuild']:
+            existing.delete()
+        done = set(existing.values_list('dataset_id', flat=True))
+
+        start = time.perf_counter()
+        created, skipped = 0, len(done)
+        with open(csv_path, newline='', encoding='utf-8-sig') as f:
+            rows = (row for row in csv.DictReader(f) if row.get('id') and row['id'] not in done)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= options['batch_size']:
+                    created += self._embed(bundle, dataset_dir, batch)
+                    batch = []
+                    self.stdout.write(f"已处理 {created} 条 ({time.perf_counter() - start:.0f} 秒)")
+                if options['limit'] and created + len(batch) >= options['limit']:
+                    break
+            created += self._embed(bundle, dataset_dir, batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"模型版本 {version}: 新增 {created} 条数据集特征 (跳过已有 {skipped} 条)，耗时 {time.perf_counter() - start:.1f} 秒"
+        ))
+
+    def _embed(self, bundle, dataset_dir, rows):
+        """ 一批条目同时提交给推理流水线 (由其攒批推理)，结果批量写入 """
+        if not rows:
+            return 0
+        futures = []
+        for row in rows:
+            image_path = dataset_dir / row['image_path'] if row.get('image_path') else None
+            futures.append(get_pipeline().submit(bundle, row.get('text', ''), image_path))
+        embeddings = []
+        for row, future in zip(rows, futures):
+            features = future.result()['features']
+            embeddings.append(FeatureEmbedding(
+                source=FeatureEmbedding.SOURCE_DATASET, dataset_id=row['id'],
+                text=(row.get('text') or '')[:TEXT_PREVIEW_LENGTH],
+                label=LABELS.get(str(row.get('label')).strip(), ''),
+                model_version=bundle['version'], dim=len(features), vector=encode_vector(features),
+            ))
+        FeatureEmbedding.objects.bulk_create(embeddings)
+        return len(embeddings)
@@ -0,0 +1,76 @@
+import csv
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from detection.models import Detection, ImageFingerprint
+from detection.services.image_hash import compute_hashes, to_signed
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+# processed_data.csv 的标签 (见 scripts/preprocess_data.py): 1 为虚假，0 为真实
+LABELS = {'1': Detection.RESULT_FAKE, '0': Detection.RESULT_REAL}
+
+
+class Command(BaseCommand):
+    help = '计算训练数据集图像 (DATASET_DIR/processed/images) 的感知哈希并存入 ImageFingerprint，标注取自 processed_data.csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset-dir', default=settings.DATASET_DIR)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true', help='删除已有的数据集图像指纹后重新计算')
+
+    def handle(self, *args, **options):
+        dataset_dir = Path(options['dataset_dir'])
+        image_dir = dataset_dir / 'processed' / 'images'
+        if not image_dir.is_dir():
+            raise CommandError(f"图像目录不存在: {image_dir}")
+
+        labels = {}
+        csv_path = dataset_dir / 'processed' / 'processed_data.csv'
+        if csv_path.is_file():
+            with open(csv_path, newline='', encoding='utf-8-sig') as f:
+                for row in csv.DictReader(f):
+                    if row.get('image_path'):
+                        labels[Path(row['image_path']).as_posix()] = LABELS.get(str(row.get('label')).strip(), '')
+        else:
+            self.stdout.write(self.style.WARNING(f"未找到 {csv_path}，数据集图像不带标注"))
+
+        datasets = ImageFingerprint.objects.filter(source=ImageFingerprint.SOURCE_DATASET)
+        if options['rebuild']:
+            datasets.delete()
+        existing = set(datasets.values_list('dataset_path', flat=True))
+
+        start = time.perf_counter()
+        created, failed, batch = 0, 0, []
+        for path in sorted(image_dir.iterdir()):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            # 与 processed_data.csv 中的 image_path 相同的相对路径
+            relative = path.relative_to(dataset_dir).as_posix()
+            if relative in existing:
+                continue
+            try:
+                with Image.open(path) as image:
+                    phash_value, dhash_value = compute_hashes(image.convert('RGB'))
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"无法读取 {path}: {e}")
+                continue
+            batch.append(ImageFingerprint(
+                source=ImageFingerprint.SOURCE_DATASET, dataset_path=relative, label=labels.get(relative, ''),
+                phash=to_signed(phash_value), dhash=to_signed(dhash_value),
+            ))
+            if len(batch) >= options['batch_size']:
+                ImageFingerprint.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ImageFingerprint.objects.bulk_create(batch)
+        created += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"新增 {created} 个数据集图像指纹 (跳过已有 {len(existing)} 个，读取失败 {failed} 个)，"
+            f"耗时 {time.perf_counter() - start:.1f} 秒"
+        ))
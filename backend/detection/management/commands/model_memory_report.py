@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from detection.services.memory_report import find_processes_mapping, process_memory_report
+from detection.services.model_store import get_active_version
+
+
+class Command(BaseCommand):
+    help = '报告各工作进程的独占内存与共享内存 (包括模型权重文件的内存映射)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', default=None, help='模型权重文件路径 (默认: 当前生效版本)')
+
+    def handle(self, *args, **options):
+        weights_path = options['weights'] or str(get_active_version()[1])
+        pids = find_processes_mapping(weights_path)
+        if not pids:
+            self.stdout.write(self.style.WARNING(f"没有进程映射了模型权重文件: {weights_path}"))
+            return
+
+        self.stdout.write(f"{'PID':>8} {'RSS(MB)':>10} {'PSS(MB)':>10} {'独占(MB)':>10} {'共享(MB)':>10} {'权重共享(MB)':>14} {'权重独占(MB)':>14}")
+        total_unique = 0.0
+        weights_shared = 0.0
+        for pid in pids:
+            report = process_memory_report(pid, weights_path=weights_path)
+            if 'error' in report:
+                self.stdout.write(self.style.ERROR(f"{pid:>8} {report['error']}"))
+                continue
+            weights = report.get('weights') or {}
+            total_unique += report['unique_mb']
+            weights_shared = max(weights_shared, weights.get('shared_mb', 0.0))
+            self.stdout.write(
+                f"{pid:>8} {report['rss_mb']:>10} {report['pss_mb']:>10} {report['unique_mb']:>10} "
+                f"{report['shared_mb']:>10} {weights.get('shared_mb', 0.0):>14} {weights.get('unique_mb', 0.0):>14}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(pids)} 个进程: 独占内存合计 {total_unique:.1f} MB, 共享的模型权重 {weights_shared:.1f} MB"
+        ))
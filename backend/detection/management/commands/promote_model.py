@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.services.model_store import ModelStoreError, list_versions, promote_version
+
+
+class Command(BaseCommand):
+    help = '切换生效的模型版本 (不带参数时列出已发布的版本)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help='要生效的版本号')
+
+    def handle(self, *args, **options):
+        version = options['version']
+        if not version:
+            versions = list_versions()
+            if not versions:
+                self.stdout.write(self.style.WARNING("尚未发布任何模型版本"))
+            for item in versions:
+                marker = '*' if item['active'] else ' '
+                self.stdout.write(f"{marker} {item['version']:<24} {item['size_mb']:>8} MB  {item['published_at']}")
+            return
+
+        try:
+            promote_version(version)
+        except ModelStoreError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"已切换生效模型版本: {version}，各工作进程将在后台加载"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.services.model_store import ModelStoreError, publish_version, promote_version
+
+
+class Command(BaseCommand):
+    help = '把训练好的模型 checkpoint 发布为新的模型版本 (可选立即生效)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('checkpoint', help='模型权重文件路径 (同名 .json 架构配置会一并发布)')
+        parser.add_argument('--name', dest='model_version', default=None, help='版本号 (默认: 当前时间 YYYYmmdd-HHMMSS)')
+        parser.add_argument('--promote', action='store_true', help='发布后立即切换为生效版本')
+
+    def handle(self, *args, **options):
+        try:
+            version = publish_version(options['checkpoint'], options['model_version'])
+            self.stdout.write(self.style.SUCCESS(f"已发布模型版本: {version}"))
+            if options['promote']:
+                promote_version(version)
+                self.stdout.write(self.style.SUCCESS(f"已切换生效模型版本: {version}，各工作进程将在后台加载"))
+        except ModelStoreError as e:
+            raise CommandError(str(e))
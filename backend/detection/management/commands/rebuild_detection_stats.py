@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from detection.models import DetectionDailyStats
+from detection.services.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = '从检测记录重建每日检测统计汇总表 (修正绕过 Detection.save() 的批量更新造成的偏差)'
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_stats()
+        days = DetectionDailyStats.objects.filter(scope=DetectionDailyStats.GLOBAL_SCOPE).count()
+        self.stdout.write(self.style.SUCCESS(f"已重建每日检测统计: {rows} 行 (覆盖 {days} 天)"))
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '汇总影子推理日志，对比主模型与候选模型在线上输入上的预测'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SHADOW_LOG_PATH, help='影子推理日志 (JSONL)')
+        parser.add_argument('--shadow-version', default=None, help='只统计指定的候选版本')
+        parser.add_argument('--threshold', type=float, default=0.5, help='判定为虚假新闻的概率阈值')
+
+    def handle(self, *args, **options):
+        log_path = Path(options['log'])
+        if not log_path.is_file():
+            self.stdout.write(self.style.WARNING(f"影子推理日志不存在: {log_path}"))
+            return
+
+        groups = {}
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if options['shadow_version'] and record['shadow_version'] != options['shadow_version']:
+                    continue
+                key = (record['primary_version'], record['shadow_version'])
+                groups.setdefault(key, []).append(record)
+
+        if not groups:
+            self.stdout.write(self.style.WARNING("没有匹配的影子推理记录"))
+            return
+
+        threshold = options['threshold']
+        for (primary_version, shadow_version), records in groups.items():
+            primary = np.array([r['primary_probability'] for r in records])
+            shadow = np.array([r['shadow_probability'] for r in records])
+            diff = np.abs(primary - shadow)
+            agreement = np.mean((primary >= threshold) == (shadow >= threshold))
+            latency = np.array([r['shadow_latency_ms'] for r in records])
+
+            self.stdout.write(self.style.SUCCESS(f"主模型 {primary_version} vs 候选模型 {shadow_version}: {len(records)} 条"))
+            self.stdout.write(f"  判定一致率:        {agreement:.4f}")
+            self.stdout.write(f"  虚假判定比例:      主模型 {np.mean(primary >= threshold):.4f} / 候选模型 {np.mean(shadow >= threshold):.4f}")
+            self.stdout.write(f"  概率差 |Δp|:       平均 {diff.mean():.4f}, P95 {np.percentile(diff, 95):.4f}, 最大 {diff.max():.4f}")
+            self.stdout.write(f"  候选模型耗时 (ms): 平均 {latency.mean():.1f}, P95 {np.percentile(latency, 95):.1f}")
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.9 on 2026-10-19 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """ 用已结束的检测回填汇总表 (与 detection.services.stats.rebuild_daily_stats 相同) """
+    Detection = apps.get_model('detection', 'Detection')
+    DetectionDailyStats = apps.get_model('detection', 'DetectionDailyStats')
+    rows = (
+        Detection.objects.filter(status__in=('completed', 'failed'))
+        .values_list('user_id', 'created_at', 'status', 'result', 'confidence_score')
+        .order_by()
+    )
+    rollups = {}
+    for detection_user_id, created_at, status, result, confidence in rows.iterator(chunk_size=2000):
+        # 本地日期在 Python 中计算，不依赖数据库的时区转换 (MySQL 未加载时区表时 CONVERT_TZ 返回 NULL)
+        day = timezone.localdate(created_at)
+        for user_id in (None, detection_user_id):
+            scope = 'global' if user_id is None else f'user:{user_id}'
+            rollup = rollups.setdefault((scope, day), DetectionDailyStats(scope=scope, user_id=user_id, day=day))
+            if status == 'completed':
+                rollup.completed_count += 1
+                rollup.confidence_sum += confidence or 0.0
+            else:
+                rollup.failed_count += 1
+            if result == 'fake':
+                rollup.fake_count += 1
+            elif result == 'real':
+                rollup.real_count += 1
+    DetectionDailyStats.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('detection', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32, verbose_name='统计范围')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('completed_count', models.IntegerField(default=0, verbose_name='完成数')),
+                ('failed_count', models.IntegerField(default=0, verbose_name='失败数')),
+                ('fake_count', models.IntegerField(default=0, verbose_name='虚假数')),
+                ('real_count', models.IntegerField(default=0, verbose_name='真实数')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='置信度之和')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='detection_daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '每日检测统计',
+                'verbose_name_plural': '每日检测统计',
+                'ordering': ['scope', 'day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='detectiondailystats',
+            constraint=models.UniqueConstraint(fields=('scope', 'day'), name='unique_detection_daily_stats'),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
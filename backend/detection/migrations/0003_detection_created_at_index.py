@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0002_detectiondailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detection',
+            index=models.Index(fields=['created_at'], name='detection_d_created_a408cd_idx'),
+        ),
+    ]
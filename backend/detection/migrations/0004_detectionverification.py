@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-19 00:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0003_detection_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionVerification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('text', '文本'), ('image', '图像')], max_length=10, verbose_name='验证类型')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='序号')),
+                ('model', models.CharField(max_length=100, verbose_name='模型')),
+                ('success', models.BooleanField(default=False, verbose_name='调用成功')),
+                ('verdict', models.CharField(blank=True, default='', max_length=100, verbose_name='判断')),
+                ('confidence', models.FloatField(default=0.0, verbose_name='置信度')),
+                ('reason', models.TextField(blank=True, null=True, verbose_name='理由')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('raw_response', models.TextField(blank=True, null=True, verbose_name='原始响应')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('detection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='verifications', to='detection.detection', verbose_name='检测记录')),
+            ],
+            options={
+                'verbose_name': 'LLM 验证记录',
+                'verbose_name_plural': 'LLM 验证记录',
+                'ordering': ['detection', 'position'],
+            },
+        ),
+    ]
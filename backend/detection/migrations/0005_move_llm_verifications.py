@@ -0,0 +1,118 @@
+# 把 analysis_result 中逐模型的 LLM 验证结果迁移到 DetectionVerification
+
+from django.db import migrations, transaction
+
+# 每批处理的检测记录数，每批单独提交
+BATCH_SIZE = 500
+DETAIL_KEYS = {'text': 'text_verifications', 'image': 'image_verifications'}
+
+
+def llm_details(analysis):
+    if not isinstance(analysis, dict):
+        return None
+    llm_verification = analysis.get('llm_verification')
+    if not isinstance(llm_verification, dict):
+        return None
+    details = llm_verification.get('details')
+    return details if isinstance(details, dict) else None
+
+
+def batches(Detection):
+    """ 按主键分批读取检测记录，只加载 analysis_result """
+    last_pk = 0
+    while True:
+        batch = list(Detection.objects.filter(pk__gt=last_pk).order_by('pk').only('id', 'analysis_result')[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        yield batch
+
+
+def move_verifications(apps, schema_editor):
+    """ 与 DetectionVerification.split_details 相同 """
+    Detection = apps.get_model('detection', 'Detection')
+    DetectionVerification = apps.get_model('detection', 'DetectionVerification')
+    for batch in batches(Detection):
+        changed, records = [], []
+        for detection in batch:
+            details = llm_details(detection.analysis_result)
+            if details is None or not any(key in details for key in DETAIL_KEYS.values()):
+                continue
+            counts = {}
+            position = 0
+            for kind, key in DETAIL_KEYS.items():
+                results = details.pop(key, None) or []
+                counts[kind] = len(results)
+                for result in results:
+                    try:
+                        confidence = float(result.get('confidence') or 0.0)
+                    except (TypeError, ValueError):
+                        confidence = 0.0
+                    records.append(DetectionVerification(
+                        detection_id=detection.pk,
+                        kind=kind,
+                        position=position,
+                        model=str(result.get('model', ''))[:100],
+                        success=bool(result.get('success')),
+                        verdict=str(result.get('verdict') or '')[:100],
+                        confidence=confidence,
+                        reason=result.get('reason'),
+                        error=result.get('error'),
+                        raw_response=result.get('raw_response'),
+                    ))
+                    position += 1
+            details['verification_counts'] = counts
+            changed.append(detection)
+        if changed:
+            with transaction.atomic():
+                # 回滚后重新迁移时先清除残留的记录
+                DetectionVerification.objects.filter(detection__in=changed).delete()
+                DetectionVerification.objects.bulk_create(records)
+                Detection.objects.bulk_update(changed, ['analysis_result'])
+
+
+def restore_verifications(apps, schema_editor):
+    """ 把逐模型结果写回 analysis_result """
+    Detection = apps.get_model('detection', 'Detection')
+    DetectionVerification = apps.get_model('detection', 'DetectionVerification')
+    for batch in batches(Detection):
+        records = {}
+        for record in DetectionVerification.objects.filter(detection__in=batch).order_by('detection_id', 'position'):
+            records.setdefault(record.detection_id, []).append(record)
+        changed = []
+        for detection in batch:
+            details = llm_details(detection.analysis_result)
+            if details is None or 'verification_counts' not in details:
+                continue
+            details.pop('verification_counts')
+            for kind, key in DETAIL_KEYS.items():
+                details[key] = [
+                    {
+                        'model': record.model,
+                        'success': record.success,
+                        'verdict': record.verdict,
+                        'confidence': record.confidence,
+                        'reason': record.reason,
+                        'error': record.error,
+                        'raw_response': record.raw_response,
+                    }
+                    for record in records.get(detection.pk, []) if record.kind == kind
+                ]
+            changed.append(detection)
+        if changed:
+            with transaction.atomic():
+                Detection.objects.bulk_update(changed, ['analysis_result'])
+                DetectionVerification.objects.filter(detection__in=changed).delete()
+
+
+class Migration(migrations.Migration):
+    # 分批提交，大表迁移中断后已处理的批次不会回滚，重新执行时跳过
+    atomic = False
+
+    dependencies = [
+        ('detection', '0004_detectionverification'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_verifications, restore_verifications),
+    ]
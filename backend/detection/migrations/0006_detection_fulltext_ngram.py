@@ -0,0 +1,31 @@
+# MySQL: 标题和正文的 ngram FULLTEXT 索引 (中文全文检索，见 detection/services/search.py)
+# 其他数据库不建索引，检索使用进程内的倒排索引
+
+from django.db import migrations
+
+INDEX_NAME = 'detection_title_content_ngram'
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    table = schema_editor.quote_name(apps.get_model('detection', 'Detection')._meta.db_table)
+    schema_editor.execute(f'ALTER TABLE {table} ADD FULLTEXT INDEX {INDEX_NAME} (title, content) WITH PARSER ngram')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    table = schema_editor.quote_name(apps.get_model('detection', 'Detection')._meta.db_table)
+    schema_editor.execute(f'ALTER TABLE {table} DROP INDEX {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_move_llm_verifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-19 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_detection_fulltext_ngram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('detection', '检测记录'), ('dataset', '训练数据集')], max_length=20, verbose_name='来源')),
+                ('dataset_path', models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='数据集图像路径')),
+                ('label', models.CharField(blank=True, choices=[('fake', '虚假'), ('real', '真实'), ('unknown', '未知')], default='', max_length=20, verbose_name='标注')),
+                ('phash', models.BigIntegerField(verbose_name='感知哈希')),
+                ('dhash', models.BigIntegerField(verbose_name='差异哈希')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('detection', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='image_fingerprint', to='detection.detection', verbose_name='检测记录')),
+            ],
+            options={
+                'verbose_name': '图像指纹',
+                'verbose_name_plural': '图像指纹',
+            },
+        ),
+    ]
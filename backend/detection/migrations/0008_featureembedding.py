@@ -0,0 +1,42 @@
+# Generated by Django 4.2.9 on 2026-10-19 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_imagefingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('detection', '检测记录'), ('dataset', '训练数据集')], max_length=20, verbose_name='来源')),
+                ('dataset_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='数据集条目')),
+                ('text', models.CharField(blank=True, default='', max_length=255, verbose_name='文本摘要')),
+                ('label', models.CharField(blank=True, choices=[('fake', '虚假'), ('real', '真实'), ('unknown', '未知')], default='', max_length=20, verbose_name='标注')),
+                ('model_version', models.CharField(max_length=100, verbose_name='模型版本')),
+                ('dim', models.PositiveSmallIntegerField(verbose_name='维度')),
+                ('vector', models.BinaryField(verbose_name='特征向量')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('detection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='detection.detection', verbose_name='检测记录')),
+            ],
+            options={
+                'verbose_name': '融合特征',
+                'verbose_name_plural': '融合特征',
+                'indexes': [models.Index(fields=['model_version', 'id'], name='detection_f_model_v_914f9b_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='featureembedding',
+            constraint=models.UniqueConstraint(fields=('detection', 'model_version'), name='unique_detection_embedding'),
+        ),
+        migrations.AddConstraint(
+            model_name='featureembedding',
+            constraint=models.UniqueConstraint(fields=('dataset_id', 'model_version'), name='unique_dataset_embedding'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# backend/detection/ml/backbones.py
+
+import logging
+
+import torch.nn as nn
+from torchvision.models import (
+    resnet50, ResNet50_Weights,
+    mobilenet_v3_small, MobileNet_V3_Small_Weights,
+    mobilenet_v3_large, MobileNet_V3_Large_Weights,
+    efficientnet_b0, EfficientNet_B0_Weights,
+)
+from transformers import AutoConfig, AutoModel
+
+logger = logging.getLogger(__name__)
+
+# --- Image Backbones (keep in sync with scripts/backbones.py) ---
+# 'head' is the classifier attribute replaced by nn.Identity; the embedding dim is
+# inferred from the first Linear layer inside it. 'weights' only provides the eval
+# transforms here, all encoder weights come from our own checkpoint.
+IMAGE_BACKBONES = {
+    'resnet50': {'builder': resnet50, 'weights': ResNet50_Weights.IMAGENET1K_V2, 'head': 'fc'},
+    'efficientnet_b0': {'builder': efficientnet_b0, 'weights': EfficientNet_B0_Weights.IMAGENET1K_V1, 'head': 'classifier'},
+    'mobilenet_v3_large': {'builder': mobilenet_v3_large, 'weights': MobileNet_V3_Large_Weights.IMAGENET1K_V2, 'head': 'classifier'},
+    'mobilenet_v3_small': {'builder': mobilenet_v3_small, 'weights': MobileNet_V3_Small_Weights.IMAGENET1K_V1, 'head': 'classifier'},
+}
+
+
+def _replace_head(encoder, head_attr):
+    """ Replaces the classifier head with nn.Identity and returns the feature dim it consumed. """
+    head = getattr(encoder, head_attr)
+    linear = head if isinstance(head, nn.Linear) else next(m for m in head.modules() if isinstance(m, nn.Linear))
+    setattr(encoder, head_attr, nn.Identity())
+    return linear.in_features
+
+
+def build_image_encoder(name):
+    """ Returns (encoder without classifier, embedding dim). Weights are left uninitialized for the checkpoint. """
+    if name not in IMAGE_BACKBONES:
+        raise ValueError(f"Image model '{name}' not currently supported for inference setup. Available: {', '.join(IMAGE_BACKBONES)}")
+    spec = IMAGE_BACKBONES[name]
+    encoder = spec['builder'](weights=None)
+    return encoder, _replace_head(encoder, spec['head'])
+
+
+def build_text_encoder(name, pretrained=True):
+    """
+    Returns (HuggingFace encoder, hidden size).
+    pretrained=False only builds the architecture from the config; use it when all
+    text_encoder weights come from our own checkpoint anyway.
+    """
+    if pretrained:
+        encoder = AutoModel.from_pretrained(name)
+    else:
+        encoder = AutoModel.from_config(AutoConfig.from_pretrained(name))
+    return encoder, encoder.config.hidden_size
+
+
+def image_eval_transforms(name):
+    """ Standard eval transforms of the backbone's ImageNet weights, or None for unknown names """
+    spec = IMAGE_BACKBONES.get(name)
+    return spec['weights'].transforms() if spec else None
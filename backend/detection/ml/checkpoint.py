@@ -0,0 +1,188 @@
+# backend/detection/ml/checkpoint.py
+
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from safetensors import safe_open
+from safetensors.torch import load_file
+
+from django.conf import settings
+
+from .model import MultimodalFakeNewsModel
+from .quantization import check_quantization, quantize_model
+
+logger = logging.getLogger(__name__)
+
+# Checkpoints converted by scripts/convert_checkpoint.py (model.safetensors), see load_safetensors_model
+SAFETENSORS_SUFFIX = '.safetensors'
+
+# Keys of the checkpoint sidecar that map onto MultimodalFakeNewsModel arguments
+MODEL_CONFIG_KEYS = (
+    'text_model_name', 'image_model_name',
+    'text_embedding_dim', 'img_embedding_dim', 'fusion_output_dim',
+    'structure',
+)
+
+
+def read_model_config(model_path):
+    """
+    Reads the architecture sidecar written next to a checkpoint (model.pth -> model.json).
+    Returns {} when there is none, i.e. the checkpoint matches the settings defaults.
+    """
+    config_path = Path(model_path).with_suffix('.json')
+    if not config_path.is_file():
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    max_text_len = config.get('max_text_len')
+    if max_text_len and max_text_len != settings.MAX_TEXT_LEN:
+        logger.warning(f"Checkpoint was trained with max_text_len={max_text_len}, but MAX_TEXT_LEN={settings.MAX_TEXT_LEN}.")
+    logger.info(f"Using model config from {config_path}: {config}")
+    return config
+
+
+def model_kwargs(config):
+    """ Constructor arguments for MultimodalFakeNewsModel taken from a sidecar config """
+    return {key: config[key] for key in MODEL_CONFIG_KEYS if key in config}
+
+
+# Serialises init_empty_parameters: warmup, hot swaps and the shadow loader build models from
+# different threads, and the patch of nn.Module.register_parameter is process-wide
+_empty_init_lock = threading.RLock()
+_empty_init_state = threading.local()
+
+
+@contextmanager
+def init_empty_parameters():
+    """
+    Create module parameters on the meta device (no memory, no random init).
+    Buffers are still created normally, so non-persistent buffers that are not
+    part of the checkpoint (e.g. BERT position_ids) keep their real values.
+    Only modules built by the calling thread inside the block are affected; models
+    built concurrently by other threads get real parameters.
+    """
+    with _empty_init_lock:
+        original_register_parameter = nn.Module.register_parameter
+
+        def register_empty_parameter(module, name, param):
+            original_register_parameter(module, name, param)
+            if param is not None and getattr(_empty_init_state, 'active', False):
+                module._parameters[name] = nn.Parameter(param.to('meta'), requires_grad=param.requires_grad)
+
+        nn.Module.register_parameter = register_empty_parameter
+        active = getattr(_empty_init_state, 'active', False)
+        _empty_init_state.active = True
+        try:
+            yield
+        finally:
+            _empty_init_state.active = active
+            nn.Module.register_parameter = original_register_parameter
+
+
+def load_model(model_path, device, mmap=False):
+    """
+    Builds MultimodalFakeNewsModel and loads the checkpoint at model_path.
+
+    With mmap=True the checkpoint is memory-mapped read-only (copy-on-write) and the
+    model parameters point straight into the mapping, so every worker process that
+    loads the same file shares the same physical pages through the page cache.
+    The text backbone is built from its config only; its weights come from the
+    checkpoint, so the HuggingFace weight files are never read.
+    INT8 checkpoints (sidecar 'quantization', see quantization.py) are rebuilt as
+    quantized modules first; their packed weights cannot be memory-mapped.
+    .safetensors checkpoints are validated against their sidecar before any weights
+    are allocated (see load_safetensors_model).
+    """
+    config = read_model_config(model_path)
+    kwargs = model_kwargs(config)
+    if Path(model_path).suffix == SAFETENSORS_SUFFIX:
+        return load_safetensors_model(model_path, config, device, mmap=mmap)
+    quantization = config.get('quantization')
+    if quantization:
+        check_quantization(quantization, device)
+        model = MultimodalFakeNewsModel(pretrained_text_encoder=False, **kwargs)
+        quantize_model(model, quantization['modules'])
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        logger.info(f"Loaded INT8 ({quantization['mode']}) model from {model_path}")
+        return model
+    if mmap and device.type != 'cpu':
+        logger.warning(f"Memory-mapped weights are only supported on CPU, loading normally on {device}.")
+        mmap = False
+
+    if not mmap:
+        model = MultimodalFakeNewsModel(**kwargs) # Initialize model structure
+        # Load state dict, ensuring map_location handles CPU/GPU
+        model.load_state_dict(torch.load(model_path, map_location=device))
+        return model
+
+    with init_empty_parameters():
+        model = MultimodalFakeNewsModel(pretrained_text_encoder=False, **kwargs)
+    state_dict = torch.load(model_path, map_location='cpu', mmap=True, weights_only=True)
+    # assign=True keeps the mmap-backed tensors instead of copying them into new storage
+    model.load_state_dict(state_dict, assign=True)
+    logger.info(f"Memory-mapped model weights from {model_path}")
+    return model
+
+
+def read_safetensors_header(model_path):
+    """ {name: shape} of a safetensors file, read from its header only """
+    with safe_open(str(model_path), framework='pt') as f:
+        return {name: list(f.get_slice(name).get_shape()) for name in f.keys()}
+
+
+def validate_architecture(model, shapes, manifest=None):
+    """
+    Compares the parameter shapes of a (meta-device) model with a safetensors header
+    and the sidecar's tensor manifest. Raises ValueError listing the differences.
+    """
+    if manifest and manifest.get('tensors') != shapes:
+        raise ValueError("Checkpoint tensors do not match the 'weights' manifest of its sidecar "
+                         "(file replaced or truncated?).")
+    expected = {name: list(tensor.shape) for name, tensor in model.state_dict().items()}
+    problems = [f"missing {name}" for name in expected if name not in shapes]
+    problems += [f"unexpected {name}" for name in shapes if name not in expected]
+    problems += [
+        f"{name}: checkpoint {shapes[name]} vs model {shape}"
+        for name, shape in expected.items() if name in shapes and shapes[name] != shape
+    ]
+    if problems:
+        raise ValueError(f"Checkpoint does not match the sidecar architecture ({len(problems)} problems): "
+                         + '; '.join(problems[:5]))
+
+
+def load_safetensors_model(model_path, config, device, mmap=False):
+    """
+    Loads a safetensors checkpoint written by scripts/convert_checkpoint.py.
+
+    The model is first built on the meta device from the sidecar and checked against
+    the file header (and the sidecar's tensor manifest), so a checkpoint that does not
+    fit its sidecar fails before any memory is allocated. fp32 weights are then
+    memory-mapped (shared between workers like the .pth mmap path); fp16-at-rest
+    weights are upcast to fp32, which needs private memory for the fp32 copy.
+    """
+    if config.get('quantization'):
+        raise ValueError("INT8 checkpoints are stored as .pth, not safetensors.")
+    manifest = config.get('weights', {})
+    with init_empty_parameters():
+        model = MultimodalFakeNewsModel(pretrained_text_encoder=False, **model_kwargs(config))
+    validate_architecture(model, read_safetensors_header(model_path), manifest)
+
+    # load_file maps the file read-only, its tensors are views into the page cache.
+    # Without mmap (or off CPU) every tensor is copied; fp16 tensors are upcast either way.
+    copy = not mmap or device.type != 'cpu'
+    state_dict = load_file(str(model_path))
+    upcast = [name for name, tensor in state_dict.items() if tensor.dtype == torch.float16]
+    state_dict = {
+        name: tensor.to(device, dtype=torch.float32 if name in upcast else tensor.dtype, copy=copy)
+        for name, tensor in state_dict.items()
+    }
+    model.load_state_dict(state_dict, assign=True)
+    storage = manifest.get('storage_dtype', 'float16' if upcast else 'float32')
+    logger.info(f"Loaded safetensors model from {model_path} "
+                f"({len(state_dict)} tensors, stored as {storage}, {len(upcast)} upcast to fp32)")
+    return model
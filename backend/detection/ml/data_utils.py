@@ -3,11 +3,13 @@
 import torch
 from transformers import AutoTokenizer
 from torchvision import transforms
-from torchvision.models import ResNet50_Weights
-from PIL import Image
+from PIL import Image, ImageOps
 import logging
+from pathlib import Path
 from django.conf import settings # Import settings
 
+from .backbones import image_eval_transforms
+
 logger = logging.getLogger(__name__)
 
 # --- Tokenizer Function (Copied from data_loader.py) ---
@@ -24,50 +26,34 @@ def get_tokenizer(model_name=settings.TEXT_MODEL_NAME):
 # --- Image Transform Function (Adapted from data_loader.py) ---
 def get_image_transforms(model_name=settings.IMAGE_MODEL_NAME, input_size=settings.IMAGE_MODEL_INPUT_SIZE):
     """ Returns appropriate image transforms for evaluation. """
-    if model_name == 'resnet50':
-        # Use standard weights for ResNet50 V2 for transforms
-        try:
-            weights = ResNet50_Weights.IMAGENET1K_V2
-            transform = weights.transforms()
-            logger.info(f"Using standard ResNet50 V2 transforms (input size {input_size})")
-            # Ensure the resize matches the expected input size if different from standard
-            if input_size != 224: # Standard ResNet input is 224
-                # Overwrite the resize/center crop part if needed
-                transform = transforms.Compose([
-                    transforms.Resize(input_size + 32), # Standard practice: resize slightly larger
-                    transforms.CenterCrop(input_size),
-                    transforms.ToTensor(),
-                    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-                ])
-                logger.warning(f"Overriding standard ResNet transforms for input size {input_size}")
-            return transform
-        except Exception as e:
-             logger.error(f"Failed to get ResNet50 V2 weights/transforms: {e}. Falling back to basic transforms.")
-             # Fallback if weights unavailable
-             return transforms.Compose([
-                transforms.Resize((input_size, input_size)),
+    transform = image_eval_transforms(model_name)
+    if transform is not None:
+        # Use the standard eval transforms of the backbone's ImageNet weights
+        logger.info(f"Using standard {model_name} transforms (input size {input_size})")
+        # Ensure the resize matches the expected input size if different from standard
+        if list(transform.crop_size) != [input_size]:
+            # Overwrite the resize/center crop part if needed
+            transform = transforms.Compose([
+                transforms.Resize(input_size + 32), # Standard practice: resize slightly larger
+                transforms.CenterCrop(input_size),
                 transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+                transforms.Normalize(mean=transform.mean, std=transform.std),
             ])
+            logger.warning(f"Overriding standard {model_name} transforms for input size {input_size}")
+        return transform
 
-    else:
-        # Basic transforms for other/unknown models
-        logger.warning(f"Using basic image transforms for model {model_name}")
-        return transforms.Compose([
-            transforms.Resize((input_size, input_size)),
-            transforms.ToTensor(),
-            # Standard ImageNet normalization, adjust if your model used different ones
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+    # Basic transforms for other/unknown models
+    logger.warning(f"Using basic image transforms for model {model_name}")
+    return transforms.Compose([
+        transforms.Resize((input_size, input_size)),
+        transforms.ToTensor(),
+        # Standard ImageNet normalization, adjust if your model used different ones
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
 
-# --- Preprocessing Function for Single Item (Metadata Excluded) --- #
-def preprocess_input(text, image_path, tokenizer, image_transform, device):
-    """
-    Preprocesses text and image for a single detection item.
-    Handles missing image.
-    Returns a dictionary suitable for the text-image model input.
-    """
-    # 1. Text Processing
+# --- Preprocessing Functions for Single Item (Metadata Excluded) --- #
+def preprocess_text(text, tokenizer, device):
+    """ Tokenizes text into (input_ids, attention_mask), each with a batch dim of 1. """
     encoding = tokenizer(text,
                          add_special_tokens=True,
                          max_length=settings.MAX_TEXT_LEN,
@@ -78,17 +64,37 @@ def preprocess_input(text, image_path, tokenizer, image_transform, device):
 
     input_ids = encoding['input_ids'].flatten().unsqueeze(0).to(device) # Add batch dim
     attention_mask = encoding['attention_mask'].flatten().unsqueeze(0).to(device) # Add batch dim
+    return input_ids, attention_mask
 
-    # 2. Image Processing
+def preprocess_image(image_path, image_transform, device):
+    """
+    Decodes and transforms the image into (image_tensor, image_available).
+    A missing or unreadable image gives a zero tensor with image_available=False.
+    """
     image_tensor = torch.zeros((1, 3, settings.IMAGE_MODEL_INPUT_SIZE, settings.IMAGE_MODEL_INPUT_SIZE)).to(device)
     image_available = torch.tensor([False]).to(device)
-    if image_path and image_path.is_file():
+    if image_path and Path(image_path).is_file():
         try:
-            image = Image.open(image_path).convert('RGB')
+            with Image.open(image_path) as image:
+                # Apply the EXIF orientation, as ImageArtifact does for uploads
+                image = ImageOps.exif_transpose(image).convert('RGB')
             image_tensor = image_transform(image).unsqueeze(0).to(device) # Add batch dim
             image_available = torch.tensor([True]).to(device)
         except Exception as e:
             logger.warning(f"Could not process image {image_path}: {e}. Skipping image.")
+    return image_tensor, image_available
+
+def preprocess_input(text, image_path, tokenizer, image_transform, device):
+    """
+    Preprocesses text and image for a single detection item.
+    Handles missing image.
+    Returns a dictionary suitable for the text-image model input.
+    """
+    # 1. Text Processing
+    input_ids, attention_mask = preprocess_text(text, tokenizer, device)
+
+    # 2. Image Processing
+    image_tensor, image_available = preprocess_image(image_path, image_transform, device)
 
     # 3. 移除 Metadata Processing
     # metadata_features = torch.zeros(...) 
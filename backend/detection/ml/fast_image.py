@@ -0,0 +1,94 @@
+# backend/detection/ml/fast_image.py
+
+import math
+import logging
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+from torchvision.transforms.functional import InterpolationMode, pil_modes_mapping
+
+from .backbones import image_eval_transforms
+
+logger = logging.getLogger(__name__)
+
+# --- Fast Image Preprocessing ---
+# Same steps as torchvision's ImageClassification eval preset (resize shorter side,
+# center crop, scale to [0, 1], normalise), but:
+# - JPEGs are decoded with PIL draft mode, i.e. DCT-domain downscaling straight to
+#   the smallest size that is still >= the resize target, instead of full resolution
+# - each image stays uint8 (H, W, 3) until the whole batch is assembled
+# - the batch is converted to float once and normalised with one in-place affine op
+
+class FastImagePreprocessor:
+    """ uint8 image loader + batched normaliser matching a backbone's eval transforms """
+
+    def __init__(self, resize_size, crop_size, mean, std, interpolation=InterpolationMode.BILINEAR, use_draft=True):
+        self.resize_size = resize_size
+        self.resample = pil_modes_mapping[interpolation]
+        self.crop_size = crop_size
+        self.use_draft = use_draft
+        std = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        mean = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+        # (x / 255 - mean) / std == x * scale - shift
+        self._scale = 1.0 / (255.0 * std)
+        self._shift = mean / std
+
+    @classmethod
+    def for_backbone(cls, model_name, input_size, use_draft=True):
+        """ Builds the preprocessor from the backbone's standard eval transforms (None if unknown). """
+        preset = image_eval_transforms(model_name)
+        if preset is None:
+            return None
+        resize_size, crop_size = preset.resize_size[0], preset.crop_size[0]
+        interpolation = preset.interpolation
+        if crop_size != input_size:
+            # Same override as get_image_transforms
+            resize_size, crop_size = input_size + 32, input_size
+            interpolation = InterpolationMode.BILINEAR
+        return cls(resize_size, crop_size, preset.mean, preset.std,
+                   interpolation=interpolation, use_draft=use_draft)
+
+    def _resized_size(self, width, height):
+        """ Output size of torchvision Resize(int): shorter side -> resize_size """
+        if width <= height:
+            return self.resize_size, int(self.resize_size * height / width)
+        return int(self.resize_size * width / height), self.resize_size
+
+    def load(self, image_path):
+        """ Decodes, resizes and center-crops one image, returns a uint8 (crop, crop, 3) array """
+        with Image.open(image_path) as image:
+            if self.use_draft and image.format == 'JPEG':
+                scale = self.resize_size / min(image.size)
+                if scale < 1:
+                    # The decoder picks the largest 1/2, 1/4 or 1/8 reduction that stays >= this size
+                    image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+            # Apply the EXIF orientation (after draft, which only works before decoding), as ImageArtifact does
+            image = ImageOps.exif_transpose(image).convert('RGB')
+        return self.from_image(image)
+
+    def from_image(self, image):
+        """ Resizes and center-crops an already decoded RGB image, returns a uint8 (crop, crop, 3) array """
+        image = image.resize(self._resized_size(*image.size), self.resample)
+        # torchvision center_crop offsets
+        left = int(round((image.width - self.crop_size) / 2.0))
+        top = int(round((image.height - self.crop_size) / 2.0))
+        image = image.crop((left, top, left + self.crop_size, top + self.crop_size))
+        return np.asarray(image, dtype=np.uint8)
+
+    def to_batch(self, pixels, device):
+        """
+        Stacks uint8 arrays (None = no image) into a normalised float batch.
+        Returns (images (N, 3, crop, crop), image_available (N,)); the images tensor
+        has channels_last strides, which convolutions consume directly.
+        """
+        available = [p is not None for p in pixels]
+        batch = np.zeros((len(pixels), self.crop_size, self.crop_size, 3), dtype=np.uint8)
+        for i, p in enumerate(pixels):
+            if p is not None:
+                batch[i] = p
+        images = torch.from_numpy(batch).to(device).permute(0, 3, 1, 2).float()
+        images.mul_(self._scale.to(device)).sub_(self._shift.to(device))
+        image_available = torch.tensor(available, device=device)
+        images[~image_available] = 0 # match the zero tensor used for missing images
+        return images, image_available
@@ -2,11 +2,12 @@
 
 import torch
 import torch.nn as nn
-from torchvision.models import resnet50, ResNet50_Weights
-from transformers import AutoModel
 import logging
 from django.conf import settings # Import settings
 
+from .backbones import build_image_encoder, build_text_encoder
+from .pruning import apply_structure
+
 logger = logging.getLogger(__name__)
 
 # --- Model Definitions (Modified to exclude metadata) ---
@@ -18,32 +19,38 @@ class MultimodalFakeNewsModel(nn.Module):
     """
     def __init__(self, text_model_name=settings.TEXT_MODEL_NAME,
                  image_model_name=settings.IMAGE_MODEL_NAME,
-                 text_embedding_dim=settings.TEXT_EMBEDDING_DIM,
-                 img_embedding_dim=settings.IMG_EMBEDDING_DIM,
-                 fusion_output_dim=settings.FUSION_OUTPUT_DIM):
+                 text_embedding_dim=None,
+                 img_embedding_dim=None,
+                 fusion_output_dim=settings.FUSION_OUTPUT_DIM,
+                 pretrained_text_encoder=True,
+                 structure=None):
         super().__init__()
         logger.info("Initializing Text-Image Multimodal Model for Inference...")
+        self.text_model_name = text_model_name
+        self.image_model_name = image_model_name
 
         # Text Encoder
         try:
             logger.info(f"Loading text model: {text_model_name}")
-            self.text_encoder = AutoModel.from_pretrained(text_model_name)
+            self.text_encoder, self.text_embedding_dim = build_text_encoder(text_model_name, pretrained=pretrained_text_encoder)
         except Exception as e:
             logger.error(f"Failed to load text model {text_model_name}: {e}")
             raise
 
-        # Image Encoder
+        # Image Encoder (classifier removed, see backbones.IMAGE_BACKBONES)
         logger.info(f"Loading image model: {image_model_name}")
-        if image_model_name == 'resnet50':
-            self.image_encoder = resnet50(weights=None)
-            self.image_encoder.fc = nn.Identity() # Remove classifier
-            self.img_embedding_dim = img_embedding_dim # Use dim from settings
-        else:
-            raise ValueError(f"Image model '{image_model_name}' not currently supported for inference setup.")
+        self.image_encoder, self.img_embedding_dim = build_image_encoder(image_model_name)
+
+        # Embedding dims are inferred from the backbones; explicit ones (e.g. from the
+        # checkpoint sidecar) must agree with them
+        for label, expected, inferred in (('text', text_embedding_dim, self.text_embedding_dim),
+                                          ('image', img_embedding_dim, self.img_embedding_dim)):
+            if expected is not None and expected != inferred:
+                raise ValueError(f"{label} embedding dim {expected} does not match the {inferred} of its backbone.")
 
         # Fusion Layer
         logger.info("Initializing fusion layer...")
-        self.fusion_dim = text_embedding_dim + self.img_embedding_dim
+        self.fusion_dim = self.text_embedding_dim + self.img_embedding_dim
         self.fusion_layer = nn.Sequential(
             nn.Linear(self.fusion_dim, fusion_output_dim),
             nn.ReLU(),
@@ -54,7 +61,12 @@ class MultimodalFakeNewsModel(nn.Module):
         logger.info("Initializing classifier head...")
         self.classifier = nn.Linear(fusion_output_dim, 1)
 
-    def forward(self, input_ids, attention_mask, image, image_available):
+        # Structurally pruned checkpoint (sidecar 'structure', see pruning.py)
+        if structure:
+            logger.info(f"Applying pruned structure: {structure}")
+            apply_structure(self, structure)
+
+    def forward(self, input_ids, attention_mask, image, image_available, return_features=False):
         # Text Features
         text_outputs = self.text_encoder(input_ids=input_ids, attention_mask=attention_mask)
         text_features = text_outputs.last_hidden_state[:, 0, :]
@@ -68,7 +80,8 @@ class MultimodalFakeNewsModel(nn.Module):
             if valid_images.shape[2] != settings.IMAGE_MODEL_INPUT_SIZE or valid_images.shape[3] != settings.IMAGE_MODEL_INPUT_SIZE:
                  logger.warning(f"Input image size {valid_images.shape[2:]} doesn't match expected {settings.IMAGE_MODEL_INPUT_SIZE}. Ensure transforms are correct.")
             valid_image_features = self.image_encoder(valid_images)
-            image_features[valid_image_mask] = valid_image_features
+            # Under bf16 autocast the encoder output is bfloat16
+            image_features[valid_image_mask] = valid_image_features.to(image_features.dtype)
 
         # Fusion
         fused_features = torch.cat((text_features, image_features), dim=1)
@@ -76,4 +89,7 @@ class MultimodalFakeNewsModel(nn.Module):
 
         # Classification
         logits = self.classifier(fused_output)
+        if return_features:
+            # Fused features feed the similar-cases index (see services/embedding_index.py)
+            return logits.squeeze(-1), fused_output
         return logits.squeeze(-1) 
\ No newline at end of file
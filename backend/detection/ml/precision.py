@@ -0,0 +1,70 @@
+# backend/detection/ml/precision.py
+
+import logging
+from contextlib import nullcontext
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# --- Inference Precision ---
+# Mirrors scripts/precision.py:
+# - fp32: plain eager inference
+# - bf16: torch.autocast (matmuls/convolutions in bfloat16, sensitive ops kept in fp32)
+# - channels_last: NHWC memory format for the image branch, independent of the precision
+# bf16 is only used for a checkpoint whose model.json sidecar records a passed accuracy
+# guard (scripts/model_evaluation.py --precision bf16 --accuracy_guard).
+
+PRECISIONS = ('fp32', 'bf16')
+GUARD_KEY = 'precision_guard'
+
+
+def bf16_supported():
+    """ True when the CPU has native bf16 instructions (otherwise bf16 is emulated and slow) """
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(requested, config, require_guard=True):
+    """
+    Returns the precision to actually use for a checkpoint with sidecar `config`.
+    Falls back to fp32 (with a warning) if the precision is unknown or its accuracy
+    guard is missing or failed.
+    """
+    if requested not in PRECISIONS:
+        logger.warning(f"Unknown INFERENCE_PRECISION '{requested}', using fp32.")
+        return 'fp32'
+    if requested == 'fp32':
+        return requested
+    if config.get('quantization'):
+        logger.warning(f"INT8 checkpoint, ignoring INFERENCE_PRECISION={requested} (using fp32 activations).")
+        return 'fp32'
+    guard = config.get(GUARD_KEY, {}).get(requested)
+    if require_guard and not (guard and guard.get('passed')):
+        reason = 'failed' if guard else 'missing'
+        logger.warning(f"Accuracy guard for {requested} {reason} for this checkpoint, using fp32. "
+                       f"Run scripts/model_evaluation.py --precision {requested} --accuracy_guard first.")
+        return 'fp32'
+    if not bf16_supported():
+        logger.warning("This CPU has no native bf16 support; bf16 autocast will be emulated and slow.")
+    return requested
+
+
+def autocast_context(precision, device):
+    """ Context manager running the forward pass in the requested precision """
+    if precision == 'bf16':
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def prepare_model(model, channels_last=False):
+    """ Converts the image branch to channels_last memory format if requested """
+    if channels_last:
+        model.image_encoder.to(memory_format=torch.channels_last)
+    return model
+
+
+def prepare_images(images, channels_last=False):
+    return images.contiguous(memory_format=torch.channels_last) if channels_last else images
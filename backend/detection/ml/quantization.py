@@ -0,0 +1,38 @@
+# backend/detection/ml/quantization.py
+
+import logging
+
+import torch.nn as nn
+from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+logger = logging.getLogger(__name__)
+
+# --- INT8 Checkpoints ---
+# scripts/train_model.py --qat exports a dynamic INT8 state dict and records
+# {'quantization': {'mode': 'dynamic_int8', 'modules': [...]}} in the model.json sidecar.
+# Loading it means building the fp32 model, converting the same nn.Linear layers to
+# torch.ao.nn.quantized.dynamic.Linear (per-channel qint8) and then loading the state
+# dict. Mirrors scripts/quantization.py; CPU only.
+
+QUANTIZATION_MODES = ('dynamic_int8',)
+
+
+def quantize_model(model, modules):
+    """ Converts the nn.Linear layers of `modules` to dynamic INT8 (in place) """
+    model.cpu().eval()
+    # Name only the nn.Linear layers: a qconfig on a parent would also reach e.g. nn.Embedding
+    linear_names = [
+        name for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and any(name == m or name.startswith(m + '.') for m in modules)
+    ]
+    quantize_dynamic(model, {name: per_channel_dynamic_qconfig for name in linear_names}, inplace=True)
+    return model
+
+
+def check_quantization(quantization, device):
+    """ Validates the sidecar's quantization entry for loading on `device` """
+    mode = quantization.get('mode')
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unsupported quantization mode '{mode}' (supported: {QUANTIZATION_MODES})")
+    if device.type != 'cpu':
+        raise ValueError(f"INT8 ({mode}) checkpoints only run on CPU, not {device}")
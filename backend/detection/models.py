@@ -1,7 +1,11 @@
 """
 检测应用模型定义
 """
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 
@@ -23,6 +27,9 @@ class Detection(models.Model):
         (STATUS_COMPLETED, _('已完成')),
         (STATUS_FAILED, _('失败')),
     ]
+
+    # 已结束的状态，只有这些记录计入每日统计 (DetectionDailyStats)
+    TERMINAL_STATUSES = (STATUS_COMPLETED, STATUS_FAILED)
     
     # 检测结果常量
     RESULT_FAKE = 'fake'
@@ -83,12 +90,49 @@ class Detection(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'created_at']),
+            # 管理员查看全部记录时的排序和游标分页 (见 pagination.py)
+            models.Index(fields=['created_at']),
             models.Index(fields=['status']),
             models.Index(fields=['result']),
         ]
     
     def __str__(self):
         return f"{self.title} - {self.get_result_display()}"
+
+    # 计入每日统计所需的字段
+    ROLLUP_FIELDS = {'user_id', 'status', 'result', 'confidence_score', 'created_at'}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时计入每日统计的部分，保存时只提交差值；相关字段被延迟加载时保存前再查询
+        if not cls.ROLLUP_FIELDS & instance.get_deferred_fields():
+            instance._rollup_entry = instance.rollup_entry()
+        return instance
+
+    def rollup_entry(self):
+        """
+        本记录计入每日统计的部分: (用户, 创建日期, 状态, 结果, 置信度)
+        未结束的检测不计入；失败的检测不计入置信度
+        """
+        if self.status not in self.TERMINAL_STATUSES or self.created_at is None:
+            return None
+        confidence = self.confidence_score if self.status == self.STATUS_COMPLETED else 0.0
+        return (self.user_id, timezone.localdate(self.created_at), self.status, self.result, confidence)
+
+    def save(self, *args, **kwargs):
+        """ 保存记录，并在同一事务中更新每日统计 """
+        with transaction.atomic():
+            if not self._state.adding and not hasattr(self, '_rollup_entry'):
+                stored = Detection.objects.filter(pk=self.pk).first()
+                self._rollup_entry = stored.rollup_entry() if stored else None
+            previous = getattr(self, '_rollup_entry', None)
+            super().save(*args, **kwargs)
+            current = self.rollup_entry()
+            if current != previous:
+                DetectionDailyStats.apply(previous, -1)
+                DetectionDailyStats.apply(current, 1)
+            self._rollup_entry = current
     
     def is_completed(self):
         """
@@ -107,3 +151,259 @@ class Detection(models.Model):
         检查新闻是否被判断为真实
         """
         return self.result == self.RESULT_REAL
+
+
+class DetectionDailyStats(models.Model):
+    """
+    每日检测统计 (汇总表)
+    每个用户每天一行，另有全局每天一行 (scope='global')，按检测的创建日期 (TIME_ZONE) 归档。
+    只统计已结束的检测，在检测进入结束状态的同一事务中增量更新；
+    可用 manage.py rebuild_detection_stats 从检测记录重建。
+    """
+    GLOBAL_SCOPE = 'global'
+
+    scope = models.CharField(_('统计范围'), max_length=32)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='detection_daily_stats',
+        blank=True,
+        null=True,
+        verbose_name=_('用户')
+    )
+    day = models.DateField(_('日期'))
+    completed_count = models.IntegerField(_('完成数'), default=0)
+    failed_count = models.IntegerField(_('失败数'), default=0)
+    fake_count = models.IntegerField(_('虚假数'), default=0)
+    real_count = models.IntegerField(_('真实数'), default=0)
+    # 已完成检测的置信度之和，平均置信度 = confidence_sum / completed_count
+    confidence_sum = models.FloatField(_('置信度之和'), default=0.0)
+
+    class Meta:
+        verbose_name = _('每日检测统计')
+        verbose_name_plural = _('每日检测统计')
+        ordering = ['scope', 'day']
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'day'], name='unique_detection_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.day}: {self.completed_count + self.failed_count}"
+
+    @classmethod
+    def scope_for(cls, user_id=None):
+        """ 用户的统计范围，user_id 为 None 时为全局 """
+        return cls.GLOBAL_SCOPE if user_id is None else f'user:{user_id}'
+
+    @staticmethod
+    def entry_counts(entry):
+        """ Detection.rollup_entry() 对应的各计数字段 """
+        _, _, status, result, confidence = entry
+        return {
+            'completed_count': int(status == Detection.STATUS_COMPLETED),
+            'failed_count': int(status == Detection.STATUS_FAILED),
+            'fake_count': int(result == Detection.RESULT_FAKE),
+            'real_count': int(result == Detection.RESULT_REAL),
+            'confidence_sum': confidence,
+        }
+
+    @classmethod
+    def apply(cls, entry, sign):
+        """
+        把一条检测计入 (sign=1) 或移出 (sign=-1) 所属用户和全局的当日统计
+        须在事务中调用；用 F() 表达式原子更新，行不存在时才插入
+        """
+        if entry is None:
+            return
+        user_id, day = entry[0], entry[1]
+        counts = {field: value for field, value in cls.entry_counts(entry).items() if value}
+        changes = {field: F(field) + sign * value for field, value in counts.items()}
+        for scope, scope_user_id in ((cls.GLOBAL_SCOPE, None), (cls.scope_for(user_id), user_id)):
+            rows = cls.objects.filter(scope=scope, day=day)
+            if not changes or rows.update(**changes) or sign < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(scope=scope, user_id=scope_user_id, day=day, **counts)
+            except IntegrityError:
+                # 并发请求已插入同一行
+                rows.update(**changes)
+
+
+@receiver(post_delete, sender=Detection)
+def remove_deleted_detection_from_stats(sender, instance, **kwargs):
+    """ 删除检测记录 (包括批量和级联删除) 时从每日统计中移出 """
+    if hasattr(instance, '_rollup_entry'):
+        entry = instance._rollup_entry
+    elif Detection.ROLLUP_FIELDS & instance.get_deferred_fields():
+        # 记录已删除，无法再读取延迟加载的字段，由 rebuild_detection_stats 修正
+        return
+    else:
+        entry = instance.rollup_entry()
+    DetectionDailyStats.apply(entry, -1)
+
+
+class DetectionVerification(models.Model):
+    """
+    LLM 交叉验证中单个模型调用的结果 (每次调用一行)
+    Detection.analysis_result 的 llm_verification.details 只保留汇总，
+    逐模型的判断、理由和原始响应存放在本表，通过 verifications 接口按需加载。
+    """
+    KIND_TEXT = 'text'
+    KIND_IMAGE = 'image'
+
+    KIND_CHOICES = [
+        (KIND_TEXT, _('文本')),
+        (KIND_IMAGE, _('图像')),
+    ]
+
+    # llm_verifier 返回结果中逐模型结果所在的键
+    DETAIL_KEYS = {
+        KIND_TEXT: 'text_verifications',
+        KIND_IMAGE: 'image_verifications',
+    }
+
+    detection = models.ForeignKey(
+        Detection,
+        on_delete=models.CASCADE,
+        related_name='verifications',
+        verbose_name=_('检测记录')
+    )
+    kind = models.CharField(_('验证类型'), max_length=10, choices=KIND_CHOICES)
+    position = models.PositiveSmallIntegerField(_('序号'), default=0)
+    model = models.CharField(_('模型'), max_length=100)
+    success = models.BooleanField(_('调用成功'), default=False)
+    verdict = models.CharField(_('判断'), max_length=100, blank=True, default='')
+    confidence = models.FloatField(_('置信度'), default=0.0)
+    reason = models.TextField(_('理由'), blank=True, null=True)
+    error = models.TextField(_('错误信息'), blank=True, null=True)
+    raw_response = models.TextField(_('原始响应'), blank=True, null=True)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('LLM 验证记录')
+        verbose_name_plural = _('LLM 验证记录')
+        ordering = ['detection', 'position']
+
+    def __str__(self):
+        return f"{self.detection_id} {self.model}: {self.verdict}"
+
+    @classmethod
+    def split_details(cls, details):
+        """
+        把 llm_verifier 的结果拆分为 (汇总, 逐模型记录)
+        汇总中去掉逐模型结果，改为记录各类型的调用次数；逐模型记录为未保存的实例 (不含 detection)
+        """
+        if not isinstance(details, dict):
+            return details, []
+        summary = {key: value for key, value in details.items() if key not in cls.DETAIL_KEYS.values()}
+        records = []
+        counts = {}
+        for kind, key in cls.DETAIL_KEYS.items():
+            results = details.get(key) or []
+            counts[kind] = len(results)
+            for result in results:
+                try:
+                    confidence = float(result.get('confidence') or 0.0)
+                except (TypeError, ValueError):
+                    confidence = 0.0
+                records.append(cls(
+                    kind=kind,
+                    position=len(records),
+                    model=str(result.get('model', ''))[:100],
+                    success=bool(result.get('success')),
+                    verdict=str(result.get('verdict') or '')[:100],
+                    confidence=confidence,
+                    reason=result.get('reason'),
+                    error=result.get('error'),
+                    raw_response=result.get('raw_response'),
+                ))
+        summary['verification_counts'] = counts
+        return summary, records
+
+
+class ImageFingerprint(models.Model):
+    """
+    图像的感知哈希 (64 位 pHash 和 dHash，以有符号整数存储)
+    来源为检测上传的图像 (每条检测一行) 或训练数据集 data/processed/images 中的图像 (按相对路径唯一)；
+    进程内的汉明距离索引见 services/image_hash.py
+    """
+    SOURCE_DETECTION = 'detection'
+    SOURCE_DATASET = 'dataset'
+
+    SOURCE_CHOICES = [
+        (SOURCE_DETECTION, _('检测记录')),
+        (SOURCE_DATASET, _('训练数据集')),
+    ]
+
+    source = models.CharField(_('来源'), max_length=20, choices=SOURCE_CHOICES)
+    detection = models.OneToOneField(
+        Detection,
+        on_delete=models.CASCADE,
+        related_name='image_fingerprint',
+        blank=True,
+        null=True,
+        verbose_name=_('检测记录')
+    )
+    dataset_path = models.CharField(_('数据集图像路径'), max_length=255, unique=True, blank=True, null=True)
+    # 数据集图像的标注 (检测记录的结论以 Detection.result 为准)
+    label = models.CharField(_('标注'), max_length=20, choices=Detection.RESULT_CHOICES, blank=True, default='')
+    phash = models.BigIntegerField(_('感知哈希'))
+    dhash = models.BigIntegerField(_('差异哈希'))
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('图像指纹')
+        verbose_name_plural = _('图像指纹')
+
+    def __str__(self):
+        return f"{self.source} {self.detection_id or self.dataset_path}: {self.phash & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+class FeatureEmbedding(models.Model):
+    """
+    本地模型融合层的输出特征 (L2 归一化后以 float16 存储)
+    来源为检测记录或训练数据集 (scripts/preprocess_data.py 生成的 processed_data.csv 中的条目)。
+    不同模型版本的特征不可比较 (剪枝、蒸馏的模型维度也不同)，因此按模型版本分别存储和索引；
+    进程内的相似度索引见 services/embedding_index.py
+    """
+    SOURCE_DETECTION = 'detection'
+    SOURCE_DATASET = 'dataset'
+
+    SOURCE_CHOICES = [
+        (SOURCE_DETECTION, _('检测记录')),
+        (SOURCE_DATASET, _('训练数据集')),
+    ]
+
+    source = models.CharField(_('来源'), max_length=20, choices=SOURCE_CHOICES)
+    detection = models.ForeignKey(
+        Detection,
+        on_delete=models.CASCADE,
+        related_name='embeddings',
+        blank=True,
+        null=True,
+        verbose_name=_('检测记录')
+    )
+    # 训练数据集条目的 id 和文本摘要 (检测记录为空)
+    dataset_id = models.CharField(_('数据集条目'), max_length=100, blank=True, null=True)
+    text = models.CharField(_('文本摘要'), max_length=255, blank=True, default='')
+    # 数据集条目的标注 (检测记录的结论以 Detection.result 为准)
+    label = models.CharField(_('标注'), max_length=20, choices=Detection.RESULT_CHOICES, blank=True, default='')
+    model_version = models.CharField(_('模型版本'), max_length=100)
+    dim = models.PositiveSmallIntegerField(_('维度'))
+    vector = models.BinaryField(_('特征向量'))
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('融合特征')
+        verbose_name_plural = _('融合特征')
+        constraints = [
+            models.UniqueConstraint(fields=['detection', 'model_version'], name='unique_detection_embedding'),
+            models.UniqueConstraint(fields=['dataset_id', 'model_version'], name='unique_dataset_embedding'),
+        ]
+        indexes = [
+            models.Index(fields=['model_version', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.model_version} {self.source} {self.detection_id or self.dataset_id}"
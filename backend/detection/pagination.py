@@ -0,0 +1,128 @@
+"""
+检测记录分页
+默认沿用 PageNumberPagination (前端依赖 count 和页码)；请求带 ?pagination=cursor 时改用
+DetectionCursorPagination: 按 (created_at, id) 倒序的键集分页，用上一页最后一条记录的
+(created_at, id) 作为游标做范围查询，不使用 OFFSET，任意深度的翻页耗时相同。
+普通用户的查询走 (user, created_at) 索引，管理员查看全部记录时走 created_at 索引
+(InnoDB 二级索引隐含主键，即 (created_at, id))。
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# 启用游标分页的查询参数: ?pagination=cursor
+PAGINATION_QUERY_PARAM = 'pagination'
+CURSOR_PAGINATION = 'cursor'
+
+# 两种分页共用的稳定排序
+DETECTION_ORDERING = ('-created_at', '-id')
+
+
+class DetectionCursorPagination(BasePagination):
+    """
+    按 (created_at, id) 倒序的键集分页
+    游标为 base64 编码的 "方向|created_at|id"，方向 n 表示下一页 (更早的记录)，p 表示上一页
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            reverse = False
+            rows = queryset.order_by(*DETECTION_ORDERING)
+        else:
+            reverse, created_at, pk = cursor
+            if reverse:
+                rows = queryset.filter(
+                    Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+                ).order_by('created_at', 'id')
+            else:
+                rows = queryset.filter(
+                    Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+                ).order_by(*DETECTION_ORDERING)
+
+        # 多取一条判断是否还有更多记录
+        page = list(rows[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, api_settings.PAGE_SIZE))
+        except (TypeError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(page_size, self.max_page_size))
+
+    @staticmethod
+    def cursor_token(reverse, detection):
+        """ 从 detection 开始翻页 (不含 detection 本身) 的游标值 """
+        raw = f"{'p' if reverse else 'n'}|{detection.created_at.isoformat()}|{detection.pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def encode_cursor(self, reverse, detection):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.cursor_token(reverse, detection))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, created_at, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction == 'p', datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def use_cursor_pagination(request):
+    """ 请求是否选择了游标分页 """
+    return request is not None and request.query_params.get(PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION
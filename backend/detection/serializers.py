@@ -1,8 +1,9 @@
 """
 检测应用序列化器
 """
+from django.db.models.functions import Substr
 from rest_framework import serializers
-from .models import Detection
+from .models import Detection, DetectionVerification
 
 class DetectionSerializer(serializers.ModelSerializer):
     """
@@ -26,6 +27,73 @@ class DetectionSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at', 'completed_at', 'error_message'
         ]
 
+class DetectionListSerializer(serializers.ModelSerializer):
+    """
+    检测记录列表序列化器
+    列表只返回摘要: 正文截断为 content_preview，不含 analysis_result (完整分析见详情和 result 接口)
+    支持 ?fields=id,title,... 只返回指定字段；完整正文等字段需通过 ?fields= 显式请求
+    """
+    # content_preview 截取的字符数
+    PREVIEW_LENGTH = 120
+    # 默认不返回的字段
+    OPTIONAL_FIELDS = ('content', 'updated_at', 'error_message')
+    # 字段依赖的模型列 (未列出的字段与模型列同名)
+    FIELD_COLUMNS = {
+        'user': ('user', 'user__username'),
+        'status_display': ('status',),
+        'result_display': ('result',),
+        'content_preview': (),
+    }
+
+    user = serializers.StringRelatedField(read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    result_display = serializers.CharField(source='get_result_display', read_only=True)
+    content_preview = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Detection
+        fields = [
+            'id', 'user', 'title', 'content_preview', 'content', 'image',
+            'status', 'status_display', 'result', 'result_display',
+            'confidence_score', 'created_at', 'updated_at', 'completed_at', 'error_message'
+        ]
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = set(fields or self.resolve_fields())
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def resolve_fields(cls, requested=None):
+        """ 解析 ?fields= 参数，未指定时返回默认字段 """
+        if not requested:
+            return [name for name in cls.Meta.fields if name not in cls.OPTIONAL_FIELDS]
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown:
+            raise serializers.ValidationError({'fields': f"未知字段: {', '.join(unknown)}，可选: {', '.join(cls.Meta.fields)}"})
+        return fields
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields):
+        """ 只查询 fields 用到的列，正文只在数据库中截取前 PREVIEW_LENGTH 个字符 """
+        # id 和 created_at 用于排序和生成分页游标
+        columns = {'id', 'created_at'}
+        for name in fields:
+            columns.update(cls.FIELD_COLUMNS.get(name, (name,)))
+        if 'user' in fields:
+            queryset = queryset.select_related('user')
+        if 'content_preview' in fields:
+            queryset = queryset.annotate(content_preview=Substr('content', 1, cls.PREVIEW_LENGTH))
+        return queryset.only(*columns)
+
+    def get_content_preview(self, obj):
+        preview = getattr(obj, 'content_preview', None)
+        return preview if preview is not None else obj.content[:self.PREVIEW_LENGTH]
+
 class DetectionCreateSerializer(serializers.ModelSerializer):
     """
     创建检测记录的序列化器
@@ -52,6 +120,18 @@ class DetectionResultSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields
 
+class DetectionVerificationSerializer(serializers.ModelSerializer):
+    """
+    单个模型的 LLM 验证结果序列化器
+    """
+    class Meta:
+        model = DetectionVerification
+        fields = [
+            'id', 'kind', 'model', 'success', 'verdict', 'confidence',
+            'reason', 'error', 'raw_response', 'created_at'
+        ]
+        read_only_fields = fields
+
 class DetectionStatSerializer(serializers.Serializer):
     """
     检测统计序列化器
@@ -1 +1,129 @@
+"""
+检测服务入口
+视图和启动钩子只通过本模块调用推理功能。torch、transformers 和 torchvision
+只在真正执行检测或预热时才导入，迁移、管理命令和用户/设置接口不会加载它们。
+"""
+import os
 
+from django.conf import settings
+
+from ..models import ImageFingerprint
+from .memory_report import process_memory_report
+from .model_loader import get_registry
+from .model_store import get_active_version
+from .shadow import get_shadow_runner
+
+
+def run_detection(detection_id, image_artifact=None):
+    """
+    对指定检测记录执行完整检测流程
+    image_artifact 为上传时已解码的图像 (见 prepare_image_artifact)，不提供时从存储的文件解码
+    """
+    from .detector import FakeNewsDetector
+
+    detector = FakeNewsDetector(detection_id, image_artifact=image_artifact)
+    return detector.detect()
+
+
+def prepare_image_artifact(image_file):
+    """ 解码上传的图像，供本地模型和 LLM 验证共用 (无图像或无法解码时返回 None) """
+    from .image_artifact import open_image_artifact
+
+    return open_image_artifact(image_file)
+
+
+def find_similar_images(detection, user=None, radius=None):
+    """
+    与检测图像感知哈希相近的已知图像 (其他检测和训练数据集)
+    检测还没有指纹时从存储的文件计算并保存，图像无法解码时返回 None；
+    user 不为 None 时只返回该用户的检测记录
+    """
+    from .image_artifact import open_image_artifact
+    from .image_hash import find_image_matches, record_detection_image, to_unsigned
+
+    fingerprint = ImageFingerprint.objects.filter(detection=detection).first()
+    if fingerprint is None:
+        image_artifact = open_image_artifact(detection.image.path)
+        if image_artifact is None:
+            return None
+        fingerprint = record_detection_image(detection, image_artifact.image)
+    return find_image_matches(
+        to_unsigned(fingerprint.phash), to_unsigned(fingerprint.dhash),
+        radius=radius, exclude_detection=detection, user=user,
+    )
+
+
+def lookup_image(image_artifact, user=None, radius=None):
+    """ 与上传图像感知哈希相近的已知图像 (不保存指纹) """
+    from .image_hash import compute_hashes, find_image_matches
+
+    phash_value, dhash_value = compute_hashes(image_artifact.image)
+    return find_image_matches(phash_value, dhash_value, radius=radius, user=user)
+
+
+def compute_detection_features(detection):
+    """
+    用当前模型计算检测的融合特征，返回 (特征, 模型版本)；模型未加载时返回 (None, None)
+    文本与图像的组织方式与 FakeNewsDetector 相同
+    """
+    from .pipeline import get_pipeline
+
+    registry = get_registry()
+    registry.refresh()
+    bundle = registry.snapshot()
+    if bundle['model'] is None:
+        return None, None
+    image_path = None
+    if detection.image and os.path.isfile(detection.image.path):
+        image_path = detection.image.path
+    with registry.inference():
+        output = get_pipeline().submit(bundle, f"{detection.title} {detection.content}", image_path).result()
+    return output['features'], bundle['version']
+
+
+def find_similar_cases(detection, user=None, k=10):
+    """
+    与检测的融合特征最相似的训练数据集条目和历史检测 (见 services/embedding_index.py)
+    使用当前服务中的模型版本 (切换版本期间为旧版本，与 compute_detection_features 保存的版本一致) 已保存的特征；
+    没有时 (检测早于此功能或由其他版本完成) 执行一次推理并保存，之后的请求直接复用。模型未加载时返回 None
+    user 不为 None 时只返回该用户的检测记录
+    """
+    from .embedding_index import find_similar_cases as search_similar_cases, record_detection_embedding
+
+    registry = get_registry()
+    registry.refresh()
+    # 尚未加载模型时，加载后的版本即当前生效版本
+    version = registry.model_version or get_active_version()[0]
+    embedding = detection.embeddings.filter(model_version=version).first()
+    if embedding is None:
+        features, version = compute_detection_features(detection)
+        if features is None:
+            return None
+        embedding = record_detection_embedding(detection, version, features)
+    return search_similar_cases(embedding, k=k, user=user)
+
+
+def start_warmup():
+    """ 在后台线程中加载并预热模型 """
+    get_registry().start_warmup()
+
+
+def get_readiness():
+    """ 返回当前工作进程的模型就绪状态 """
+    readiness = get_registry().status()
+    if not settings.MODEL_WARMUP_ON_STARTUP:
+        # 未启用启动预热时不以预热结果作为就绪条件
+        readiness['ready'] = True
+    return readiness
+
+
+def get_memory_report():
+    """ 返回当前工作进程的内存报告 """
+    bundle = get_registry().bundle
+    weights_path = bundle['model_path'] if bundle else get_active_version()[1]
+    return process_memory_report(weights_path=weights_path)
+
+
+def get_shadow_status():
+    """ 返回当前工作进程的影子推理统计 """
+    return get_shadow_runner().status()
@@ -6,79 +6,73 @@ import time
 import logging
 import json
 import numpy as np
-import torch
 import joblib
 import asyncio
 from pathlib import Path
 from datetime import datetime
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from ..models import Detection
+from ..models import Detection, DetectionVerification
 from .llm_verifier import verify_news_with_llms_async # Import the async LLM verifier
-from ..ml.model import MultimodalFakeNewsModel # Import your model definition
-from ..ml.data_utils import get_tokenizer, get_image_transforms, preprocess_input # Import utils
+from .model_loader import get_registry
+from .pipeline import get_pipeline
+from .image_artifact import open_image_artifact
+from .shadow import get_shadow_runner
+from .near_duplicate import find_near_duplicates, get_duplicate_index
+from .image_hash import find_image_matches, record_detection_image, to_unsigned
+from .embedding_index import record_detection_embedding
 
 # 导入SystemSettings模型
 from settings.models import SystemSettings
 
 logger = logging.getLogger(__name__)
 
+# 近似重复预检的默认相似度阈值 (系统设置 near_duplicate_threshold)
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.85
+
 class FakeNewsDetector:
     """
     虚假新闻检测器类
     整合自训练的多模态模型和LLM交叉验证。
     """
 
-    def __init__(self, detection_id):
+    def __init__(self, detection_id, image_artifact=None):
         """
         初始化检测器
-        - 加载自训练模型和scaler
-        - 加载tokenizer和图像变换器
+        - 从模型注册表获取自训练模型
+        - 获取tokenizer和图像变换器
         - 获取Detection实例
+        - image_artifact: 上传时已解码的图像，本地模型和 LLM 验证共用
         """
         self.detection_id = detection_id
+        self.image_artifact = image_artifact
         try:
             self.detection = Detection.objects.get(id=detection_id)
         except Detection.DoesNotExist:
             logger.error(f"Detection record with ID {detection_id} not found.")
             raise
 
-        self.device = torch.device(settings.DEVICE)
-        logger.info(f"Using device: {self.device}")
-
-        # 加载自训练模型
-        self.model = self._load_model()
-        if self.model:
-             self.model.to(self.device)
-             self.model.eval() # Set model to evaluation mode
+        # 从进程级注册表获取模型快照 (只在首次使用时加载，之后复用)
+        # 整个检测过程使用同一快照，期间切换版本不影响本次检测
+        self.registry = get_registry()
+        self.registry.refresh()
+        self.bundle = self.registry.snapshot()
+        self.model_version = self.bundle['version']
+        self.device = self.bundle['device']
+        self.model = self.bundle['model']
 
         # 移除加载元数据Scaler
         # self.scaler = self._load_scaler()
         self.scaler = None # Explicitly set to None
 
         # 加载Tokenizer和图像变换
-        self.tokenizer = get_tokenizer()
-        self.image_transform = get_image_transforms()
+        self.tokenizer = self.bundle['tokenizer']
+        self.image_transform = self.bundle['image_transform']
 
         # 更新状态为处理中
         self._update_status(Detection.STATUS_PROCESSING)
 
-    def _load_model(self):
-        """ 加载 PyTorch 模型 """
-        model_path = settings.MODEL_PATH
-        if not Path(model_path).exists():
-            logger.error(f"自训练模型文件未找到: {model_path}")
-            return None
-        try:
-            model = MultimodalFakeNewsModel() # Initialize model structure
-            # Load state dict, ensuring map_location handles CPU/GPU
-            model.load_state_dict(torch.load(model_path, map_location=self.device))
-            logger.info(f"自训练模型加载成功: {model_path}")
-            return model
-        except Exception as e:
-            logger.exception(f"加载自训练模型失败 {model_path}: {e}")
-            return None
-
     def _update_status(self, status, error_message=None):
         """ 更新检测记录的状态 """
         self.detection.status = status
@@ -92,9 +86,152 @@ class FakeNewsDetector:
         self.detection.save()
         logger.info(f"Detection {self.detection_id} status updated to {status}.")
     
+    def _save_result(self, final_result, final_confidence, analysis, verifications=()):
+        """ 保存检测结果和逐模型的 LLM 验证记录，并把本次检测加入近似重复索引 """
+        self.detection.result = final_result
+        self.detection.confidence_score = final_confidence
+        self.detection.analysis_result = analysis
+        with transaction.atomic():
+            self._update_status(Detection.STATUS_COMPLETED)
+            for verification in verifications:
+                verification.detection = self.detection
+            DetectionVerification.objects.bulk_create(verifications)
+        get_duplicate_index().add(
+            self.detection.pk, self.detection.title, self.detection.content, self.detection.updated_at
+        )
+
+    def _strip_foreign_matches(self, matches, keys):
+        """
+        其他用户检测记录的匹配只保留 keys 中的字段，不把其 ID 和时间写入本次检测的 analysis_result
+        没有 detection_id 的匹配 (如训练数据集图像) 原样保留
+        """
+        ids = {match['detection_id'] for match in matches if match.get('detection_id') is not None}
+        own = set(Detection.objects.filter(
+            pk__in=ids, user_id=self.detection.user_id
+        ).values_list('pk', flat=True)) if ids else set()
+        return [
+            match if match.get('detection_id') is None or match['detection_id'] in own
+            else {key: match[key] for key in keys}
+            for match in matches
+        ]
+
+    def _check_near_duplicates(self):
+        """
+        查找近似重复的已完成检测 (相似度不低于 near_duplicate_threshold)，返回 (near_duplicate, 沿用的匹配)
+        开启 near_duplicate_reuse 时，如果最相似的记录有明确结论，且两条检测都不带图像
+        (文本相似不能说明图像相同)，返回该匹配，由 detect 直接沿用其结论
+        匹配不限于本用户的检测；near_duplicate 中其他用户的匹配只保留相似度和结论
+        出错时只记录日志，不影响正常检测
+        """
+        try:
+            options = SystemSettings.get_many({
+                'near_duplicate_threshold': DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                'near_duplicate_reuse': False,
+            })
+            threshold = options['near_duplicate_threshold']
+            matches = find_near_duplicates(
+                self.detection.title, self.detection.content, threshold, exclude=self.detection.pk
+            )
+            visible = self._strip_foreign_matches(matches, ('similarity', 'result'))
+        except Exception as e:
+            logger.exception(f"近似重复预检失败: {e}")
+            return None, None
+        if not matches:
+            return None, None
+
+        best = matches[0]
+        reuse = (options['near_duplicate_reuse']
+                 and best['result'] in (Detection.RESULT_FAKE, Detection.RESULT_REAL)
+                 and not best['has_image'] and not self.detection.image)
+        near_duplicate = {
+            'threshold': threshold,
+            'matches': visible,
+            'reused_from': visible[0].get('detection_id') if reuse else None,
+        }
+        logger.info(f"检测 {self.detection_id} 找到 {len(matches)} 条近似重复记录，"
+                    f"最高相似度 {best['similarity']:.3f} (ID: {best['detection_id']})")
+        return near_duplicate, best if reuse else None
+
+    def _check_image_matches(self, image_artifact):
+        """
+        保存检测图像的指纹，返回感知哈希相近的已知图像 (其他检测和训练数据集)
+        其他用户的检测只保留来源、结论和距离，计入 fake_count / real_count
+        没有图像或没有相近图像时返回 None；出错时只记录日志，不影响正常检测
+        """
+        if image_artifact is None or not self.detection.image:
+            return None
+        try:
+            fingerprint = record_detection_image(self.detection, image_artifact.image)
+            matches = find_image_matches(
+                to_unsigned(fingerprint.phash), to_unsigned(fingerprint.dhash), exclude_detection=self.detection
+            )
+        except Exception as e:
+            logger.exception(f"图像指纹查询失败: {e}")
+            return None
+        if not matches:
+            return None
+        labels = [match['label'] for match in matches]
+        logger.info(f"检测 {self.detection_id} 的图像 (指纹 {fingerprint.pk}) 与 {len(matches)} 张已知图像相近，"
+                    f"最小距离 {matches[0]['distance']}")
+        return {
+            'radius': settings.IMAGE_MATCH_MAX_DISTANCE,
+            'fake_count': labels.count(Detection.RESULT_FAKE),
+            'real_count': labels.count(Detection.RESULT_REAL),
+            'matches': self._strip_foreign_matches(matches, ('source', 'label', 'distance', 'dhash_distance')),
+        }
+
+    def _reuse_near_duplicate(self, near_duplicate, best, start_time):
+        """
+        沿用近似重复记录 best 的结论，跳过本地模型和 LLM 验证；置信度按相似度折减
+        best 属于其他用户时，保存的说明中不包含其 ID 和置信度
+        """
+        final_result = best['result']
+        final_confidence = max(0.0, min(1.0, best['confidence_score'] * best['similarity']))
+        if near_duplicate['reused_from'] is not None:
+            source = 'detection {}'.format(best['detection_id'])
+            details = [
+                f"Near-duplicate of {source} (Similarity: {best['similarity']:.3f}, "
+                f"Verdict: {best['result']}, Conf: {best['confidence_score']:.3f})",
+                f"Confidence scaled by similarity. Original: {best['confidence_score']:.3f}",
+            ]
+        else:
+            source = "another user's detection"
+            details = [
+                f"Near-duplicate of {source} (Similarity: {best['similarity']:.3f}, Verdict: {best['result']})",
+                "Confidence scaled by similarity.",
+            ]
+        skipped = 'Skipped (near-duplicate of {})'.format(source)
+        analysis = {
+            'timestamp': timezone.now().isoformat(),
+            'local_model': {
+                'result': Detection.RESULT_UNKNOWN, 'confidence': 0.0, 'error': skipped,
+                'model_version': self.model_version, 'probability': None,
+            },
+            'llm_verification': {
+                'overall_verdict': 'Skipped', 'aggregated_confidence': 0.0, 'error': skipped, 'details': None,
+            },
+            'near_duplicate': near_duplicate,
+            'fusion': {
+                'strategy': 'Reused Near-Duplicate Verdict',
+                'details': details,
+                'weighted_score': None,
+                'final_verdict': final_result,
+                'final_confidence': final_confidence,
+            },
+        }
+        self._save_result(final_result, final_confidence, analysis)
+        logger.info(f"--- 检测完成 ID: {self.detection_id} (沿用检测 {best['detection_id']} 的结论，"
+                    f"耗时: {time.time() - start_time:.2f} 秒) ---")
+        return {
+            'result': final_result,
+            'confidence': final_confidence,
+            'analysis': analysis
+        }
+
     def detect(self):
         """
         执行检测流程:
+        0. 近似重复预检 (可直接沿用已有检测的结论)
         1. 预处理文本和图像 (包括处理元数据缺失)
         2. 使用自训练模型进行预测
         3. 使用LLM进行交叉验证 (异步)
@@ -117,40 +254,47 @@ class FakeNewsDetector:
                     logger.warning(f"图像文件在路径 {full_image_path} 未找到。")
             except Exception as e:
                 logger.error(f"获取图像路径时出错: {e}")
+        # 图像只解码一次 (修正 EXIF 方向)，本地模型和 LLM 验证共用
+        image_artifact = self.image_artifact
+        if image_artifact is None and image_path is not None:
+            image_artifact = open_image_artifact(image_path)
+
+        # --- 0. 近似重复预检: 稍作改动后重新发布的文本 --- #
+        near_duplicate, reuse_match = self._check_near_duplicates()
+        if reuse_match is not None:
+            return self._reuse_near_duplicate(near_duplicate, reuse_match, start_time)
+        # 图像指纹: 保存本次图像的感知哈希，查找重新发布的已知图像 (作为分析信号，不参与融合)
+        image_match = self._check_image_matches(image_artifact)
 
         # --- 1. 自训练模型预测 --- #
+        features = None # 融合层输出，存入相似案例索引
         local_model_result = {
                 'result': Detection.RESULT_UNKNOWN,
                 'confidence': 0.0,
-            'error': None
+            'error': None,
+            'model_version': self.model_version,
+            'probability': None
         }
         if self.model:
             try:
-                # 预处理输入
-                processed_input = preprocess_input(
-                    text=text_content,
-                    image_path=image_path,
-                    tokenizer=self.tokenizer,
-                    image_transform=self.image_transform,
-                    # scaler=self.scaler, # 移除 scaler 参数
-                    device=self.device
-                )
-
-                # 模型推理
-                with torch.no_grad():
-                    # 调用模型时移除 metadata
-                    logits = self.model(input_ids=processed_input['input_ids'], 
-                                         attention_mask=processed_input['attention_mask'], 
-                                         image=processed_input['image'], 
-                                         image_available=processed_input['image_available'])
-                    probability = torch.sigmoid(logits).item() # 获取概率值 (0-1)
+                # 标记主推理进行中，影子推理在此期间不会启动
+                with self.registry.inference():
+                    # 分词和图像解码在预处理线程池中执行，前向推理与其他请求合批
+                    output = get_pipeline().submit(
+                        self.bundle, text_content, image_path, image_artifact=image_artifact
+                    ).result()
+                probability = output['probability'] # 获取概率值 (0-1)
+                features = output['features']
+                local_model_result['timings'] = output['timings']
 
                 # 结果转换
                 # 假设概率 > 0.5 为 Fake (需要根据你的模型训练目标确认)
                 local_model_result['result'] = Detection.RESULT_FAKE if probability >= 0.5 else Detection.RESULT_REAL
                 # 置信度可以基于概率与0.5的距离
                 local_model_result['confidence'] = probability if probability >= 0.5 else (1 - probability)
+                local_model_result['probability'] = probability
                 logger.info(f"本地模型预测结果: {local_model_result['result']}, 原始概率: {probability:.4f}, 置信度: {local_model_result['confidence']:.4f}")
+                logger.info(f"本地模型各阶段耗时 (ms): {local_model_result['timings']}")
 
             except Exception as e:
                 logger.exception(f"本地模型推理失败: {e}")
@@ -169,7 +313,11 @@ class FakeNewsDetector:
         if settings.OPENROUTER_API_KEY:
             try:
                 # 在同步代码中运行异步LLM验证函数
-                llm_raw_result = asyncio.run(verify_news_with_llms_async(text_content, image_path))
+                # 复用已解码的图像，按 LLM_IMAGE_MAX_SIDE 缩放后编码，不再重新读取文件
+                image_base64 = image_artifact.llm_base64() if image_artifact is not None else None
+                llm_raw_result = asyncio.run(verify_news_with_llms_async(
+                    text_content, image_path, image_base64=image_base64
+                ))
 
                 if llm_raw_result and not llm_raw_result.get('error'):
                      llm_result['overall_verdict'] = llm_raw_result.get('overall_verdict', 'Parsing Error')
@@ -222,11 +370,17 @@ class FakeNewsDetector:
         DEFAULT_FAKE_THRESHOLD = 0.65
         DEFAULT_REAL_THRESHOLD = 0.35
         
-        # 从数据库获取设置，如果不存在则使用默认值
-        LOCAL_MODEL_WEIGHT = SystemSettings.get_value(LOCAL_MODEL_WEIGHT_KEY, DEFAULT_LOCAL_MODEL_WEIGHT)
-        LLM_WEIGHT = SystemSettings.get_value(LLM_WEIGHT_KEY, DEFAULT_LLM_WEIGHT)
-        FAKE_THRESHOLD = SystemSettings.get_value(FAKE_THRESHOLD_KEY, DEFAULT_FAKE_THRESHOLD)
-        REAL_THRESHOLD = SystemSettings.get_value(REAL_THRESHOLD_KEY, DEFAULT_REAL_THRESHOLD)
+        # 从数据库获取设置 (进程内缓存，一次读取全部)，如果不存在则使用默认值
+        weights = SystemSettings.get_many({
+            LOCAL_MODEL_WEIGHT_KEY: DEFAULT_LOCAL_MODEL_WEIGHT,
+            LLM_WEIGHT_KEY: DEFAULT_LLM_WEIGHT,
+            FAKE_THRESHOLD_KEY: DEFAULT_FAKE_THRESHOLD,
+            REAL_THRESHOLD_KEY: DEFAULT_REAL_THRESHOLD,
+        })
+        LOCAL_MODEL_WEIGHT = weights[LOCAL_MODEL_WEIGHT_KEY]
+        LLM_WEIGHT = weights[LLM_WEIGHT_KEY]
+        FAKE_THRESHOLD = weights[FAKE_THRESHOLD_KEY]
+        REAL_THRESHOLD = weights[REAL_THRESHOLD_KEY]
         
         logger.info(f"使用模型权重设置: 本地模型={LOCAL_MODEL_WEIGHT}, LLM={LLM_WEIGHT}, " 
                    f"虚假阈值={FAKE_THRESHOLD}, 真实阈值={REAL_THRESHOLD}")
@@ -335,10 +489,24 @@ class FakeNewsDetector:
                 'final_confidence': final_confidence
             }
         }
-        self.detection.result = final_result
-        self.detection.confidence_score = final_confidence
-        self.detection.analysis_result = analysis
-        self._update_status(Detection.STATUS_COMPLETED)
+        if near_duplicate:
+            analysis['near_duplicate'] = near_duplicate
+        if image_match:
+            analysis['image_match'] = image_match
+        # 逐模型的 LLM 验证结果存入 DetectionVerification，analysis_result 只保留汇总
+        llm_result['details'], verifications = DetectionVerification.split_details(llm_result['details'])
+        self._save_result(final_result, final_confidence, analysis, verifications)
+        if features is not None:
+            try:
+                record_detection_embedding(self.detection, self.model_version, features)
+            except Exception as e:
+                logger.exception(f"保存融合特征失败: {e}")
+
+        # 主结果保存后，按抽样比例在后台用候选模型做影子推理 (不阻塞本次请求)
+        get_shadow_runner().maybe_submit(
+            self.detection_id, text_content, image_path,
+            self.model_version, local_model_result['probability']
+        )
 
         end_time = time.time()
         logger.info(f"--- 检测完成 ID: {self.detection_id} (耗时: {end_time - start_time:.2f} 秒) ---")
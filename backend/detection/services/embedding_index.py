@@ -0,0 +1,418 @@
+"""
+融合特征相似度索引 ("相似的已知案例")
+本地模型融合层的输出 (FUSION_OUTPUT_DIM 维) L2 归一化后以 float16 存入 FeatureEmbedding，
+每个模型版本一个进程内索引，按内积 (余弦相似度) 查找最近的训练数据集条目和历史检测:
+- flat: 全部向量保存为一个 float16 矩阵，查询时分块转为 float32 与查询向量做矩阵乘，结果精确
+- ivfpq: 行数达到 EMBEDDING_IVF_MIN_ROWS 后启用。k-means 粗聚类 (EMBEDDING_IVF_LISTS 个) 建立倒排表，
+  向量与所属聚类中心的残差按子向量做乘积量化 (每个子向量 1 字节)；查询只扫描最近的 EMBEDDING_IVF_PROBE 个聚类，
+  用查表 (ADC) 估计内积，再取估计值最高的 RERANK_FACTOR 倍候选从数据库读出原始特征精确重排。
+  内存中每行只占 EMBEDDING_PQ_SUBVECTORS 字节，适合数百万行
+索引每次查询前按主键增量同步 FeatureEmbedding (特征只插入和删除，不修改；回看 SYNC_PK_LAG 个主键)；
+ivfpq 的行数增长到训练时的 RETRAIN_GROWTH 倍后重新训练。
+"""
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from ..models import FeatureEmbedding
+
+VECTOR_DTYPE = np.float16
+# 分块矩阵乘每块的行数
+SEARCH_CHUNK_ROWS = 65536
+# 聚类分配时每块距离矩阵的元素数 (保持在 CPU 缓存内)
+DISTANCE_BLOCK_SIZE = 1 << 20
+# 增量同步每批解码和加入的行数
+ADD_BATCH_ROWS = 10000
+KMEANS_ITERATIONS = 10
+PQ_CENTROIDS = 256
+# 训练 k-means 使用的最大样本数 (粗聚类 / 每个子向量的码本，码本每个中心有约 64 个样本即可)
+TRAIN_SAMPLE_ROWS = 65536
+PQ_TRAIN_ROWS = 16384
+RETRAIN_GROWTH = 4
+# ivfpq 按估计内积多取的候选倍数，取出后用数据库中的原始特征精确重排
+RERANK_FACTOR = 30
+# 失效的索引槽位超过有效记录数时整体重建
+COMPACT_MIN_DEAD = 1000
+# 增量同步回看的主键数 (覆盖并发事务中已分配主键但尚未提交的记录)
+SYNC_PK_LAG = 1000
+# 同时保留索引的模型版本数 (切换版本期间新旧版本并存)
+MAX_CACHED_VERSIONS = 2
+
+EMBEDDING_COLUMNS = ('id', 'source', 'detection__user_id', 'dim', 'vector')
+SOURCE_CODES = {FeatureEmbedding.SOURCE_DETECTION: 0, FeatureEmbedding.SOURCE_DATASET: 1}
+
+
+def encode_vector(features):
+    """ 融合特征 L2 归一化后转为 float16 字节串 """
+    vector = np.asarray(features, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector.astype(VECTOR_DTYPE).tobytes()
+
+
+def decode_vectors(blobs, dim):
+    return np.frombuffer(b''.join(bytes(blob) for blob in blobs), dtype=VECTOR_DTYPE).reshape(-1, dim)
+
+
+def top_k(scores, k):
+    """ 分数最高的 k 个下标，按分数从高到低排列 """
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def nearest_centroids(data, centroids):
+    """ 每行欧氏距离最近的聚类中心 (按块计算，每块的距离矩阵约 DISTANCE_BLOCK_SIZE 个元素) """
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    result = np.empty(len(data), dtype=np.int64)
+    rows = max(1, DISTANCE_BLOCK_SIZE // len(centroids))
+    for start in range(0, len(data), rows):
+        block = np.asarray(data[start:start + rows], dtype=np.float32)
+        result[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return result
+
+
+def kmeans(data, clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """ Lloyd k-means，返回 (clusters, dim) 的 float32 聚类中心 (样本数不足时聚类数相应减少) """
+    rng = np.random.RandomState(seed)
+    data = np.asarray(data, dtype=np.float32)
+    clusters = min(clusters, len(data))
+    centroids = data[rng.choice(len(data), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(data, centroids)
+        order = np.argsort(assignment, kind='stable')
+        ordered = assignment[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        members = ordered[starts]
+        counts = np.diff(np.r_[starts, len(ordered)])
+        centroids[members] = np.add.reduceat(data[order], starts) / counts[:, None]
+        # 空聚类重新取随机样本
+        empty = np.setdiff1d(np.arange(clusters), members)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty))]
+    return centroids
+
+
+class FlatVectors:
+    """ 全部向量的 float16 矩阵 (按两倍扩容) """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.matrix = np.empty((1024, dim), dtype=VECTOR_DTYPE)
+        self.size = 0
+
+    def add(self, vectors):
+        needed = self.size + len(vectors)
+        if needed > len(self.matrix):
+            grown = np.empty((max(needed, 2 * len(self.matrix)), self.dim), dtype=VECTOR_DTYPE)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size:needed] = vectors
+        self.size = needed
+
+    def search(self, query):
+        """ 返回 (槽位, 内积)；槽位为 None 表示全部槽位 """
+        scores = np.empty(self.size, dtype=np.float32)
+        for start in range(0, self.size, SEARCH_CHUNK_ROWS):
+            block = self.matrix[start:min(start + SEARCH_CHUNK_ROWS, self.size)]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return None, scores
+
+
+class IVFPQVectors:
+    """ 倒排聚类 + 残差乘积量化 """
+
+    def __init__(self, dim, lists, subvectors, probe):
+        self.dim = dim
+        self.lists = lists
+        self.probe = probe
+        # 子向量数须整除维度 (剪枝后的模型维度可能不是 2 的幂)
+        self.subvectors = max(m for m in range(1, min(subvectors, dim) + 1) if dim % m == 0)
+        self.subdim = dim // self.subvectors
+        self.size = 0
+
+    def train(self, sample):
+        sample = np.asarray(sample, dtype=np.float32)
+        self.centroids = kmeans(sample, self.lists)
+        pq_sample = sample[:PQ_TRAIN_ROWS]
+        residuals = pq_sample - self.centroids[nearest_centroids(pq_sample, self.centroids)]
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * self.subdim:(j + 1) * self.subdim], PQ_CENTROIDS, seed=j + 1)
+            for j in range(self.subvectors)
+        ])
+        self.list_slots = [array('I') for _ in range(len(self.centroids))]
+        self.list_codes = [bytearray() for _ in range(len(self.centroids))]
+
+    def encode(self, vectors):
+        """ 返回 (所属聚类, 残差编码 uint8 (n, subvectors)) """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        assignment = nearest_centroids(vectors, self.centroids)
+        residuals = vectors - self.centroids[assignment]
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            codes[:, j] = nearest_centroids(residuals[:, j * self.subdim:(j + 1) * self.subdim], self.codebooks[j])
+        return assignment, codes
+
+    def add(self, vectors):
+        assignment, codes = self.encode(vectors)
+        slots = np.arange(self.size, self.size + len(vectors), dtype=np.uint32)
+        for cluster in np.unique(assignment):
+            members = assignment == cluster
+            self.list_slots[cluster].frombytes(slots[members].tobytes())
+            self.list_codes[cluster].extend(codes[members].tobytes())
+        self.size += len(vectors)
+
+    def search(self, query):
+        """ 返回 (槽位, 估计的内积)，只含最近的 probe 个聚类 """
+        coarse = self.centroids @ query
+        # 与查询向量欧氏距离最近的聚类 (向量已归一化，等价于 2 q·c - |c|²最大)
+        probed = top_k(2 * coarse - (self.centroids ** 2).sum(axis=1), self.probe)
+        tables = np.einsum('msd,md->ms', self.codebooks, query.reshape(self.subvectors, self.subdim))
+        columns = np.arange(self.subvectors)
+        slots, scores = [], []
+        for cluster in probed:
+            if not self.list_slots[cluster]:
+                continue
+            codes = np.frombuffer(bytes(self.list_codes[cluster]), dtype=np.uint8).reshape(-1, self.subvectors)
+            slots.append(np.frombuffer(self.list_slots[cluster].tobytes(), dtype=np.uint32))
+            scores.append(coarse[cluster] + tables[columns, codes].sum(axis=1))
+        if not slots:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float32)
+        return np.concatenate(slots), np.concatenate(scores)
+
+
+class EmbeddingIndex:
+    """
+    一个模型版本的融合特征索引
+    每个特征占一个槽位，删除的特征标记失效 (查询时过滤)
+    """
+
+    def __init__(self, model_version):
+        self.model_version = model_version
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.slots = {}
+        self.alive = bytearray()
+        self.sources = bytearray()
+        self.user_ids = array('q')
+        self.vectors = None
+        self.trained_rows = 0
+        self.watermark = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def kind(self):
+        return 'ivfpq' if isinstance(self.vectors, IVFPQVectors) else 'flat'
+
+    def _needs_rebuild(self):
+        if len(self.ids) - len(self.slots) > max(COMPACT_MIN_DEAD, len(self.slots)):
+            return True
+        if settings.EMBEDDING_INDEX != 'ivfpq':
+            return isinstance(self.vectors, IVFPQVectors)
+        if isinstance(self.vectors, IVFPQVectors):
+            return len(self.slots) > self.trained_rows * RETRAIN_GROWTH
+        return len(self.slots) >= settings.EMBEDDING_IVF_MIN_ROWS
+
+    def _create_vectors(self, embeddings, dim):
+        total = embeddings.count()
+        if settings.EMBEDDING_INDEX != 'ivfpq' or total < settings.EMBEDDING_IVF_MIN_ROWS:
+            return FlatVectors(dim)
+        vectors = IVFPQVectors(dim, settings.EMBEDDING_IVF_LISTS, settings.EMBEDDING_PQ_SUBVECTORS,
+                               settings.EMBEDDING_IVF_PROBE)
+        # 训练样本在全部特征中均匀随机抽取 (按主键取前若干行只会得到最早导入的数据集条目)
+        candidates = embeddings.filter(dim=dim)
+        ids = np.fromiter(candidates.values_list('id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+        ids = np.random.RandomState(0).permutation(ids)[:TRAIN_SAMPLE_ROWS].tolist()
+        blobs = []
+        for start in range(0, len(ids), ADD_BATCH_ROWS):
+            blobs.extend(candidates.filter(pk__in=ids[start:start + ADD_BATCH_ROWS]).values_list('vector', flat=True))
+        vectors.train(decode_vectors(blobs, dim))
+        self.trained_rows = total
+        return vectors
+
+    def _add_batch(self, embeddings, rows):
+        self.watermark = max(self.watermark, max(row[0] for row in rows))
+        if self.vectors is None:
+            self.vectors = self._create_vectors(embeddings, rows[0][3])
+        rows = [row for row in rows if row[3] == self.vectors.dim and row[0] not in self.slots]
+        if not rows:
+            return
+        self.vectors.add(decode_vectors([row[4] for row in rows], self.vectors.dim))
+        for pk, source, user_id, _, _ in rows:
+            self.slots[pk] = len(self.ids)
+            self.ids.append(pk)
+            self.alive.append(1)
+            self.sources.append(SOURCE_CODES[source])
+            self.user_ids.append(user_id if user_id is not None else -1)
+
+    def _load(self, embeddings, pks):
+        """ 按主键读取并加入指定的特征 """
+        pks = sorted(pks)
+        for start in range(0, len(pks), ADD_BATCH_ROWS):
+            rows = embeddings.filter(pk__in=pks[start:start + ADD_BATCH_ROWS]).order_by('pk')
+            rows = list(rows.values_list(*EMBEDDING_COLUMNS))
+            if rows:
+                self._add_batch(embeddings, rows)
+
+    def refresh(self):
+        """ 同步上次同步后新增的特征和已删除的特征 (首次调用时全量加载) """
+        with self._lock:
+            if self._needs_rebuild():
+                self.clear()
+            embeddings = FeatureEmbedding.objects.filter(model_version=self.model_version).order_by()
+            if self.vectors is None:
+                batch = []
+                for row in embeddings.order_by('pk').values_list(*EMBEDDING_COLUMNS).iterator(chunk_size=ADD_BATCH_ROWS):
+                    batch.append(row)
+                    if len(batch) >= ADD_BATCH_ROWS:
+                        self._add_batch(embeddings, batch)
+                        batch = []
+                if batch:
+                    self._add_batch(embeddings, batch)
+            else:
+                # 自增主键在事务提交前分配: 并发事务中主键较小的特征可能晚提交，
+                # 因此每次回看 SYNC_PK_LAG 个主键 (只取主键，未索引的再读取特征)
+                recent = embeddings.filter(pk__gt=self.watermark - SYNC_PK_LAG).values_list('id', flat=True)
+                self._load(embeddings, [pk for pk in recent if pk not in self.slots])
+            if self.vectors is None:
+                return
+            # 维度不同的特征 (同一版本中不应出现) 不计入
+            embeddings = embeddings.filter(dim=self.vectors.dim)
+            if embeddings.count() != len(self.slots):
+                # 记录数不一致: 标记已删除的特征失效，补上回看窗口之外晚提交的特征
+                existing = set(embeddings.values_list('id', flat=True).iterator(chunk_size=10000))
+                for pk in [pk for pk in self.slots if pk not in existing]:
+                    self.alive[self.slots.pop(pk)] = 0
+                self._load(embeddings, [pk for pk in existing if pk not in self.slots])
+
+    def search(self, vector, k, filters, exclude=None):
+        """
+        一次打分后按多个条件分别取内积最大的 k 个特征
+        filters 为 [(来源, user_id)]，user_id 不为 None 时只取该用户的检测记录；返回每个条件的 [(特征主键, 相似度)]
+        ivfpq 的相似度是估计值，每个条件多取 RERANK_FACTOR 倍候选供精确重排
+        """
+        query = np.frombuffer(bytes(vector), dtype=VECTOR_DTYPE).astype(np.float32)
+        with self._lock:
+            if self.vectors is None or not self.slots or len(query) != self.vectors.dim:
+                return [[] for _ in filters]
+            if isinstance(self.vectors, IVFPQVectors):
+                k *= RERANK_FACTOR
+            slots, scores = self.vectors.search(query)
+            if slots is None:
+                slots = np.arange(len(scores))
+            # np.frombuffer 的视图不能保留到锁外 (引用期间 array/bytearray 不能扩容)
+            keep = np.frombuffer(self.alive, dtype=np.uint8)[slots] == 1
+            if exclude is not None and exclude in self.slots:
+                keep &= slots != self.slots[exclude]
+            slots, scores = slots[keep], scores[keep]
+            sources = np.frombuffer(self.sources, dtype=np.uint8)[slots]
+            user_ids = np.frombuffer(self.user_ids, dtype=np.int64)[slots]
+            results = []
+            for source, user_id in filters:
+                matched = sources == SOURCE_CODES[source]
+                if user_id is not None:
+                    matched &= user_ids == user_id
+                candidates, candidate_scores = slots[matched], scores[matched]
+                order = top_k(candidate_scores, k)
+                results.append([
+                    (self.ids[slot], score)
+                    for slot, score in zip(candidates[order].tolist(), candidate_scores[order].tolist())
+                ])
+            return results
+
+
+def rerank(query, hits, k):
+    """ 按数据库中保存的特征重新计算精确内积，返回前 k 个 [(特征主键, 相似度)] """
+    if not hits:
+        return []
+    query = np.frombuffer(bytes(query), dtype=VECTOR_DTYPE).astype(np.float32)
+    rows = list(FeatureEmbedding.objects.filter(pk__in=[pk for pk, _ in hits]).values_list('id', 'vector'))
+    if not rows:
+        return []
+    pks, blobs = zip(*rows)
+    scores = decode_vectors(blobs, len(query)).astype(np.float32) @ query
+    order = top_k(scores, k)
+    return [(pks[i], float(scores[i])) for i in order.tolist()]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_embedding_index(model_version):
+    """ 返回当前进程中指定模型版本的索引 (只保留最近使用的 MAX_CACHED_VERSIONS 个版本) """
+    with _indexes_lock:
+        index = _indexes.pop(model_version, None)
+        if index is None:
+            index = EmbeddingIndex(model_version)
+        _indexes[model_version] = index
+        while len(_indexes) > MAX_CACHED_VERSIONS:
+            _indexes.popitem(last=False)
+        return index
+
+
+def record_detection_embedding(detection, model_version, features):
+    """ 保存检测的融合特征 (替换同一模型版本的已有特征)，返回 FeatureEmbedding """
+    FeatureEmbedding.objects.filter(detection=detection, model_version=model_version).delete()
+    return FeatureEmbedding.objects.create(
+        source=FeatureEmbedding.SOURCE_DETECTION, detection=detection, model_version=model_version,
+        dim=len(features), vector=encode_vector(features),
+    )
+
+
+def find_similar_cases(embedding, k=10, user=None):
+    """
+    与给定特征最相似的训练数据集条目和历史检测 (同一模型版本)
+    user 不为 None 时只返回该用户的检测记录
+    """
+    index = get_embedding_index(embedding.model_version)
+    index.refresh()
+    kind = index.kind
+    training, detections = index.search(
+        embedding.vector, k,
+        [(FeatureEmbedding.SOURCE_DATASET, None), (FeatureEmbedding.SOURCE_DETECTION, user.pk if user else None)],
+        exclude=embedding.pk,
+    )
+    if kind == 'ivfpq':
+        training, detections = rerank(embedding.vector, training, k), rerank(embedding.vector, detections, k)
+    rows = FeatureEmbedding.objects.filter(pk__in=[pk for pk, _ in training + detections]).select_related(
+        'detection'
+    ).only(
+        'dataset_id', 'text', 'label', 'detection__title', 'detection__result',
+        'detection__confidence_score', 'detection__created_at',
+    ).in_bulk()
+    return {
+        'model_version': embedding.model_version,
+        'index': kind,
+        'training_items': [
+            {
+                'dataset_id': rows[pk].dataset_id,
+                'text': rows[pk].text,
+                'label': rows[pk].label,
+                'similarity': round(score, 4),
+            }
+            for pk, score in training if pk in rows
+        ],
+        'detections': [
+            {
+                'detection_id': rows[pk].detection_id,
+                'title': rows[pk].detection.title,
+                'result': rows[pk].detection.result,
+                'confidence_score': rows[pk].detection.confidence_score,
+                'created_at': rows[pk].detection.created_at,
+                'similarity': round(score, 4),
+            }
+            for pk, score in detections if pk in rows
+        ],
+    }
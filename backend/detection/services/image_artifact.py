@@ -0,0 +1,96 @@
+"""
+检测图像制品
+上传时只读取和解码一次图像 (修正 EXIF 方向)，本地模型和 LLM 验证共用解码结果:
+- 本地模型: 按骨干网络的预处理参数缩放/裁剪得到 uint8 输入 (按预处理器缓存)
+- LLM: 长边缩放到 LLM_IMAGE_MAX_SIDE 后编码为 JPEG base64 (首次使用时生成)
+JPEG 以 draft 模式直接解码到两者所需的最小尺寸，避免全分辨率解码 (JPEG_DRAFT_DECODING 关闭时全分辨率解码)。
+"""
+import base64
+import logging
+import math
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+LLM_JPEG_QUALITY = 90
+
+
+class ImageArtifact:
+    """ 一次检测的图像，只解码一次 """
+
+    def __init__(self, image, source_format=None):
+        self.image = image # RGB，方向已修正
+        self.source_format = source_format
+        self._model_pixels = {}
+        self._llm_base64 = None
+
+    @classmethod
+    def open(cls, source):
+        """
+        从文件路径或上传文件对象解码图像
+        解码失败时抛出异常，由调用方决定是否跳过图像
+        """
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        with Image.open(source) as image:
+            source_format = image.format
+            if source_format == 'JPEG' and settings.JPEG_DRAFT_DECODING:
+                image.draft('RGB', cls._draft_size(image.size))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB')
+        return cls(image, source_format)
+
+    @staticmethod
+    def _draft_size(size):
+        """ 同时满足本地模型 (短边) 和 LLM (长边) 的最小解码尺寸 """
+        width, height = size
+        min_short_side = settings.IMAGE_MODEL_INPUT_SIZE + 32
+        scale = min_short_side / min(width, height)
+        if settings.LLM_IMAGE_MAX_SIDE > 0:
+            scale = max(scale, settings.LLM_IMAGE_MAX_SIDE / max(width, height))
+        else:
+            scale = 1.0 # LLM 需要原始尺寸
+        scale = min(scale, 1.0)
+        return math.ceil(width * scale), math.ceil(height * scale)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def model_pixels(self, preprocessor):
+        """ 本地模型的 uint8 输入 (见 ml/fast_image.py)，按预处理器缓存 """
+        key = id(preprocessor)
+        if key not in self._model_pixels:
+            self._model_pixels[key] = preprocessor.from_image(self.image)
+        return self._model_pixels[key]
+
+    def model_tensor(self, image_transform):
+        """ 未启用快速预处理时使用 torchvision 变换得到的输入 (带 batch 维) """
+        return image_transform(self.image).unsqueeze(0)
+
+    def llm_base64(self):
+        """ 发送给视觉 LLM 的 JPEG base64 """
+        if self._llm_base64 is None:
+            image = self.image
+            max_side = settings.LLM_IMAGE_MAX_SIDE
+            if max_side > 0 and max(image.size) > max_side:
+                image = image.copy()
+                image.thumbnail((max_side, max_side), Image.BICUBIC)
+            buffered = BytesIO()
+            image.save(buffered, format='JPEG', quality=LLM_JPEG_QUALITY)
+            self._llm_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return self._llm_base64
+
+
+def open_image_artifact(source):
+    """ 解码图像制品，失败时记录警告并返回 None (检测继续，不使用图像) """
+    if not source:
+        return None
+    try:
+        return ImageArtifact.open(source)
+    except Exception as e:
+        logger.warning(f"无法解码图像 {source}: {e}")
+        return None
@@ -0,0 +1,240 @@
+"""
+图像感知哈希与汉明距离索引
+同一张 (可能被压缩、缩放、加水印的) 图像常配上不同文字反复发布。每张图像计算 64 位 pHash (32x32 灰度图
+DCT 低频 8x8 系数与中位数比较) 和 dHash (9x8 灰度图相邻像素比较)，存入 ImageFingerprint。
+查询使用进程内的多索引哈希表: pHash 切为 4 段 16 位，汉明距离不超过 r 的记录至少有一段距离不超过 r // 4，
+只需枚举每段翻转不超过 r // 4 位的取值查表，再逐个核对完整距离。
+索引每次查询前按主键增量同步 ImageFingerprint (指纹只插入和删除，不修改；回看 SYNC_PK_LAG 个主键)。
+"""
+import math
+import threading
+from array import array
+from itertools import combinations
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from PIL import Image
+
+from ..models import ImageFingerprint
+
+HASH_BITS = 64
+INDEX_CHUNKS = 4
+CHUNK_BITS = HASH_BITS // INDEX_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+PHASH_SIZE = 32
+PHASH_LOW_FREQUENCIES = 8
+DHASH_SIZE = 8
+# 失效的索引槽位超过有效记录数时整体重建
+COMPACT_MIN_DEAD = 1000
+# 增量同步回看的主键数 (覆盖并发事务中已分配主键但尚未提交的记录)
+SYNC_PK_LAG = 1000
+
+
+def _dct_matrix(n):
+    """ DCT-II 变换矩阵 (未归一化，只比较系数大小) """
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return np.cos(math.pi * (2 * i + 1) * k / (2 * n))
+
+
+DCT_MATRIX = _dct_matrix(PHASH_SIZE)[:PHASH_LOW_FREQUENCIES]
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image):
+    pixels = np.asarray(image.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = DCT_MATRIX @ pixels @ DCT_MATRIX.T
+    return _bits_to_int(low > np.median(low))
+
+
+def dhash(image):
+    pixels = np.asarray(image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def compute_hashes(image):
+    """ 图像 (PIL) 的 (pHash, dHash)，均为 64 位无符号整数 """
+    return phash(image), dhash(image)
+
+
+def to_signed(value):
+    """ 64 位无符号整数转为 BigIntegerField 可存储的有符号整数 """
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _flip_masks(radius):
+    """ 16 位段内翻转不超过 radius 位的所有掩码 """
+    masks = [0]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            masks.append(sum(1 << bit for bit in bits))
+    return masks
+
+
+class HammingIndex:
+    """
+    pHash 的多索引哈希表
+    每个指纹占一个槽位，删除的指纹标记失效 (表中的失效槽位在查询时跳过)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._masks = {}
+        self.clear()
+
+    def clear(self):
+        self.ids = array('q')
+        self.slots = {}
+        self.alive = bytearray()
+        self.phashes = array('Q')
+        self.dhashes = array('Q')
+        self.tables = [{} for _ in range(INDEX_CHUNKS)]
+        self.watermark = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    @staticmethod
+    def chunks(value):
+        return [(value >> (CHUNK_BITS * n)) & CHUNK_MASK for n in range(INDEX_CHUNKS)]
+
+    def add(self, fingerprint_id, phash_value, dhash_value):
+        with self._lock:
+            self._add(fingerprint_id, phash_value, dhash_value)
+
+    def _add(self, fingerprint_id, phash_value, dhash_value):
+        if fingerprint_id in self.slots:
+            return
+        slot = len(self.ids)
+        self.ids.append(fingerprint_id)
+        self.slots[fingerprint_id] = slot
+        self.alive.append(1)
+        self.phashes.append(phash_value)
+        self.dhashes.append(dhash_value)
+        for table, chunk in zip(self.tables, self.chunks(phash_value)):
+            table.setdefault(chunk, array('I')).append(slot)
+
+    def refresh(self):
+        """ 同步上次同步后新增的指纹和已删除的指纹 (首次调用时全量加载) """
+        with self._lock:
+            if len(self.ids) - len(self.slots) > max(COMPACT_MIN_DEAD, len(self.slots)):
+                self.clear()
+            fingerprints = ImageFingerprint.objects.order_by()
+            # 自增主键在事务提交前分配: 并发事务中主键较小的指纹可能晚提交，因此每次回看 SYNC_PK_LAG 个主键
+            rows = fingerprints.filter(pk__gt=self.watermark - SYNC_PK_LAG).values_list('id', 'phash', 'dhash')
+            for pk, phash_value, dhash_value in rows.iterator(chunk_size=10000):
+                self._add(pk, to_unsigned(phash_value), to_unsigned(dhash_value))
+                self.watermark = max(self.watermark, pk)
+            if fingerprints.count() != len(self.slots):
+                # 记录数不一致: 标记已删除的指纹失效，补上回看窗口之外晚提交的指纹
+                existing = set(fingerprints.values_list('id', flat=True).iterator(chunk_size=10000))
+                for pk in [pk for pk in self.slots if pk not in existing]:
+                    self.alive[self.slots.pop(pk)] = 0
+                missing = [pk for pk in existing if pk not in self.slots]
+                for start in range(0, len(missing), 10000):
+                    rows = fingerprints.filter(pk__in=missing[start:start + 10000]).values_list('id', 'phash', 'dhash')
+                    for pk, phash_value, dhash_value in rows:
+                        self._add(pk, to_unsigned(phash_value), to_unsigned(dhash_value))
+
+    def query(self, phash_value, radius):
+        """ pHash 汉明距离不超过 radius 的指纹，返回 [(指纹主键, 距离, dHash)]，按距离从小到大排列 """
+        chunk_radius = radius // INDEX_CHUNKS
+        if chunk_radius not in self._masks:
+            self._masks[chunk_radius] = _flip_masks(chunk_radius)
+        masks = self._masks[chunk_radius]
+        with self._lock:
+            buckets = [
+                bucket for table, chunk in zip(self.tables, self.chunks(phash_value))
+                for bucket in (table.get(chunk ^ mask) for mask in masks) if bucket
+            ]
+            if not buckets:
+                return []
+            # 候选槽位一次性向量化核对 (numpy 视图直接引用 array 的内存，需在锁内用完)
+            slots = np.unique(np.frombuffer(b''.join(buckets), dtype=np.uint32))
+            slots = slots[np.frombuffer(self.alive, dtype=np.uint8)[slots] == 1]
+            differences = np.frombuffer(self.phashes, dtype=np.uint64)[slots] ^ np.uint64(phash_value)
+            distances = np.unpackbits(differences.view(np.uint8)).reshape(-1, HASH_BITS).sum(axis=1)
+            within = distances <= radius
+            slots, distances = slots[within].tolist(), distances[within].tolist()
+            matches = [(self.ids[slot], distance, self.dhashes[slot]) for slot, distance in zip(slots, distances)]
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+
+hamming_index = HammingIndex()
+
+
+def get_image_index():
+    """ 返回当前进程的图像指纹索引 """
+    return hamming_index
+
+
+def record_detection_image(detection, image):
+    """ 计算检测图像的指纹并保存 (替换已有指纹)，返回 ImageFingerprint """
+    phash_value, dhash_value = compute_hashes(image)
+    ImageFingerprint.objects.filter(detection=detection).delete()
+    fingerprint = ImageFingerprint.objects.create(
+        source=ImageFingerprint.SOURCE_DETECTION, detection=detection,
+        phash=to_signed(phash_value), dhash=to_signed(dhash_value),
+    )
+    get_image_index().add(fingerprint.pk, phash_value, dhash_value)
+    return fingerprint
+
+
+def find_image_matches(phash_value, dhash_value, radius=None, exclude_detection=None, user=None, limit=20):
+    """
+    查找 pHash 汉明距离不超过 radius (默认 IMAGE_MATCH_MAX_DISTANCE) 的已知图像
+    user 不为 None 时只返回该用户的检测记录 (数据集图像总是返回)
+    返回 [{'source', 'detection_id', 'dataset_path', 'label', 'confidence_score', 'distance', 'dhash_distance'}]
+    检测记录的 label 为其检测结论
+    """
+    if radius is None:
+        radius = settings.IMAGE_MATCH_MAX_DISTANCE
+    index = get_image_index()
+    index.refresh()
+    hits = index.query(phash_value, radius)
+    if not hits:
+        return []
+    fingerprints = ImageFingerprint.objects.filter(pk__in=[pk for pk, _, _ in hits]).select_related('detection').only(
+        'source', 'dataset_path', 'label', 'detection__result', 'detection__confidence_score'
+    )
+    if exclude_detection is not None:
+        fingerprints = fingerprints.exclude(detection=exclude_detection)
+    if user is not None:
+        fingerprints = fingerprints.filter(Q(source=ImageFingerprint.SOURCE_DATASET) | Q(detection__user=user))
+    fingerprints = fingerprints.in_bulk()
+
+    matches = []
+    for pk, distance, hit_dhash in hits:
+        fingerprint = fingerprints.get(pk)
+        if fingerprint is None:
+            continue
+        detection = fingerprint.detection
+        matches.append({
+            'source': fingerprint.source,
+            'detection_id': fingerprint.detection_id,
+            'dataset_path': fingerprint.dataset_path,
+            'label': detection.result if detection else fingerprint.label,
+            'confidence_score': detection.confidence_score if detection else None,
+            'distance': distance,
+            'dhash_distance': hamming_distance(hit_dhash, dhash_value),
+        })
+        if len(matches) >= limit:
+            break
+    return matches
+
@@ -161,9 +161,11 @@ async def call_openrouter_api_async(prompt, model_name, image_base64=None):
         return format_structured_llm_response(model_name, False, error=error_detail)
 
 
-async def verify_news_with_llms_async(text_input, image_path_input=None):
+async def verify_news_with_llms_async(text_input, image_path_input=None, image_base64=None):
     """
     ASYNC verifies a news item using multiple LLMs and aggregates results.
+    image_base64 (already encoded, e.g. from the shared image artifact) takes
+    precedence over re-reading image_path_input.
     Returns the aggregated result dictionary.
     """
     logger.info("--- Starting LLM Verification (Async) ---")
@@ -171,8 +173,8 @@ async def verify_news_with_llms_async(text_input, image_path_input=None):
         logger.error("OpenRouter API key is not configured in settings.")
         return {"error": "API key not configured.", "overall_verdict": "Error", "aggregated_confidence": 0.0}
 
-    img_b64 = None
-    if image_path_input:
+    img_b64 = image_base64
+    if not img_b64 and image_path_input:
         img_b64 = load_image_as_base64(image_path_input)
         if not img_b64:
             logger.warning(f"Failed to load image {image_path_input}, proceeding without it.")
@@ -0,0 +1,91 @@
+"""
+工作进程内存报告
+读取 /proc/<pid>/smaps_rollup 与 /proc/<pid>/smaps (仅 Linux)，区分进程独占内存与
+和其他工作进程共享的内存，并单独统计模型权重文件映射的占用。
+"""
+import os
+
+KB_PER_MB = 1024
+
+
+def _parse_kb_fields(lines):
+    """ 解析 "Key:   123 kB" 形式的行，返回 {key: kB} """
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+            fields[parts[0][:-1]] = int(parts[1])
+    return fields
+
+
+def _summarize(fields):
+    """ 将 smaps 字段汇总为 MB 统计 """
+    shared_kb = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    unique_kb = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {
+        'rss_mb': round(fields.get('Rss', 0) / KB_PER_MB, 1),
+        'pss_mb': round(fields.get('Pss', 0) / KB_PER_MB, 1),
+        'shared_mb': round(shared_kb / KB_PER_MB, 1),
+        'unique_mb': round(unique_kb / KB_PER_MB, 1),
+    }
+
+
+def read_smaps_rollup(pid='self'):
+    """ 读取进程整体内存统计 (kB) """
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        return _parse_kb_fields(f.readlines())
+
+
+def mapped_file_usage(path, pid='self'):
+    """
+    统计进程中映射自指定文件的内存 (kB)
+    未映射该文件时返回 None
+    """
+    target = os.path.realpath(path)
+    totals = None
+    in_target = False
+    with open(f'/proc/{pid}/smaps', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if not parts[0].endswith(':'):
+                # 映射区头部: address perms offset dev inode [pathname]
+                in_target = len(parts) >= 6 and parts[5] == target
+                if in_target and totals is None:
+                    totals = {}
+                continue
+            if in_target and len(parts) >= 2 and parts[1].isdigit():
+                key = parts[0][:-1]
+                totals[key] = totals.get(key, 0) + int(parts[1])
+    return totals
+
+
+def process_memory_report(pid='self', weights_path=None):
+    """
+    返回单个进程的内存报告 (MB)
+    unique_mb 为进程独占的内存，shared_mb 为与其他进程共享的内存
+    """
+    try:
+        report = {'pid': os.getpid() if pid == 'self' else int(pid)}
+        report.update(_summarize(read_smaps_rollup(pid)))
+        if weights_path:
+            weights_usage = mapped_file_usage(weights_path, pid)
+            report['weights'] = _summarize(weights_usage) if weights_usage is not None else None
+        return report
+    except (OSError, ValueError) as e:
+        return {'pid': pid, 'error': f"无法读取内存信息: {e}"}
+
+
+def find_processes_mapping(path):
+    """ 查找映射了指定文件的所有进程 ID """
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            if mapped_file_usage(path, entry) is not None:
+                pids.append(int(entry))
+        except OSError:
+            continue
+    return sorted(pids)
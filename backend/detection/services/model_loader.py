@@ -1 +1,335 @@
+"""
+模型注册表
+每个工作进程只加载一次自训练模型、Tokenizer 和图像变换，并在启动时预热。
+生效的模型版本变化时 (见 model_store.py) 在后台加载并预热新版本，然后整体替换快照；
+进行中的检测继续使用它开始时取得的快照，旧版本在最后一个引用释放后回收。
+torch/transformers 在首次加载时才导入，导入本模块本身不会拉起推理依赖。
+"""
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
 
+from django.conf import settings
+
+from .memory_report import process_memory_report
+from .model_store import active_pointer_mtime, get_active_version
+from .threading_profile import apply_thread_profile
+
+logger = logging.getLogger(__name__)
+
+# 预热状态
+STATE_COLD = 'cold'
+STATE_WARMING = 'warming'
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+
+class ModelRegistry:
+    """
+    进程级模型注册表
+    所有检测请求共享同一份模型权重、Tokenizer 和图像变换。
+    """
+
+    def __init__(self):
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        # 同一时间只构建一个模型快照 (启动加载、版本切换和影子推理的候选版本在不同线程中构建)
+        self._build_lock = threading.Lock()
+        # Fast tokenizer 在多线程并发调用时会抛出 "Already borrowed"，调用方需持有此锁
+        self.tokenizer_lock = threading.Lock()
+        self._warmup_thread = None
+        self._watch_thread = None
+        self._swap_thread = None
+        self._pointer_mtime = None
+        # 正在进行的主推理数量，影子推理只在空闲时运行
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+
+        # 当前模型快照: version, model_path, device, model, tokenizer, image_transform, image_preprocessor,
+        # precision, channels_last
+        self.bundle = None
+
+        self.state = STATE_COLD
+        self.error = None
+        self.warmup_seconds = None
+        self.swap_error = None
+        self.thread_profile = None
+
+    # 兼容属性: 读取当前快照
+    @property
+    def loaded(self):
+        return self.bundle is not None
+
+    @property
+    def model(self):
+        return self.bundle['model'] if self.bundle else None
+
+    @property
+    def device(self):
+        return self.bundle['device'] if self.bundle else None
+
+    @property
+    def tokenizer(self):
+        return self.bundle['tokenizer'] if self.bundle else None
+
+    @property
+    def image_transform(self):
+        return self.bundle['image_transform'] if self.bundle else None
+
+    @property
+    def model_version(self):
+        return self.bundle['version'] if self.bundle else None
+
+    def load(self):
+        """ 加载当前生效版本的模型、Tokenizer 和图像变换（重复调用直接返回） """
+        if self.bundle is not None:
+            return
+        with self._load_lock:
+            if self.bundle is not None:
+                return
+            # 线程数须在首次导入 torch 并执行推理之前确定
+            self.thread_profile = apply_thread_profile()
+            self._pointer_mtime = active_pointer_mtime()
+            version, model_path = get_active_version()
+            self.bundle = self.build_bundle(version, model_path)
+
+    @contextmanager
+    def inference(self):
+        """ 标记一次主推理 (预处理 + 前向推理) 正在进行 """
+        with self._inflight_lock:
+            self._inflight += 1
+        try:
+            yield
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def is_busy(self):
+        """ 是否有主推理正在进行 """
+        return self._inflight > 0
+
+    def snapshot(self):
+        """ 返回当前模型快照，一次检测全程使用同一个快照 """
+        self.load()
+        return self.bundle
+
+    def build_bundle(self, version, model_path):
+        """ 加载指定版本，返回新的模型快照 (不替换当前快照)；并发调用依次执行 """
+        with self._build_lock:
+            return self._build_bundle(version, model_path)
+
+    def _build_bundle(self, version, model_path):
+        """ 加载指定版本，返回新的模型快照 (调用方须持有 _build_lock) """
+        import torch
+        from ..ml.checkpoint import read_model_config
+        from ..ml.data_utils import get_tokenizer, get_image_transforms
+        from ..ml.fast_image import FastImagePreprocessor
+        from ..ml.precision import prepare_model, resolve_precision
+
+        device = torch.device(settings.DEVICE)
+        logger.info(f"Using device: {device}")
+
+        model = self._load_model(model_path, device)
+        precision = 'fp32'
+        if model:
+            model.to(device)
+            model.eval() # Set model to evaluation mode
+            prepare_model(model, settings.CHANNELS_LAST)
+            # bf16 只对通过精度校验的 checkpoint 启用
+            precision = resolve_precision(
+                settings.INFERENCE_PRECISION, read_model_config(model_path),
+                require_guard=settings.INFERENCE_PRECISION_REQUIRE_GUARD,
+            )
+            logger.info(f"推理精度: {precision}, channels_last: {settings.CHANNELS_LAST}")
+
+        # Tokenizer 和图像变换须与实际加载的骨干网络一致 (可能来自 checkpoint 的配置文件)
+        text_model_name = model.text_model_name if model else settings.TEXT_MODEL_NAME
+        image_model_name = model.image_model_name if model else settings.IMAGE_MODEL_NAME
+
+        return {
+            'version': version,
+            'model_path': str(model_path),
+            'device': device,
+            'model': model,
+            'tokenizer': get_tokenizer(text_model_name),
+            'image_transform': get_image_transforms(image_model_name),
+            # 推理流水线使用的 uint8 批量图像预处理 (未知骨干网络时为 None，回退到 image_transform)
+            'image_preprocessor': FastImagePreprocessor.for_backbone(
+                image_model_name, settings.IMAGE_MODEL_INPUT_SIZE, use_draft=settings.JPEG_DRAFT_DECODING
+            ) if settings.FAST_IMAGE_PREPROCESSING else None,
+            'precision': precision,
+            'channels_last': settings.CHANNELS_LAST,
+        }
+
+    def _load_model(self, model_path, device):
+        """ 加载 PyTorch 模型 """
+        from ..ml.checkpoint import load_model
+
+        if not model_path.exists():
+            logger.error(f"自训练模型文件未找到: {model_path}")
+            return None
+        try:
+            model = load_model(model_path, device, mmap=settings.MODEL_WEIGHTS_MMAP)
+            logger.info(f"自训练模型加载成功: {model_path}")
+            return model
+        except Exception as e:
+            logger.exception(f"加载自训练模型失败 {model_path}: {e}")
+            return None
+
+    def warmup(self):
+        """
+        预热当前进程:
+        1. 加载模型、Tokenizer 和图像变换
+        2. 针对常见序列长度执行若干次空输入前向推理，完成算子初始化
+        """
+        with self._state_lock:
+            if self.state in (STATE_WARMING, STATE_READY):
+                return
+            self.state = STATE_WARMING
+            self.error = None
+
+        start_time = time.time()
+        try:
+            self.load()
+            if self.model is None:
+                raise RuntimeError("本地模型未加载")
+
+            for seq_len in settings.MODEL_WARMUP_SEQ_LENGTHS:
+                self._dummy_forward(self.bundle, seq_len)
+
+            self.warmup_seconds = round(time.time() - start_time, 3)
+            self.state = STATE_READY
+            logger.info(f"模型预热完成 (版本: {self.model_version}, 耗时: {self.warmup_seconds:.2f} 秒)")
+            logger.info(f"工作进程内存: {process_memory_report(weights_path=self.bundle['model_path'])}")
+        except Exception as e:
+            logger.exception(f"模型预热失败: {e}")
+            self.error = str(e)
+            self.state = STATE_FAILED
+
+    def _dummy_forward(self, bundle, seq_len):
+        """ 使用指定序列长度的空输入执行一次前向推理（同时覆盖文本和图像分支） """
+        import torch
+        from ..ml.precision import autocast_context, prepare_images
+
+        device = bundle['device']
+        tokenizer = bundle['tokenizer']
+        input_size = settings.IMAGE_MODEL_INPUT_SIZE
+        pad_id = tokenizer.pad_token_id or 0
+        input_ids = torch.full((1, seq_len), pad_id, dtype=torch.long, device=device)
+        input_ids[:, 0] = tokenizer.cls_token_id or 0
+        attention_mask = torch.ones((1, seq_len), dtype=torch.long, device=device)
+        image = prepare_images(torch.zeros((1, 3, input_size, input_size), device=device), bundle['channels_last'])
+        image_available = torch.tensor([True], device=device)
+
+        step_start = time.time()
+        with torch.no_grad(), autocast_context(bundle['precision'], device):
+            bundle['model'](input_ids=input_ids,
+                            attention_mask=attention_mask,
+                            image=image,
+                            image_available=image_available)
+        logger.info(f"预热前向推理完成: seq_len={seq_len}, 耗时 {time.time() - step_start:.3f} 秒")
+
+    def start_warmup(self):
+        """ 在后台线程中预热，不阻塞工作进程启动 """
+        with self._state_lock:
+            if self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(
+                target=self.warmup, name='model-warmup', daemon=True
+            )
+        self._warmup_thread.start()
+        self.start_watcher()
+
+    # --- 模型热切换 ---
+
+    def refresh(self):
+        """
+        检查生效版本是否变化 (只 stat 一次 ACTIVE 文件)，变化时在后台切换
+        返回是否开始了切换
+        """
+        if self.bundle is None:
+            return False
+        mtime = active_pointer_mtime()
+        if mtime == self._pointer_mtime:
+            return False
+        with self._state_lock:
+            if self._swap_thread is not None and self._swap_thread.is_alive():
+                return False # 切换完成后的下一次检查再处理
+            self._pointer_mtime = mtime
+            version, model_path = get_active_version()
+            if version == self.model_version:
+                return False
+            self._swap_thread = threading.Thread(
+                target=self._swap, args=(version, model_path), name='model-swap', daemon=True
+            )
+        self._swap_thread.start()
+        return True
+
+    def _swap(self, version, model_path):
+        """ 加载并预热新版本，然后替换当前快照 """
+        logger.info(f"开始切换模型版本: {self.model_version} -> {version}")
+        start_time = time.time()
+        try:
+            bundle = self.build_bundle(version, model_path)
+            if bundle['model'] is None:
+                raise RuntimeError(f"模型版本 {version} 加载失败")
+            for seq_len in settings.MODEL_WARMUP_SEQ_LENGTHS:
+                self._dummy_forward(bundle, seq_len)
+        except Exception as e:
+            logger.exception(f"切换模型版本失败，继续使用 {self.model_version}: {e}")
+            self.swap_error = str(e)
+            return
+
+        old_version = self.model_version
+        self.bundle = bundle # 单次引用赋值，新检测立即使用新版本
+        self.swap_error = None
+        gc.collect() # 旧快照在进行中的检测结束后才真正释放
+        logger.info(f"模型版本已切换: {old_version} -> {version} (耗时: {time.time() - start_time:.2f} 秒)")
+
+    def start_watcher(self):
+        """ 后台定期检查生效版本 (MODEL_RELOAD_INTERVAL 为 0 时不启动) """
+        interval = settings.MODEL_RELOAD_INTERVAL
+        with self._state_lock:
+            if interval <= 0 or self._watch_thread is not None:
+                return
+            self._watch_thread = threading.Thread(
+                target=self._watch, args=(interval,), name='model-watcher', daemon=True
+            )
+        self._watch_thread.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception(f"检查模型版本失败: {e}")
+
+    def is_ready(self):
+        return self.state == STATE_READY
+
+    def status(self):
+        """ 返回就绪探针使用的状态信息 """
+        return {
+            'status': self.state,
+            'ready': self.is_ready(),
+            'model_loaded': self.model is not None,
+            'model_version': self.model_version,
+            'precision': self.bundle['precision'] if self.bundle else None,
+            'swapping': self._swap_thread is not None and self._swap_thread.is_alive(),
+            'swap_error': self.swap_error,
+            'device': str(self.device) if self.device is not None else None,
+            'warmup_seconds': self.warmup_seconds,
+            'threads': self.thread_profile,
+            'error': self.error,
+        }
+
+
+registry = ModelRegistry()
+
+
+def get_registry():
+    """ 返回当前进程的模型注册表 """
+    return registry
@@ -0,0 +1,158 @@
+"""
+版本化模型存储
+MODEL_STORAGE_PATH/
+    versions/<版本号>/best_text_image_model.pth (+ 同名 .json 架构配置)
+                     或 best_text_image_model.safetensors (scripts/convert_checkpoint.py 转换后的格式)
+    ACTIVE                                       当前生效的版本号
+已发布的版本目录不再修改；切换版本只原子替换 ACTIVE 文件，各工作进程轮询到变化后在后台加载新权重。
+没有 ACTIVE 文件时沿用 settings.MODEL_PATH (未版本化的旧部署方式)。
+本模块不导入 torch，可在视图和管理命令中直接使用。
+"""
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 未启用版本化存储时记录的版本号
+UNVERSIONED = 'unversioned'
+
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+# 可发布的权重格式，同一目录下两者都存在时 safetensors 优先
+WEIGHTS_SUFFIXES = ('.safetensors', '.pth')
+
+
+class ModelStoreError(Exception):
+    """ 模型版本发布/切换失败 """
+
+
+def versions_dir():
+    return Path(settings.MODEL_VERSIONS_DIR)
+
+
+def weights_file(default_path):
+    """ default_path 的 safetensors 版本存在时返回它，否则返回 default_path 本身 """
+    default_path = Path(default_path)
+    for suffix in WEIGHTS_SUFFIXES:
+        candidate = default_path.with_suffix(suffix)
+        if candidate.is_file():
+            return candidate
+    return default_path
+
+
+def version_model_path(version):
+    """ 指定版本的权重文件路径 """
+    return weights_file(versions_dir() / version / settings.MODEL_FILENAME)
+
+
+def active_pointer_mtime():
+    """ ACTIVE 文件的修改时间 (不存在时为 None)，供工作进程低开销地轮询 """
+    try:
+        return os.stat(settings.MODEL_ACTIVE_POINTER).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_active_version():
+    """ 返回 (版本号, 权重文件路径) """
+    try:
+        with open(settings.MODEL_ACTIVE_POINTER, 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return UNVERSIONED, weights_file(settings.MODEL_PATH)
+
+    model_path = version_model_path(version) if version else None
+    if not model_path or not model_path.is_file():
+        logger.error(f"ACTIVE 指向的模型版本不存在: '{version}'，回退到 {settings.MODEL_PATH}")
+        return UNVERSIONED, weights_file(settings.MODEL_PATH)
+    return version, model_path
+
+
+def list_versions():
+    """ 列出已发布的模型版本 (按发布时间倒序) """
+    active_version, _ = get_active_version()
+    versions = []
+    if versions_dir().is_dir():
+        for version_dir in versions_dir().iterdir():
+            model_path = weights_file(version_dir / settings.MODEL_FILENAME)
+            if version_dir.name.startswith('.') or not model_path.is_file():
+                continue
+            config_path = model_path.with_suffix('.json')
+            config = {}
+            if config_path.is_file():
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            # 张量清单可能有上百项，列表中只保留汇总信息
+            if 'weights' in config:
+                config['weights'] = {k: v for k, v in config['weights'].items() if k != 'tensors'}
+            stat = model_path.stat()
+            versions.append({
+                'version': version_dir.name,
+                'active': version_dir.name == active_version,
+                'size_mb': round(stat.st_size / (1024 * 1024), 1),
+                'format': model_path.suffix.lstrip('.'),
+                'published_at': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'config': config,
+            })
+    versions.sort(key=lambda v: v['published_at'], reverse=True)
+    return versions
+
+
+def publish_version(checkpoint_path, version=None):
+    """
+    把训练好的 checkpoint (及其 .json 架构配置) 复制为一个新版本，返回版本号
+    先写入临时目录再整体重命名，工作进程不会看到不完整的版本
+    """
+    checkpoint_path = Path(checkpoint_path)
+    if not checkpoint_path.is_file():
+        raise ModelStoreError(f"模型文件不存在: {checkpoint_path}")
+    if checkpoint_path.suffix not in WEIGHTS_SUFFIXES:
+        raise ModelStoreError(f"不支持的权重格式: {checkpoint_path.suffix} (支持: {', '.join(WEIGHTS_SUFFIXES)})")
+    version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+    if not VERSION_PATTERN.match(version):
+        raise ModelStoreError(f"无效的版本号: '{version}'")
+
+    target_dir = versions_dir() / version
+    if target_dir.exists():
+        raise ModelStoreError(f"模型版本已存在: {version}")
+
+    versions_dir().mkdir(parents=True, exist_ok=True)
+    tmp_dir = versions_dir() / f'.{version}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    try:
+        target_model = (tmp_dir / settings.MODEL_FILENAME).with_suffix(checkpoint_path.suffix)
+        shutil.copyfile(checkpoint_path, target_model)
+        config_path = checkpoint_path.with_suffix('.json')
+        if config_path.is_file():
+            shutil.copyfile(config_path, target_model.with_suffix('.json'))
+        os.replace(tmp_dir, target_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logger.info(f"模型版本已发布: {version} ({checkpoint_path})")
+    return version
+
+
+def promote_version(version):
+    """ 原子地把 ACTIVE 指向指定版本 """
+    if not VERSION_PATTERN.match(version or '') or not version_model_path(version).is_file():
+        raise ModelStoreError(f"模型版本不存在: '{version}'")
+
+    pointer = Path(settings.MODEL_ACTIVE_POINTER)
+    pointer.parent.mkdir(parents=True, exist_ok=True)
+    tmp_pointer = pointer.with_name(f'.{pointer.name}.{os.getpid()}.tmp')
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+    logger.info(f"已切换生效模型版本: {version}")
+    return version
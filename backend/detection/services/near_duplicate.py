@@ -0,0 +1,217 @@
+"""
+已完成检测的近似重复文本索引 (MinHash + LSH)
+谣言常被稍作改动后重新发布，精确哈希无法命中。文本 (标题 + 正文) 规范化后切为字符 3-gram，
+计算 MinHash 签名，按 LSH 分段 (bands x rows) 建立桶索引；候选记录再按签名估计的 Jaccard 相似度过滤。
+索引在进程内维护: 检测完成时直接加入，每次查询前从数据库增量同步其他进程完成、修改和删除的记录。
+"""
+import re
+import threading
+import unicodedata
+import zlib
+from array import array
+from datetime import timedelta
+
+import numpy as np
+
+from ..models import Detection
+
+SHINGLE_SIZE = 3
+# 20 段 x 6 行: 相似度 0.8 的记录成为候选的概率约 99.8%，0.5 时约 27%
+LSH_BANDS = 20
+LSH_ROWS = 6
+NUM_PERM = LSH_BANDS * LSH_ROWS
+# 梅森素数 2^31-1，签名计算 (a * h + b) mod p 不会溢出 uint64
+MERSENNE_PRIME = (1 << 31) - 1
+PERMUTATION_SEED = 20240601
+# 失效的索引槽位超过有效记录数时整体重建
+COMPACT_MIN_DEAD = 1000
+# 增量同步回看的时间窗口 (覆盖写入事务从给 updated_at 赋值到提交的耗时)
+SYNC_LAG = timedelta(seconds=60)
+
+NON_WORD = re.compile(r'[\W_]+')
+INDEX_COLUMNS = ('id', 'title', 'content', 'status', 'updated_at')
+
+_random = np.random.RandomState(PERMUTATION_SEED)
+PERM_A = _random.randint(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _random.randint(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text):
+    """ 全角转半角、转小写，去掉空白和标点 (改动标点、空格不影响相似度) """
+    return NON_WORD.sub('', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """ 规范化文本的字符 k-gram 集合 (不足 k 个字符时为整段文本) """
+    text = normalize_text(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def minhash_signature(text):
+    """ 文本的 MinHash 签名 (NUM_PERM 个 uint32)，没有有效字符时返回 None """
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams)
+    ) % MERSENNE_PRIME
+    permuted = (np.outer(PERM_A, hashes) + PERM_B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def detection_text(title, content):
+    """ 与 FakeNewsDetector 送入模型的文本一致 """
+    return f"{title} {content}"
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH 索引
+    每条记录占一个槽位；记录修改后占用新槽位，旧槽位标记失效 (桶中的失效槽位在查询时跳过)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.pks = array('q')
+        self.slots = {}
+        self.alive = bytearray()
+        self.updated = array('d')
+        self.signatures = []
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+        # 规范化后没有文本 (无签名) 的记录: {主键: updated_at}，同步时与已索引的记录一起计数
+        self.unindexed = {}
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    @staticmethod
+    def band_keys(signature):
+        return [signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes() for band in range(LSH_BANDS)]
+
+    def add(self, pk, title, content, updated_at):
+        """ 加入或更新一条记录 (updated_at 未变时跳过) """
+        with self._lock:
+            self._add(pk, title, content, updated_at)
+
+    def _add(self, pk, title, content, updated_at):
+        version = updated_at.timestamp()
+        slot = self.slots.get(pk)
+        if slot is not None:
+            if self.updated[slot] == version:
+                return
+            self._remove(pk)
+        elif self.unindexed.get(pk) == version:
+            return
+        signature = minhash_signature(detection_text(title, content))
+        if signature is None:
+            self.unindexed[pk] = version
+            return
+        self.unindexed.pop(pk, None)
+
+        slot = len(self.pks)
+        self.pks.append(pk)
+        self.slots[pk] = slot
+        self.alive.append(1)
+        self.updated.append(version)
+        self.signatures.append(signature)
+        for buckets, key in zip(self.buckets, self.band_keys(signature)):
+            buckets.setdefault(key, array('I')).append(slot)
+
+    def _remove(self, pk):
+        self.unindexed.pop(pk, None)
+        slot = self.slots.pop(pk, None)
+        if slot is not None:
+            self.alive[slot] = 0
+
+    def refresh(self):
+        """ 从数据库同步上次同步后修改和删除的记录 (首次调用时全量加载已完成的检测) """
+        with self._lock:
+            if len(self.pks) - len(self.slots) > max(COMPACT_MIN_DEAD, len(self.slots)):
+                self.clear()
+            completed = Detection.objects.filter(status=Detection.STATUS_COMPLETED).order_by()
+            if self.watermark is None:
+                rows = completed
+            else:
+                # 包括离开已完成状态的记录 (重新检测)，需要从索引中移除；
+                # updated_at 在事务提交前赋值，回看 SYNC_LAG 以包括晚提交的修改 (未变化的记录在 _add 中跳过)
+                rows = Detection.objects.filter(updated_at__gte=self.watermark - SYNC_LAG).order_by()
+            for pk, title, content, status, updated_at in rows.values_list(*INDEX_COLUMNS).iterator(chunk_size=2000):
+                if status == Detection.STATUS_COMPLETED:
+                    self._add(pk, title, content, updated_at)
+                else:
+                    self._remove(pk)
+                if self.watermark is None or updated_at > self.watermark:
+                    self.watermark = updated_at
+            if completed.count() != len(self.slots) + len(self.unindexed):
+                # 记录数不一致: 移除已删除或不再完成的记录，补上提交晚于 SYNC_LAG 而漏掉的记录
+                existing = set(completed.values_list('id', flat=True).iterator(chunk_size=10000))
+                for pk in [pk for pk in [*self.slots, *self.unindexed] if pk not in existing]:
+                    self._remove(pk)
+                missing = [pk for pk in existing if pk not in self.slots and pk not in self.unindexed]
+                for start in range(0, len(missing), 2000):
+                    rows = completed.filter(pk__in=missing[start:start + 2000]).values_list('id', 'title', 'content', 'updated_at')
+                    for pk, title, content, updated_at in rows:
+                        self._add(pk, title, content, updated_at)
+
+    def query(self, text, threshold, limit=5, exclude=None):
+        """ 估计相似度不低于 threshold 的记录，返回 [(主键, 相似度)]，按相似度从高到低排列 """
+        signature = minhash_signature(text)
+        if signature is None:
+            return []
+        with self._lock:
+            candidates = set()
+            for buckets, key in zip(self.buckets, self.band_keys(signature)):
+                candidates.update(buckets.get(key, ()))
+            candidates = [slot for slot in candidates if self.alive[slot] and self.pks[slot] != exclude]
+            if not candidates:
+                return []
+            matrix = np.stack([self.signatures[slot] for slot in candidates])
+            similarities = (matrix == signature).mean(axis=1)
+            matches = [
+                (self.pks[slot], float(similarity))
+                for slot, similarity in zip(candidates, similarities) if similarity >= threshold
+            ]
+        matches.sort(key=lambda match: (-match[1], -match[0]))
+        return matches[:limit]
+
+
+duplicate_index = NearDuplicateIndex()
+
+
+def get_duplicate_index():
+    """ 返回当前进程的近似重复索引 """
+    return duplicate_index
+
+
+def find_near_duplicates(title, content, threshold, limit=5, exclude=None):
+    """
+    查找与给定文本近似重复的已完成检测
+    返回 [{'detection_id', 'similarity', 'result', 'confidence_score', 'has_image', 'created_at'}]
+    """
+    index = get_duplicate_index()
+    index.refresh()
+    matches = index.query(detection_text(title, content), threshold, limit=limit, exclude=exclude)
+    if not matches:
+        return []
+    rows = {
+        row['id']: row for row in Detection.objects.filter(
+            pk__in=[pk for pk, _ in matches], status=Detection.STATUS_COMPLETED
+        ).values('id', 'result', 'confidence_score', 'image', 'created_at')
+    }
+    return [
+        {
+            'detection_id': pk,
+            'similarity': round(similarity, 4),
+            'result': rows[pk]['result'],
+            'confidence_score': rows[pk]['confidence_score'],
+            'has_image': bool(rows[pk]['image']),
+            'created_at': rows[pk]['created_at'].isoformat(),
+        }
+        for pk, similarity in matches if pk in rows
+    ]
@@ -0,0 +1,209 @@
+"""
+推理流水线
+把一次本地模型推理拆成两个阶段，让多个并发请求的各阶段互相重叠:
+1. 预处理: 线程池 (INFERENCE_PREPROCESS_WORKERS) 并行执行分词和图像解码/缩放
+   (启用快速图像预处理时图像保持 uint8，到推理阶段整批一次性归一化；
+   传入 ImageArtifact 时直接使用已解码的图像，不再读取文件)
+2. 推理: 单个推理线程把已就绪的请求攒成批 (最多 INFERENCE_MAX_BATCH 条，最多等待
+   INFERENCE_BATCH_WAIT_MS 毫秒) 执行一次前向推理
+当前批次前向推理期间，后续请求的分词和图像解码在线程池中继续进行。
+每个请求返回各阶段的耗时 (排队、分词、图像、等待成批、组批归一化、前向推理)，写入检测的 analysis_result。
+多线程工作进程 (如 gunicorn gthread、runserver) 中并发请求越多，重叠和批处理的收益越大。
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+from .model_loader import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_ms(start, end):
+    return round((end - start) * 1000, 2)
+
+
+class InferencePipeline:
+    """ 进程级推理流水线 """
+
+    def __init__(self):
+        self._start_lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+        self._ready = queue.Queue()
+        # 与当前批次模型版本不同的请求留到下一批
+        self._carry = None
+        # 已提交但尚未完成预处理的请求数；没有时不必等待攒批
+        self._preprocessing = 0
+        self._count_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.INFERENCE_PREPROCESS_WORKERS, thread_name_prefix='preprocess'
+            )
+            self._thread = threading.Thread(target=self._run, name='inference', daemon=True)
+            self._thread.start()
+
+    def submit(self, bundle, text, image_path, image_artifact=None):
+        """
+        提交一次推理，返回 Future
+        image_artifact 为已解码的图像 (见 image_artifact.py)，提供时忽略 image_path
+        结果为 {'probability': float, 'features': 融合层输出 (float32 numpy 数组), 'timings': {...}}
+        """
+        self._ensure_started()
+        job = {
+            'bundle': bundle,
+            'text': text,
+            'image_path': image_path,
+            'image_artifact': image_artifact,
+            'future': Future(),
+            'timings': {},
+            'submitted_at': time.perf_counter(),
+        }
+        with self._count_lock:
+            self._preprocessing += 1
+        self._executor.submit(self._preprocess, job)
+        return job['future']
+
+    # --- 阶段 1: 预处理 (线程池) ---
+
+    def _preprocess(self, job):
+        import torch
+        from ..ml.data_utils import preprocess_text, preprocess_image
+
+        bundle = job['bundle']
+        timings = job['timings']
+        start = time.perf_counter()
+        timings['preprocess_queue_ms'] = _elapsed_ms(job['submitted_at'], start)
+        try:
+            # 共享的 fast tokenizer 不支持并发调用；图像解码不需要加锁，可以并行
+            with get_registry().tokenizer_lock:
+                input_ids, attention_mask = preprocess_text(job['text'], bundle['tokenizer'], bundle['device'])
+            tokenized_at = time.perf_counter()
+            artifact = job['image_artifact']
+            if artifact is not None:
+                if bundle['image_preprocessor'] is not None:
+                    job['pixels'] = artifact.model_pixels(bundle['image_preprocessor'])
+                else:
+                    job['image'] = artifact.model_tensor(bundle['image_transform']).to(bundle['device'])
+                    job['image_available'] = torch.tensor([True], device=bundle['device'])
+            elif bundle['image_preprocessor'] is not None:
+                job['pixels'] = self._load_pixels(bundle['image_preprocessor'], job['image_path'])
+            else:
+                job['image'], job['image_available'] = preprocess_image(
+                    job['image_path'], bundle['image_transform'], bundle['device']
+                )
+            done_at = time.perf_counter()
+        except Exception as e:
+            self._preprocess_done()
+            job['future'].set_exception(e)
+            return
+
+        timings['tokenize_ms'] = _elapsed_ms(start, tokenized_at)
+        timings['image_ms'] = _elapsed_ms(tokenized_at, done_at)
+        job['input_ids'], job['attention_mask'] = input_ids, attention_mask
+        job['ready_at'] = done_at
+        self._ready.put(job)
+        self._preprocess_done() # 入队之后再减计数，推理线程不会误判为没有后续请求
+
+    @staticmethod
+    def _load_pixels(preprocessor, image_path):
+        """ 读取 uint8 图像，缺失或无法解码时返回 None (与 preprocess_image 一致) """
+        if not image_path or not Path(image_path).is_file():
+            return None
+        try:
+            return preprocessor.load(image_path)
+        except Exception as e:
+            logger.warning(f"Could not process image {image_path}: {e}. Skipping image.")
+            return None
+
+    def _preprocess_done(self):
+        with self._count_lock:
+            self._preprocessing -= 1
+
+    # --- 阶段 2: 批量前向推理 (单线程) ---
+
+    def _next_batch(self):
+        """ 取出同一模型版本的一批已就绪请求 """
+        first = self._carry or self._ready.get()
+        self._carry = None
+        batch = [first]
+        deadline = time.perf_counter() + settings.INFERENCE_BATCH_WAIT_MS / 1000
+        while len(batch) < settings.INFERENCE_MAX_BATCH:
+            remaining = deadline - time.perf_counter()
+            if self._preprocessing == 0 and self._ready.empty():
+                break # 没有即将就绪的请求，立即推理
+            try:
+                job = self._ready.get(timeout=remaining) if remaining > 0 else self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if job['bundle'] is not first['bundle']:
+                self._carry = job
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._forward(batch)
+            except Exception as e:
+                logger.exception(f"批量推理失败 (批大小 {len(batch)}): {e}")
+                for job in batch:
+                    if not job['future'].done():
+                        job['future'].set_exception(e)
+
+    def _forward(self, batch):
+        import torch
+        from ..ml.precision import autocast_context, prepare_images
+
+        bundle = batch[0]['bundle']
+        model = bundle['model']
+        start = time.perf_counter()
+        input_ids = torch.cat([job['input_ids'] for job in batch])
+        attention_mask = torch.cat([job['attention_mask'] for job in batch])
+        if bundle['image_preprocessor'] is not None:
+            # 整批 uint8 -> float 只转换一次，并一次性归一化
+            image, image_available = bundle['image_preprocessor'].to_batch(
+                [job['pixels'] for job in batch], bundle['device']
+            )
+        else:
+            image = torch.cat([job['image'] for job in batch])
+            image_available = torch.cat([job['image_available'] for job in batch])
+        image = prepare_images(image, bundle['channels_last'])
+        batched_at = time.perf_counter()
+        with torch.no_grad(), autocast_context(bundle['precision'], bundle['device']):
+            logits, features = model(input_ids=input_ids,
+                                     attention_mask=attention_mask,
+                                     image=image,
+                                     image_available=image_available,
+                                     return_features=True)
+        probabilities = torch.sigmoid(logits.float()).reshape(-1).tolist()
+        features = features.float().cpu().numpy()
+        end = time.perf_counter()
+
+        for job, probability, job_features in zip(batch, probabilities, features):
+            timings = job['timings']
+            timings['batch_queue_ms'] = _elapsed_ms(job['ready_at'], start)
+            timings['collate_ms'] = _elapsed_ms(start, batched_at)
+            timings['forward_ms'] = _elapsed_ms(batched_at, end)
+            timings['batch_size'] = len(batch)
+            timings['total_ms'] = _elapsed_ms(job['submitted_at'], end)
+            job['future'].set_result({'probability': probability, 'features': job_features, 'timings': timings})
+
+
+pipeline = InferencePipeline()
+
+
+def get_pipeline():
+    """ 返回当前进程的推理流水线 """
+    return pipeline
@@ -0,0 +1,257 @@
+"""
+检测记录全文检索 (标题 + 正文)
+MySQL: 使用迁移 0006 建立的 ngram FULLTEXT 索引 (WITH PARSER ngram，ngram_token_size 默认为 2)，
+       每个检索词按短语匹配 (BOOLEAN MODE 下的 +"检索词")，按 MATCH 相关度排序。
+其他数据库 (SQLite 开发/测试环境): 进程内的二元组倒排索引 BigramIndex，分词方式与 ngram 解析器一致，
+       检索词的所有二元组都须出现在标题或正文中，按 BM25 排序 (标题权重加倍)；
+       每次检索前增量同步 updated_at 之后 (回看 SYNC_LAG) 修改的记录和已删除的记录。
+"""
+import math
+import re
+import threading
+from array import array
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from ..models import Detection
+
+# MySQL FULLTEXT 索引名 (见迁移 0006)
+FULLTEXT_INDEX_NAME = 'detection_title_content_ngram'
+NGRAM_SIZE = 2
+TITLE_WEIGHT = 2.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 失效的索引槽位超过有效记录数时整体重建
+COMPACT_MIN_DEAD = 1000
+# 增量同步回看的时间窗口 (覆盖写入事务从给 updated_at 赋值到提交的耗时)
+SYNC_LAG = timedelta(seconds=60)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# BOOLEAN MODE 的运算符，检索词中出现时视为分隔符
+BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+STATUS_CODES = {value: code for code, (value, _) in enumerate(Detection.STATUS_CHOICES)}
+RESULT_CODES = {value: code for code, (value, _) in enumerate(Detection.RESULT_CHOICES)}
+SEARCH_COLUMNS = ('id', 'title', 'content', 'user_id', 'status', 'result', 'created_at', 'updated_at')
+
+
+def ngram_tokens(text, n=NGRAM_SIZE):
+    """ 与 MySQL ngram 解析器相同的分词: 每段连续的字母/数字/汉字切为长度 n 的重叠片段 """
+    tokens = []
+    for run in TOKEN_PATTERN.findall((text or '').lower()):
+        if len(run) <= n:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return tokens
+
+
+def query_terms(query):
+    """ 检索串按空白切分为检索词 """
+    return BOOLEAN_OPERATORS.sub(' ', query or '').split()
+
+
+class BigramIndex:
+    """
+    进程内的二元组倒排索引
+    每条记录占一个槽位，倒排表为槽位编号数组；记录修改后占用新槽位，旧槽位标记失效
+    """
+    FIELDS = ('title', 'content')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.pks = array('q')
+        self.slots = {}
+        self.alive = bytearray()
+        self.user_ids = array('q')
+        self.statuses = array('b')
+        self.results = array('b')
+        self.created = array('d')
+        self.updated = array('d')
+        self.lengths = {field: array('I') for field in self.FIELDS}
+        self.total_lengths = {field: 0 for field in self.FIELDS}
+        self.postings = {field: {} for field in self.FIELDS}
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, pk, title, content, user_id, status, result, created_at, updated_at):
+        """ 加入或更新一条记录 (updated_at 未变时跳过) """
+        version = updated_at.timestamp()
+        slot = self.slots.get(pk)
+        if slot is not None:
+            if self.updated[slot] == version:
+                return
+            self.remove(pk)
+
+        slot = len(self.pks)
+        self.pks.append(pk)
+        self.slots[pk] = slot
+        self.alive.append(1)
+        self.user_ids.append(user_id)
+        self.statuses.append(STATUS_CODES.get(status, -1))
+        self.results.append(RESULT_CODES.get(result, -1))
+        self.created.append(created_at.timestamp())
+        self.updated.append(version)
+        for field, text in zip(self.FIELDS, (title, content)):
+            tokens = set(ngram_tokens(text))
+            self.lengths[field].append(len(tokens))
+            self.total_lengths[field] += len(tokens)
+            postings = self.postings[field]
+            for token in tokens:
+                postings.setdefault(token, array('I')).append(slot)
+
+    def remove(self, pk):
+        slot = self.slots.pop(pk, None)
+        if slot is None:
+            return
+        self.alive[slot] = 0
+        for field in self.FIELDS:
+            self.total_lengths[field] -= self.lengths[field][slot]
+
+    def refresh(self):
+        """ 从数据库同步上次同步后修改和删除的记录 (首次调用时全量加载) """
+        with self._lock:
+            if len(self.pks) - len(self.slots) > max(COMPACT_MIN_DEAD, len(self.slots)):
+                self.clear()
+            queryset = Detection.objects.order_by()
+            # updated_at 在事务提交前赋值: 晚提交的修改可能早于已同步的时间戳，因此每次回看 SYNC_LAG
+            # (未变化的记录在 add 中跳过)
+            rows = queryset if self.watermark is None else queryset.filter(updated_at__gte=self.watermark - SYNC_LAG)
+            for row in rows.values_list(*SEARCH_COLUMNS).iterator(chunk_size=2000):
+                self.add(*row)
+                if self.watermark is None or row[-1] > self.watermark:
+                    self.watermark = row[-1]
+            if queryset.count() != len(self.slots):
+                # 记录数不一致: 移除已删除的记录，补上提交晚于 SYNC_LAG 而漏掉的记录
+                existing = set(queryset.values_list('id', flat=True).iterator(chunk_size=10000))
+                for pk in [pk for pk in self.slots if pk not in existing]:
+                    self.remove(pk)
+                missing = list(existing.difference(self.slots))
+                for start in range(0, len(missing), 2000):
+                    for row in queryset.filter(pk__in=missing[start:start + 2000]).values_list(*SEARCH_COLUMNS):
+                        self.add(*row)
+
+    def _matching_slots(self, tokens):
+        """ 所有 token 都出现在标题或正文中的槽位 """
+        slot_sets = []
+        for token in tokens:
+            slots = set()
+            for field in self.FIELDS:
+                slots.update(self.postings[field].get(token, ()))
+            if not slots:
+                return set()
+            slot_sets.append(slots)
+        slot_sets.sort(key=len)
+        matched = slot_sets[0]
+        for slots in slot_sets[1:]:
+            matched &= slots
+        return matched
+
+    def search(self, query, user_id=None, status=None, result=None,
+               created_after=None, created_before=None, offset=0, limit=20):
+        """ 返回 (匹配总数, [(主键, 得分)]) """
+        with self._lock:
+            tokens = list(dict.fromkeys(token for term in query_terms(query) for token in ngram_tokens(term)))
+            if not tokens:
+                return 0, []
+            status_code = STATUS_CODES.get(status, -2) if status else None
+            result_code = RESULT_CODES.get(result, -2) if result else None
+            after = created_after.timestamp() if created_after else None
+            before = created_before.timestamp() if created_before else None
+
+            candidates = []
+            for slot in self._matching_slots(tokens):
+                if not self.alive[slot]:
+                    continue
+                if user_id is not None and self.user_ids[slot] != user_id:
+                    continue
+                if status_code is not None and self.statuses[slot] != status_code:
+                    continue
+                if result_code is not None and self.results[slot] != result_code:
+                    continue
+                if after is not None and self.created[slot] < after:
+                    continue
+                if before is not None and self.created[slot] >= before:
+                    continue
+                candidates.append(slot)
+            if not candidates:
+                return 0, []
+
+            scores = dict.fromkeys(candidates, 0.0)
+            doc_count = len(self.slots)
+            for field in self.FIELDS:
+                weight = TITLE_WEIGHT if field == 'title' else 1.0
+                average_length = self.total_lengths[field] / doc_count or 1.0
+                lengths = self.lengths[field]
+                for token in tokens:
+                    postings = self.postings[field].get(token)
+                    if not postings:
+                        continue
+                    # 倒排表中包含失效槽位，df 略偏大，对排序影响可以忽略
+                    df = len(postings)
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    for slot in scores.keys() & set(postings):
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[slot] / average_length)
+                        scores[slot] += weight * idf * (BM25_K1 + 1) / (1 + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -self.pks[item[0]]))
+            return len(ranked), [(self.pks[slot], score) for slot, score in ranked[offset:offset + limit]]
+
+
+search_index = BigramIndex()
+
+
+def get_search_index():
+    """ 返回当前进程的检索索引 (非 MySQL 数据库使用) """
+    return search_index
+
+
+def uses_fulltext_index():
+    return connection.vendor == 'mysql'
+
+
+def boolean_query(query):
+    """ MySQL BOOLEAN MODE 检索串: 每个检索词都必须作为短语出现 """
+    return ' '.join(f'+"{term}"' for term in query_terms(query))
+
+
+def search_detections(query, user=None, status=None, result=None,
+                      created_after=None, created_before=None, offset=0, limit=20):
+    """
+    检索标题和正文，返回 (匹配总数, [(主键, 得分)])，按得分从高到低排列
+    user 为 None 时检索全部用户的记录；created_after/created_before 为带时区的时间 (前闭后开)
+    """
+    if not query_terms(query):
+        return 0, []
+    if not uses_fulltext_index():
+        index = get_search_index()
+        index.refresh()
+        return index.search(
+            query, user_id=user.pk if user else None, status=status, result=result,
+            created_after=created_after, created_before=created_before, offset=offset, limit=limit,
+        )
+
+    table = connection.ops.quote_name(Detection._meta.db_table)
+    match = f"MATCH({table}.`title`, {table}.`content`) AGAINST (%s IN BOOLEAN MODE)"
+    detections = Detection.objects.all()
+    if user is not None:
+        detections = detections.filter(user=user)
+    if status:
+        detections = detections.filter(status=status)
+    if result:
+        detections = detections.filter(result=result)
+    if created_after:
+        detections = detections.filter(created_at__gte=created_after)
+    if created_before:
+        detections = detections.filter(created_at__lt=created_before)
+    matches = detections.annotate(score=RawSQL(match, [boolean_query(query)])).filter(score__gt=0)
+    total = matches.count()
+    hits = list(matches.order_by('-score', '-id').values_list('id', 'score')[offset:offset + limit])
+    return total, hits
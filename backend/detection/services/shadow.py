@@ -0,0 +1,218 @@
+"""
+影子推理
+按 SHADOW_SAMPLE_RATE 抽样的检测在主结果保存之后，由后台线程用候选模型版本 (SHADOW_MODEL_VERSION)
+再推理一次，两个概率写入 SHADOW_LOG_PATH (JSONL) 供离线对比 (见 shadow_report 管理命令)。
+
+影子推理不能拖慢主推理:
+- 有界队列，队列满时直接丢弃任务，提交方从不阻塞
+- 单个低优先级 (nice 19) 线程，只在没有主推理进行时才开始预处理和前向推理
+- CPU 预算: 令牌桶按 SHADOW_CPU_BUDGET (单核比例) 累积可用的 CPU 秒数，余额不足时丢弃任务
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .model_loader import get_registry
+from .model_store import version_model_path
+
+logger = logging.getLogger(__name__)
+
+# 等待主推理空闲的最长时间 (秒)，超时后丢弃任务
+MAX_IDLE_WAIT = 30.0
+IDLE_POLL_INTERVAL = 0.05
+# CPU 预算令牌桶的容量 (秒): 允许短时间内突发使用的 CPU 时间
+BUDGET_WINDOW = 60.0
+
+
+class CpuBudget:
+    """ 令牌桶: 每经过 1 秒墙钟时间获得 fraction 秒 CPU 时间 """
+
+    def __init__(self, fraction, window=BUDGET_WINDOW):
+        self.fraction = fraction
+        self.capacity = fraction * window
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.fraction)
+        self._last = now
+
+    def available(self):
+        self._refill()
+        return self.tokens > 0
+
+    def charge(self, cpu_seconds):
+        self._refill()
+        self.tokens -= cpu_seconds
+
+
+class ShadowRunner:
+    """ 进程级影子推理执行器 """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=settings.SHADOW_QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        # 计数在请求线程和影子推理线程中都会更新
+        self._stats_lock = threading.Lock()
+        self._bundle = None
+        self.budget = CpuBudget(settings.SHADOW_CPU_BUDGET)
+        self.stats = {'submitted': 0, 'completed': 0, 'dropped_queue_full': 0,
+                      'dropped_busy': 0, 'dropped_budget': 0, 'failed': 0}
+
+    def enabled(self):
+        return bool(settings.SHADOW_MODEL_VERSION) and settings.SHADOW_SAMPLE_RATE > 0
+
+    def maybe_submit(self, detection_id, text, image_path, primary_version, primary_probability):
+        """ 按抽样比例提交一次影子推理，从不阻塞调用方 """
+        candidate = settings.SHADOW_MODEL_VERSION
+        if not self.enabled() or primary_probability is None or candidate == primary_version:
+            return False
+        if random.random() >= settings.SHADOW_SAMPLE_RATE:
+            return False
+
+        self._ensure_started()
+        job = {
+            'detection_id': detection_id,
+            'text': text,
+            'image_path': str(image_path) if image_path else None,
+            'primary_version': primary_version,
+            'primary_probability': primary_probability,
+        }
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count('dropped_queue_full')
+            return False
+        self._count('submitted')
+        return True
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shadow-inference', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # 只降低本线程的调度优先级 (Linux 上 nice 值按线程生效)
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"无法降低影子推理线程优先级: {e}")
+
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                self._count('failed')
+                logger.exception(f"影子推理失败 (检测 {job['detection_id']}): {e}")
+
+    def _wait_until_idle(self):
+        """ 等待主推理空闲，超时返回 False """
+        registry = get_registry()
+        deadline = time.monotonic() + MAX_IDLE_WAIT
+        while registry.is_busy():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(IDLE_POLL_INTERVAL)
+        return True
+
+    def _load_candidate(self):
+        """ 加载 (并缓存) 候选版本 """
+        version = settings.SHADOW_MODEL_VERSION
+        if self._bundle is None or self._bundle['version'] != version:
+            self._bundle = None
+            bundle = get_registry().build_bundle(version, version_model_path(version))
+            if bundle['model'] is None:
+                raise RuntimeError(f"候选模型版本 {version} 加载失败")
+            self._bundle = bundle
+        return self._bundle
+
+    def _process(self, job):
+        import torch
+        from ..ml.data_utils import preprocess_input
+        from ..ml.precision import autocast_context, prepare_images
+
+        if not self.budget.available():
+            self._count('dropped_budget')
+            return
+        if not self._wait_until_idle():
+            self._count('dropped_busy')
+            return
+
+        # process_time 包含同时运行的主推理，作为保守的上限计入预算
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            bundle = self._load_candidate()
+            processed_input = preprocess_input(
+                text=job['text'],
+                image_path=job['image_path'],
+                tokenizer=bundle['tokenizer'],
+                image_transform=bundle['image_transform'],
+                device=bundle['device']
+            )
+            # 预处理期间若有主推理开始，让出 CPU 再继续
+            if not self._wait_until_idle():
+                self._count('dropped_busy')
+                return
+            with torch.no_grad(), autocast_context(bundle['precision'], bundle['device']):
+                logits = bundle['model'](input_ids=processed_input['input_ids'],
+                                         attention_mask=processed_input['attention_mask'],
+                                         image=prepare_images(processed_input['image'], bundle['channels_last']),
+                                         image_available=processed_input['image_available'])
+            probability = torch.sigmoid(logits.float()).item()
+        finally:
+            cpu_seconds = time.process_time() - cpu_start
+            self.budget.charge(cpu_seconds)
+
+        self._write_log({
+            'timestamp': timezone.now().isoformat(),
+            'detection_id': job['detection_id'],
+            'primary_version': job['primary_version'],
+            'primary_probability': job['primary_probability'],
+            'shadow_version': bundle['version'],
+            'shadow_probability': probability,
+            'shadow_latency_ms': round((time.perf_counter() - wall_start) * 1000, 1),
+            'shadow_cpu_seconds': round(cpu_seconds, 3),
+        })
+        self._count('completed')
+
+    def _write_log(self, record):
+        with self._log_lock:
+            with open(settings.SHADOW_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'enabled': self.enabled(),
+            'candidate_version': settings.SHADOW_MODEL_VERSION or None,
+            'sample_rate': settings.SHADOW_SAMPLE_RATE,
+            'queue_size': self._queue.qsize(),
+            'budget_cpu_seconds': round(self.budget.tokens, 3),
+            **stats,
+        }
+
+
+shadow_runner = ShadowRunner()
+
+
+def get_shadow_runner():
+    """ 返回当前进程的影子推理执行器 """
+    return shadow_runner
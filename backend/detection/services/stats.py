@@ -0,0 +1,166 @@
+"""
+检测统计
+已结束的检测从每日汇总表 DetectionDailyStats 读取，进行中的检测 (数量很少) 直接查询，
+get_stats 的查询次数和耗时与检测记录总数无关:
+1. 一次聚合查询得到汇总表中的各状态/结果数量、置信度之和和最早/最晚日期
+2. 一次查询读取进行中的检测，按本地日期 (settings.TIME_ZONE)、状态和结果在 Python 中计数
+本地日期与 Detection.rollup_entry 一样用 timezone.localdate 计算，不依赖数据库的时区转换
+(MySQL 未加载时区表时 CONVERT_TZ 返回 NULL)
+3. 一次查询读取趋势窗口内的汇总行 (没有检测记录时省略)
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from ..models import Detection, DetectionDailyStats
+
+# 趋势图展示的天数
+TREND_DAYS = 7
+
+EMPTY_STATS = {
+    'total_count': 0,
+    'fake_count': 0,
+    'real_count': 0,
+    'pending_count': 0,
+    'completed_count': 0,
+    'failed_count': 0,
+    'fake_percentage': 0,
+    'real_percentage': 0,
+    'average_confidence': 0,
+}
+
+# 汇总行中至少有一条检测 (删除检测后可能留下全为 0 的行)
+NON_EMPTY_ROLLUP = Q(completed_count__gt=0) | Q(failed_count__gt=0)
+
+
+def rollup_totals(rollups):
+    """ 汇总表的单次聚合查询 """
+    totals = rollups.aggregate(
+        completed=Sum('completed_count'),
+        failed=Sum('failed_count'),
+        fake=Sum('fake_count'),
+        real=Sum('real_count'),
+        confidence=Sum('confidence_sum'),
+        first_day=Min('day', filter=NON_EMPTY_ROLLUP),
+        last_day=Max('day', filter=NON_EMPTY_ROLLUP),
+    )
+    # 别名不能与字段同名，否则 filter 中的字段会被解析为聚合结果
+    for key in ('completed', 'failed', 'fake', 'real', 'confidence'):
+        totals[key] = totals[key] or 0
+    return totals
+
+
+def in_progress_counts(detections):
+    """ 进行中的检测按 (本地日期, 状态, 结果) 分组计数 """
+    counts = Counter(
+        (timezone.localdate(created_at), status, result)
+        for created_at, status, result in detections.exclude(
+            status__in=Detection.TERMINAL_STATUSES
+        ).values_list('created_at', 'status', 'result').order_by()
+    )
+    return [
+        {'day': day, 'status': status, 'result': result, 'count': count}
+        for (day, status, result), count in counts.items()
+    ]
+
+
+def trend_window(today, first_date, last_date):
+    """
+    趋势图的日期范围: 最近 TREND_DAYS 天；
+    这段时间内没有检测记录时，改为截至最后一次检测的 TREND_DAYS 天 (不早于第一次检测)
+    """
+    end_date = today if last_date > today - timedelta(days=TREND_DAYS) else last_date
+    start_date = end_date - timedelta(days=TREND_DAYS - 1)
+    if end_date != today:
+        start_date = max(start_date, first_date)
+    return start_date, end_date
+
+
+def trend_label(date, today):
+    if date == today:
+        return '今天'
+    if date == today - timedelta(days=1):
+        return '昨天'
+    return date.strftime('%Y-%m-%d')
+
+
+def compute_detection_stats(user=None):
+    """ 统计指定用户 (None 表示全部用户) 的检测结果，最多执行三次查询 """
+    rollups = DetectionDailyStats.objects.filter(scope=DetectionDailyStats.scope_for(user.pk if user else None))
+    detections = Detection.objects.filter(user=user) if user else Detection.objects.all()
+
+    totals = rollup_totals(rollups)
+    in_progress = in_progress_counts(detections)
+    pending_count = sum(row['count'] for row in in_progress if row['status'] == Detection.STATUS_PENDING)
+    fake_count = totals['fake'] + sum(row['count'] for row in in_progress if row['result'] == Detection.RESULT_FAKE)
+    real_count = totals['real'] + sum(row['count'] for row in in_progress if row['result'] == Detection.RESULT_REAL)
+    total_count = totals['completed'] + totals['failed'] + sum(row['count'] for row in in_progress)
+    if total_count == 0:
+        return dict(EMPTY_STATS)
+
+    # 按日计数: 汇总表 + 进行中的检测
+    days = [day for day in (totals['first_day'], totals['last_day']) if day] + [row['day'] for row in in_progress]
+    today = timezone.localdate()
+    start_date, end_date = trend_window(today, min(days), max(days))
+    counts = Counter()
+    for row in rollups.filter(day__range=(start_date, end_date)).values('day', 'completed_count', 'failed_count'):
+        counts[row['day']] += row['completed_count'] + row['failed_count']
+    for row in in_progress:
+        counts[row['day']] += row['count']
+    dates = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    weekly_trend = [{'date': trend_label(date, today), 'count': counts[date]} for date in dates]
+
+    completed_count = totals['completed']
+    return {
+        'total_count': total_count,
+        'fake_count': fake_count,
+        'real_count': real_count,
+        'pending_count': pending_count,
+        'completed_count': completed_count,
+        'failed_count': totals['failed'],
+        'fake_percentage': (fake_count / total_count) * 100,
+        'real_percentage': (real_count / total_count) * 100,
+        'average_confidence': totals['confidence'] / completed_count if completed_count else 0,
+        'weekly_trend': weekly_trend,
+        'today_detections': counts[today],
+        'result_distribution': [
+            { 'name': '真实新闻', 'value': real_count },
+            { 'name': '虚假新闻', 'value': fake_count }
+        ]
+    }
+
+
+def rebuild_daily_stats():
+    """
+    从检测记录重建每日统计汇总表，返回写入的行数
+    流式读取已结束检测的几个字段 (一次查询)，本地日期由 timezone.localdate 计算，与 Detection.rollup_entry 一致
+    历史数据由迁移 0002 回填；用于修正绕过 Detection.save() 的批量更新 (QuerySet.update 等)
+    """
+    rows = (
+        Detection.objects.filter(status__in=Detection.TERMINAL_STATUSES)
+        .values_list('user_id', 'created_at', 'status', 'result', 'confidence_score')
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups = {}
+        for detection_user_id, created_at, status, result, confidence in rows.iterator(chunk_size=2000):
+            day = timezone.localdate(created_at)
+            for user_id in (None, detection_user_id):
+                key = (DetectionDailyStats.scope_for(user_id), day)
+                rollup = rollups.setdefault(key, DetectionDailyStats(scope=key[0], user_id=user_id, day=day))
+                if status == Detection.STATUS_COMPLETED:
+                    rollup.completed_count += 1
+                    rollup.confidence_sum += confidence or 0.0
+                else:
+                    rollup.failed_count += 1
+                if result == Detection.RESULT_FAKE:
+                    rollup.fake_count += 1
+                elif result == Detection.RESULT_REAL:
+                    rollup.real_count += 1
+
+        DetectionDailyStats.objects.all().delete()
+        DetectionDailyStats.objects.bulk_create(rollups.values(), batch_size=1000)
+    return len(rollups)
@@ -0,0 +1,92 @@
+"""
+推理线程划分
+多个工作进程各自使用 torch 默认线程数 (等于核心数) 时，intra-op 线程数远超核心数，
+线程争抢导致吞吐量骤降。按 "可用核心数 / 工作进程数" 为每个工作进程分配 intra-op 线程，
+inter-op 线程默认为 1 (模型以 eager 模式逐算子执行，不需要算子间并行)。
+可选把每个工作进程绑定到互不重叠的核心集合 (见 config/gunicorn.py)，减少迁移和缓存失效。
+合适的组合可用 benchmark_threads 管理命令在目标主机上测得。
+"""
+import logging
+import os
+import sys
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """ 当前进程可用的 CPU 编号 (遵循已有的亲和性/cgroup cpuset 限制) """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError: # 非 Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_threads(num_cpus, workers, intra_op_threads=0, inter_op_threads=0):
+    """ 计算每个工作进程的线程数，参数为 0 表示自动 """
+    workers = max(1, workers)
+    return {
+        'cpus': num_cpus,
+        'workers': workers,
+        'intra_op_threads': intra_op_threads or max(1, num_cpus // workers),
+        'inter_op_threads': inter_op_threads or 1,
+    }
+
+
+def worker_cpu_set(cpus, workers, slot):
+    """ 第 slot 个工作进程绑定的核心集合: 尽量均分，工作进程多于核心时轮流共享 """
+    if workers >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    base, extra = divmod(len(cpus), workers)
+    start = slot * base + min(slot, extra)
+    return cpus[start:start + base + (1 if slot < extra else 0)]
+
+
+def pin_to_cpus(cpus):
+    """ 把当前进程绑定到指定核心 (须在创建任何线程之前调用，之后创建的线程继承该设置) """
+    try:
+        os.sched_setaffinity(0, cpus)
+        return True
+    except (AttributeError, OSError) as e:
+        logger.warning(f"无法绑定 CPU {cpus}: {e}")
+        return False
+
+
+def thread_env(profile):
+    """ OpenMP/MKL 线程数环境变量，须在导入 torch 之前设置才生效 """
+    threads = str(profile['intra_op_threads'])
+    return {'OMP_NUM_THREADS': threads, 'MKL_NUM_THREADS': threads}
+
+
+def current_profile():
+    """ 按配置计算当前工作进程的线程划分 """
+    return plan_threads(
+        len(available_cpus()),
+        settings.INFERENCE_WORKERS,
+        settings.TORCH_INTRA_OP_THREADS,
+        settings.TORCH_INTER_OP_THREADS,
+    )
+
+
+def apply_thread_profile():
+    """
+    在当前工作进程中应用线程划分，在首次加载模型之前调用
+    torch 尚未导入时同时设置 OpenMP/MKL 环境变量，导入后设置 torch 的线程数
+    """
+    profile = current_profile()
+    if 'torch' not in sys.modules:
+        for key, value in thread_env(profile).items():
+            os.environ.setdefault(key, value)
+
+    import torch
+
+    torch.set_num_threads(profile['intra_op_threads'])
+    try:
+        torch.set_num_interop_threads(profile['inter_op_threads'])
+    except RuntimeError as e:
+        # inter-op 线程池在首次并行执行后不能再调整
+        logger.warning(f"无法设置 inter-op 线程数: {e}")
+    profile['inter_op_threads'] = torch.get_num_interop_threads()
+    logger.info(f"推理线程划分: {profile}")
+    return profile
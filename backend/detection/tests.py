@@ -0,0 +1,1092 @@
+"""
+检测应用测试
+"""
+import importlib.util
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+
+from detection.models import (
+    Detection, DetectionDailyStats, DetectionVerification, FeatureEmbedding, ImageFingerprint,
+)
+from detection.services import detection_service
+from detection.services.embedding_index import (
+    encode_vector, find_similar_cases, get_embedding_index, record_detection_embedding, top_k,
+)
+from detection.services.image_artifact import ImageArtifact, open_image_artifact
+from detection.services.image_hash import (
+    HammingIndex, compute_hashes, get_image_index, hamming_distance, record_detection_image, to_signed
+)
+from detection.services.model_loader import get_registry
+from detection.services.model_store import (
+    UNVERSIONED, ModelStoreError, get_active_version, list_versions, promote_version, publish_version,
+    version_model_path,
+)
+from detection.services.near_duplicate import find_near_duplicates, get_duplicate_index, minhash_signature
+from detection.services.pipeline import InferencePipeline
+from detection.services.search import get_search_index, ngram_tokens
+from detection.services.shadow import CpuBudget, ShadowRunner
+from detection.services.stats import in_progress_counts, rebuild_daily_stats
+from detection.services.threading_profile import current_profile, plan_threads, thread_env, worker_cpu_set
+from settings.models import SystemSettings
+
+
+class ImportBudgetTests(SimpleTestCase):
+    """
+    启动导入预算: django.setup() 和 URL 配置不应导入推理依赖
+    """
+    HEAVY_MODULES = ('torch', 'torchvision', 'transformers')
+    IMPORT_TIME_BUDGET_SECONDS = 3.0
+
+    def test_django_setup_does_not_import_ml_stack(self):
+        code = (
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import django\n"
+            "django.setup()\n"
+            "import config.urls\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"heavy = [m for m in {self.HEAVY_MODULES!r} if m in sys.modules]\n"
+            "print('IMPORT_BUDGET', ','.join(heavy), elapsed)\n"
+        )
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        report = [line for line in result.stdout.splitlines() if line.startswith('IMPORT_BUDGET')][-1]
+        parts = report.split(' ')
+        heavy, elapsed = parts[1], float(parts[2])
+        self.assertEqual(heavy, '', f"django.setup() 导入了推理依赖: {heavy}")
+        self.assertLess(elapsed, self.IMPORT_TIME_BUDGET_SECONDS)
+
+
+class ReadinessTests(SimpleTestCase):
+    """
+    就绪探针: 预热完成前返回 503；未启用启动预热时不以预热结果作为就绪条件
+    """
+
+    def get(self, ready):
+        state = {'status': 'warming' if not ready else 'ready', 'ready': ready}
+        with mock.patch.object(get_registry(), 'status', return_value=state):
+            return self.client.get(reverse('detection-health-ready'))
+
+    @override_settings(MODEL_WARMUP_ON_STARTUP=True)
+    def test_not_ready_until_warm(self):
+        response = self.get(ready=False)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['ready'])
+        self.assertEqual(self.get(ready=True).status_code, 200)
+
+    @override_settings(MODEL_WARMUP_ON_STARTUP=False)
+    def test_ready_without_startup_warmup(self):
+        response = self.get(ready=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+
+
+@override_settings(INFERENCE_MAX_BATCH=3, INFERENCE_BATCH_WAIT_MS=0)
+class InferencePipelineBatchingTests(SimpleTestCase):
+    """
+    推理线程只把同一模型版本 (bundle) 的已就绪请求攒成一批，
+    版本不同的请求留到下一批 (_carry)，且不超过 INFERENCE_MAX_BATCH
+    """
+
+    def make_job(self, bundle, name):
+        return {'bundle': bundle, 'name': name, 'future': Future(), 'timings': {}}
+
+    def enqueue(self, pipeline, spec):
+        bundles = {'a': {'version': 'a'}, 'b': {'version': 'b'}}
+        jobs = [self.make_job(bundles[key], f'{key}{i}') for i, key in enumerate(spec)]
+        for job in jobs:
+            pipeline._ready.put(job)
+        return jobs
+
+    def test_next_batch_groups_by_bundle(self):
+        pipeline = InferencePipeline()
+        self.enqueue(pipeline, 'aabaaaa')
+        batches = []
+        while not pipeline._ready.empty() or pipeline._carry is not None:
+            batches.append([job['name'] for job in pipeline._next_batch()])
+        self.assertEqual(batches, [['a0', 'a1'], ['b2'], ['a3', 'a4', 'a5'], ['a6']])
+
+    def test_run_resolves_each_batch_with_its_bundle(self):
+        pipeline = InferencePipeline()
+        forwarded = []
+
+        def fake_forward(batch):
+            version = batch[0]['bundle']['version']
+            forwarded.append((version, len(batch)))
+            if version == 'b':
+                raise RuntimeError('forward failed')
+            for job in batch:
+                job['future'].set_result({'version': version, 'batch_size': len(batch)})
+
+        pipeline._forward = fake_forward
+        jobs = self.enqueue(pipeline, 'abba')
+        threading.Thread(target=pipeline._run, daemon=True).start()
+
+        self.assertEqual(jobs[0]['future'].result(timeout=5), {'version': 'a', 'batch_size': 1})
+        self.assertEqual(jobs[3]['future'].result(timeout=5), {'version': 'a', 'batch_size': 1})
+        for job in jobs[1:3]:
+            with self.assertRaises(RuntimeError):
+                job['future'].result(timeout=5)
+        self.assertEqual(forwarded, [('a', 1), ('b', 2), ('a', 1)])
+
+
+class ThreadProfileTests(SimpleTestCase):
+    """
+    推理线程划分: 按工作进程数均分核心，核心集合互不重叠，工作进程多于核心时轮流共享
+    """
+
+    def test_plan_threads(self):
+        self.assertEqual(plan_threads(8, 1)['intra_op_threads'], 8)
+        self.assertEqual(plan_threads(8, 3)['intra_op_threads'], 2)
+        # 工作进程多于核心时每个进程至少一个线程
+        self.assertEqual(plan_threads(2, 4)['intra_op_threads'], 1)
+        self.assertEqual(plan_threads(4, 0)['workers'], 1)
+        self.assertEqual(plan_threads(8, 2, intra_op_threads=3, inter_op_threads=2),
+                         {'cpus': 8, 'workers': 2, 'intra_op_threads': 3, 'inter_op_threads': 2})
+
+    def test_worker_cpu_sets(self):
+        cpus = [0, 2, 4, 6, 8, 10, 12, 14]
+        slots = [worker_cpu_set(cpus, 3, slot) for slot in range(3)]
+        # 不能整除时前面的工作进程多分一个核心
+        self.assertEqual(slots, [[0, 2, 4], [6, 8, 10], [12, 14]])
+        self.assertEqual([worker_cpu_set(cpus, 8, slot) for slot in range(8)], [[cpu] for cpu in cpus])
+        self.assertEqual([worker_cpu_set([0, 1], 5, slot) for slot in range(5)], [[0], [1], [0], [1], [0]])
+
+    @override_settings(INFERENCE_WORKERS=4, TORCH_INTRA_OP_THREADS=0, TORCH_INTER_OP_THREADS=0)
+    def test_current_profile_splits_cores_between_workers(self):
+        with mock.patch('detection.services.threading_profile.available_cpus', return_value=list(range(10))):
+            profile = current_profile()
+        self.assertEqual((profile['intra_op_threads'], profile['inter_op_threads']), (2, 1))
+        self.assertEqual(thread_env(profile), {'OMP_NUM_THREADS': '2', 'MKL_NUM_THREADS': '2'})
+
+@override_settings(SHADOW_MODEL_VERSION='candidate', SHADOW_SAMPLE_RATE=1.0, SHADOW_QUEUE_SIZE=2)
+class ShadowRunnerTests(SimpleTestCase):
+    """
+    影子推理: CPU 预算令牌桶按墙钟时间补充，按抽样比例提交，队列满时直接丢弃 (不阻塞调用方)
+    """
+
+    def runner(self):
+        runner = ShadowRunner()
+        # 不启动后台线程，任务留在队列中
+        runner._ensure_started = mock.Mock()
+        return runner
+
+    def submit(self, runner, detection_id=1, primary_version='active', probability=0.8):
+        return runner.maybe_submit(detection_id, 'text', None, primary_version, probability)
+
+    def test_cpu_budget_refill_and_charge(self):
+        clock = mock.Mock(return_value=100.0)
+        with mock.patch('detection.services.shadow.time.monotonic', clock):
+            budget = CpuBudget(0.5, window=10)
+            self.assertEqual(budget.tokens, 5.0)
+            budget.charge(6.0)
+            self.assertFalse(budget.available())
+            clock.return_value = 101.0
+            self.assertFalse(budget.available())
+            self.assertAlmostEqual(budget.tokens, -0.5)
+            clock.return_value = 104.0
+            self.assertTrue(budget.available())
+            self.assertAlmostEqual(budget.tokens, 1.0)
+            # 余额不超过容量
+            clock.return_value = 1000.0
+            self.assertTrue(budget.available())
+            self.assertEqual(budget.tokens, 5.0)
+
+    def test_sample_rate(self):
+        runner = self.runner()
+        with override_settings(SHADOW_SAMPLE_RATE=0.0):
+            self.assertFalse(any(self.submit(runner, n) for n in range(20)))
+        self.assertTrue(self.submit(runner))
+        # 主结果没有概率或已经是候选版本时不提交
+        self.assertFalse(self.submit(runner, probability=None))
+        self.assertFalse(self.submit(runner, primary_version='candidate'))
+        with override_settings(SHADOW_MODEL_VERSION=''):
+            self.assertFalse(self.submit(runner))
+        self.assertEqual(runner.status()['submitted'], 1)
+
+    def test_full_queue_drops(self):
+        runner = self.runner()
+        self.assertEqual([self.submit(runner, n) for n in range(4)], [True, True, False, False])
+        status = runner.status()
+        self.assertEqual((status['submitted'], status['dropped_queue_full'], status['queue_size']), (2, 2, 2))
+
+class ModelStoreTests(TestCase):
+    """
+    版本化模型存储: 发布和切换版本、ACTIVE 原子替换、safetensors 优先、拒绝无效和不存在的版本，
+    模型版本管理接口仅管理员可访问
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        store = override_settings(
+            MODEL_VERSIONS_DIR=os.path.join(self.root, 'versions'),
+            MODEL_ACTIVE_POINTER=os.path.join(self.root, 'ACTIVE'),
+            MODEL_PATH=os.path.join(self.root, settings.MODEL_FILENAME),
+        )
+        store.enable()
+        self.addCleanup(store.disable)
+
+    def checkpoint(self, name, suffix='.pth'):
+        path = os.path.join(self.root, f'{name}{suffix}')
+        with open(path, 'wb') as f:
+            f.write(name.encode())
+        return path
+
+    def test_publish_and_promote(self):
+        self.assertEqual(get_active_version(), (UNVERSIONED, Path(settings.MODEL_PATH)))
+        publish_version(self.checkpoint('v1'), 'v1')
+        publish_version(self.checkpoint('v2'), 'v2')
+        promote_version('v1')
+        self.assertEqual(get_active_version(), ('v1', version_model_path('v1')))
+
+        # ACTIVE 通过临时文件 + os.replace 整体替换: 替换失败时仍指向原版本
+        with mock.patch('detection.services.model_store.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                promote_version('v2')
+        self.assertEqual(get_active_version()[0], 'v1')
+        promote_version('v2')
+        self.assertEqual(get_active_version()[0], 'v2')
+        with open(settings.MODEL_ACTIVE_POINTER, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'v2')
+        self.assertEqual({v['version']: v['active'] for v in list_versions()}, {'v1': False, 'v2': True})
+
+    def test_unknown_and_invalid_versions(self):
+        publish_version(self.checkpoint('v1'), 'v1')
+        for version in ('missing', '', '../v1', '.v1'):
+            with self.assertRaises(ModelStoreError):
+                promote_version(version)
+        for version in ('../escape', '.hidden', 'a' * 65, 'v1'):
+            with self.assertRaises(ModelStoreError):
+                publish_version(self.checkpoint('ckpt'), version)
+        with self.assertRaises(ModelStoreError):
+            publish_version(self.checkpoint('ckpt', suffix='.bin'), 'v2')
+        self.assertEqual(sorted(os.listdir(settings.MODEL_VERSIONS_DIR)), ['v1'])
+
+        # ACTIVE 指向已不存在的版本时回退到 MODEL_PATH
+        with open(settings.MODEL_ACTIVE_POINTER, 'w', encoding='utf-8') as f:
+            f.write('deleted')
+        self.assertEqual(get_active_version(), (UNVERSIONED, Path(settings.MODEL_PATH)))
+
+    def test_prefers_safetensors(self):
+        publish_version(self.checkpoint('v1'), 'v1')
+        self.assertEqual(version_model_path('v1').suffix, '.pth')
+        shutil.copyfile(self.checkpoint('v1', suffix='.safetensors'),
+                        Path(settings.MODEL_VERSIONS_DIR) / 'v1' / Path(settings.MODEL_FILENAME).with_suffix('.safetensors'))
+        self.assertEqual(version_model_path('v1').suffix, '.safetensors')
+        self.assertEqual(list_versions()[0]['format'], 'safetensors')
+
+        self.checkpoint(Path(settings.MODEL_FILENAME).stem, suffix='.safetensors')
+        self.assertEqual(get_active_version()[1], Path(settings.MODEL_PATH).with_suffix('.safetensors'))
+
+    def test_model_versions_endpoint_requires_admin(self):
+        publish_version(self.checkpoint('v1'), 'v1')
+        url = reverse('settings-model-versions')
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(
+            username='store-user', email='store-user@example.com', password='store-password'))
+        self.assertEqual(client.get(url).status_code, 403)
+        self.assertEqual(client.post(url, {'version': 'v1'}).status_code, 403)
+        self.assertFalse(os.path.exists(settings.MODEL_ACTIVE_POINTER))
+
+        client.force_authenticate(get_user_model().objects.create_user(
+            username='store-admin', email='store-admin@example.com', password='store-password', is_staff=True))
+        response = client.post(url, {'version': 'v1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['active_version'], 'v1')
+        self.assertEqual(client.post(url, {'version': 'missing'}).status_code, 400)
+        self.assertEqual(client.get(url).data['active_version'], 'v1')
+
+class DetectionStatsQueryTests(TestCase):
+    """
+    get_stats 的查询次数不随历史记录长度增长
+    """
+    STATS_QUERIES = 3
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='stats', password='stats-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('detection-get-stats')
+
+    def create_history(self, days):
+        now = timezone.now()
+        for day in range(days):
+            status = Detection.STATUS_COMPLETED if day % 3 else Detection.STATUS_FAILED
+            result = Detection.RESULT_FAKE if day % 2 else Detection.RESULT_REAL
+            detection = Detection.objects.create(
+                user=self.user, title=f'news {day}', content='content',
+                status=status, result=result, confidence_score=0.8,
+            )
+            # created_at 为 auto_now_add，需要在创建后改写
+            Detection.objects.filter(pk=detection.pk).update(created_at=now - timedelta(days=day))
+        # QuerySet.update 绕过了 Detection.save()，重建汇总表
+        rebuild_daily_stats()
+
+    def test_query_count_is_constant(self):
+        for days in (3, 60):
+            Detection.objects.all().delete()
+            self.create_history(days)
+            with self.assertNumQueries(self.STATS_QUERIES):
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_count'], days)
+            self.assertEqual(response.data['fake_count'], days // 2)
+            self.assertEqual(response.data['failed_count'], len(range(0, days, 3)))
+            self.assertEqual(response.data['today_detections'], 1)
+            self.assertEqual([d['count'] for d in response.data['weekly_trend']][-min(days, 7):], [1] * min(days, 7))
+
+    def test_trend_falls_back_to_last_active_week(self):
+        detection = Detection.objects.create(user=self.user, title='old news', content='content')
+        Detection.objects.filter(pk=detection.pk).update(created_at=timezone.now() - timedelta(days=30))
+        with self.assertNumQueries(self.STATS_QUERIES):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['pending_count'], 1)
+        self.assertEqual(response.data['today_detections'], 0)
+        self.assertEqual([d['count'] for d in response.data['weekly_trend']], [1])
+
+    def test_empty_history(self):
+        with self.assertNumQueries(self.STATS_QUERIES - 1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['total_count'], 0)
+
+
+class DetectionDailyStatsTests(TestCase):
+    """
+    每日统计汇总表随检测状态变化增量更新，结果与重建一致
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='rollup', password='rollup-password')
+
+    def rollup_rows(self):
+        return sorted(DetectionDailyStats.objects.values_list(
+            'scope', 'day', 'completed_count', 'failed_count', 'fake_count', 'real_count', 'confidence_sum'))
+
+    def test_incremental_updates_match_rebuild(self):
+        first = Detection.objects.create(user=self.user, title='a', content='a')
+        second = Detection.objects.create(user=self.user, title='b', content='b')
+        self.assertFalse(DetectionDailyStats.objects.exists())
+
+        first.status = Detection.STATUS_PROCESSING
+        first.save()
+        first.status, first.result, first.confidence_score = Detection.STATUS_COMPLETED, Detection.RESULT_FAKE, 0.9
+        first.save()
+        second.status = Detection.STATUS_FAILED
+        second.save()
+        # 重新加载后再次保存 (结果不变) 不会重复计数
+        Detection.objects.get(pk=first.pk).save()
+
+        scope = DetectionDailyStats.scope_for(self.user.pk)
+        rollup = DetectionDailyStats.objects.get(scope=scope)
+        self.assertEqual((rollup.completed_count, rollup.failed_count, rollup.fake_count), (1, 1, 1))
+        self.assertAlmostEqual(rollup.confidence_sum, 0.9)
+        incremental = self.rollup_rows()
+        rebuild_daily_stats()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+        Detection.objects.filter(pk=first.pk).delete()
+        rollup = DetectionDailyStats.objects.get(scope=DetectionDailyStats.GLOBAL_SCOPE)
+        self.assertEqual((rollup.completed_count, rollup.failed_count, rollup.fake_count), (0, 1, 0))
+
+    def test_local_day_is_computed_in_python(self):
+        # 北京时间 10-19 凌晨 (UTC 仍是 10-18)，按本地日期归入 10-19
+        created_at = timezone.make_aware(datetime(2026, 10, 19, 1, 30))
+        done = Detection.objects.create(user=self.user, title='a', content='a', status=Detection.STATUS_COMPLETED,
+                                        result=Detection.RESULT_FAKE, confidence_score=0.8)
+        pending = Detection.objects.create(user=self.user, title='b', content='b')
+        Detection.objects.filter(pk__in=[done.pk, pending.pk]).update(created_at=created_at)
+
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_daily_stats()
+            in_progress = in_progress_counts(Detection.objects.all())
+        self.assertEqual(set(DetectionDailyStats.objects.values_list('day', flat=True)), {date(2026, 10, 19)})
+        self.assertEqual(in_progress, [{'day': date(2026, 10, 19), 'status': Detection.STATUS_PENDING,
+                                        'result': Detection.RESULT_UNKNOWN, 'count': 1}])
+        # 不使用数据库的时区转换 (MySQL 未加载时区表时 CONVERT_TZ 返回 NULL)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('CONVERT_TZ', sql)
+        self.assertNotIn('django_datetime_cast_date', sql)
+
+
+class DetectionCursorPaginationTests(TestCase):
+    """
+    ?pagination=cursor 的键集分页: 相同 created_at 的记录按 id 稳定排序，新记录不影响后续翻页
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pager', password='pager-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('detection-list')
+        created_at = timezone.now()
+        for n in range(7):
+            Detection.objects.create(user=self.user, title=f'news {n}', content='content')
+        # 制造时间戳相同的记录
+        Detection.objects.filter(user=self.user).update(created_at=created_at)
+        self.expected = list(Detection.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_walks_forward_and_back(self):
+        response = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 3})
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        pages = [self.ids(response)]
+        # 翻页过程中新建的记录不会让后面的页重复或跳过记录
+        Detection.objects.create(user=self.user, title='newer', content='content')
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(self.ids(response))
+        self.assertEqual(sum(pages, []), self.expected)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), pages[-2])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'pagination': 'cursor', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], len(self.expected))
+
+
+class DetectionListSerializerTests(TestCase):
+    """
+    列表接口返回精简字段，查询次数与用户数无关，不加载完整正文和分析结果
+    """
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            username='admin', email='admin@example.com', password='admin-password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('detection-list')
+        for n in range(5):
+            user = get_user_model().objects.create_user(username=f'user{n}', email=f'user{n}@example.com', password='user-password')
+            Detection.objects.create(
+                user=user, title=f'news {n}', content='x' * 500,
+                analysis_result={'llm_raw': 'y' * 1000},
+            )
+
+    def test_list_is_compact(self):
+        # 分页计数 + 一页记录 (用户通过 JOIN 一起查询)
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get(self.url)
+        page_sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('analysis_result', page_sql)
+        row = response.data['results'][0]
+        self.assertNotIn('analysis_result', row)
+        self.assertNotIn('content', row)
+        self.assertEqual(len(row['content_preview']), 120)
+        self.assertTrue(row['user'].startswith('user'))
+
+        detail = self.client.get(reverse('detection-detail', args=[row['id']]))
+        self.assertEqual(detail.data['analysis_result'], {'llm_raw': 'y' * 1000})
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(self.url, {'fields': 'id,title,content'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'content'})
+        self.assertEqual(len(response.data['results'][0]['content']), 500)
+
+        response = self.client.get(self.url, {'fields': 'id,analysis_result'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DetectionVerificationTests(TestCase):
+    """
+    逐模型的 LLM 验证结果存入 DetectionVerification，analysis_result 只保留汇总
+    """
+    LLM_DETAILS = {
+        'overall_verdict': 'Likely Fake',
+        'aggregated_confidence': 0.9,
+        'needs_manual_review': False,
+        'text_verifications': [
+            {'model': 'text-a', 'success': True, 'verdict': '虚假', 'confidence': 0.9, 'reason': 'reason a', 'error': None, 'raw_response': None},
+            {'model': 'text-b', 'success': False, 'verdict': 'Error', 'confidence': 'n/a', 'reason': None, 'error': 'timeout', 'raw_response': 'raw'},
+        ],
+        'image_verifications': [
+            {'model': 'vision', 'success': True, 'verdict': '真实', 'confidence': 0.6, 'reason': 'reason c', 'error': None, 'raw_response': None},
+        ],
+    }
+
+    def test_split_details(self):
+        summary, records = DetectionVerification.split_details(self.LLM_DETAILS)
+        self.assertEqual(summary, {
+            'overall_verdict': 'Likely Fake',
+            'aggregated_confidence': 0.9,
+            'needs_manual_review': False,
+            'verification_counts': {'text': 2, 'image': 1},
+        })
+        self.assertEqual([(r.kind, r.position, r.model, r.confidence) for r in records], [
+            ('text', 0, 'text-a', 0.9), ('text', 1, 'text-b', 0.0), ('image', 2, 'vision', 0.6),
+        ])
+        self.assertEqual(DetectionVerification.split_details(None), (None, []))
+
+    def test_verifications_endpoint(self):
+        user = get_user_model().objects.create_user(username='verify', password='verify-password')
+        summary, records = DetectionVerification.split_details(self.LLM_DETAILS)
+        detection = Detection.objects.create(
+            user=user, title='news', content='content',
+            analysis_result={'llm_verification': {'details': summary}},
+        )
+        for record in records:
+            record.detection = detection
+        DetectionVerification.objects.bulk_create(records)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse('detection-verifications', args=[detection.pk]))
+        self.assertEqual([row['model'] for row in response.data], ['text-a', 'text-b', 'vision'])
+        self.assertEqual(response.data[1]['error'], 'timeout')
+
+
+class DetectionSearchTests(TestCase):
+    """
+    全文检索: 二元组分词与 MySQL ngram 解析器一致，按相关度排序，支持过滤，索引随记录修改和删除增量同步
+    """
+
+    def setUp(self):
+        get_search_index().clear()
+        self.user = get_user_model().objects.create_user(username='searcher', email='searcher@example.com', password='searcher-password')
+        self.other = get_user_model().objects.create_user(username='other', email='other@example.com', password='other-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('detection-search')
+        self.in_title = Detection.objects.create(
+            user=self.user, title='网传疫苗致病', content='专家表示该说法没有依据',
+            status=Detection.STATUS_COMPLETED, result=Detection.RESULT_FAKE,
+        )
+        self.in_content = Detection.objects.create(
+            user=self.user, title='卫健委通报', content='本地新增接种点，疫苗供应充足',
+            status=Detection.STATUS_COMPLETED, result=Detection.RESULT_REAL,
+        )
+        self.unrelated = Detection.objects.create(user=self.user, title='地震演练', content='学校组织疏散演练')
+        Detection.objects.create(user=self.other, title='疫苗谣言', content='疫苗')
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_ngram_tokens(self):
+        self.assertEqual(ngram_tokens('疫苗谣言'), ['疫苗', '苗谣', '谣言'])
+        self.assertEqual(ngram_tokens('AB c, 新'), ['ab', 'c', '新'])
+
+    def test_ranking_and_filters(self):
+        response = self.client.get(self.url, {'q': '疫苗'})
+        self.assertEqual(response.data['count'], 2)
+        # 标题命中的记录排在前面，只检索自己的记录
+        self.assertEqual(self.ids(response), [self.in_title.pk, self.in_content.pk])
+        self.assertGreater(response.data['results'][0]['score'], response.data['results'][1]['score'])
+        # 与列表接口相同的精简表示
+        self.assertIn('content_preview', response.data['results'][0])
+        self.assertNotIn('analysis_result', response.data['results'][0])
+        self.assertNotIn('content', response.data['results'][0])
+
+        response = self.client.get(self.url, {'q': '疫苗', 'result': Detection.RESULT_REAL})
+        self.assertEqual(self.ids(response), [self.in_content.pk])
+        response = self.client.get(self.url, {'q': '疫苗 专家'})
+        self.assertEqual(self.ids(response), [self.in_title.pk])
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {'q': '疫苗', 'created_after': tomorrow})
+        self.assertEqual(response.data['count'], 0)
+
+        self.assertEqual(self.client.get(self.url, {'q': ' '}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': '疫苗', 'status': 'done'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': '疫苗', 'created_before': '2026-13-01'}).status_code, 400)
+
+    def test_rows_do_not_load_analysis_result(self):
+        Detection.objects.filter(pk=self.in_title.pk).update(analysis_result={'llm_raw': 'y' * 1000})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'q': '疫苗'})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertFalse([query['sql'] for query in queries if 'analysis_result' in query['sql']])
+
+        response = self.client.get(self.url, {'q': '疫苗', 'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'score'})
+        response = self.client.get(self.url, {'q': '疫苗', 'fields': 'id,analysis_result'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.assertEqual(self.ids(self.client.get(self.url, {'q': '演练'})), [self.unrelated.pk])
+        self.unrelated.title = '疫苗接种演练'
+        self.unrelated.save()
+        self.in_title.delete()
+        response = self.client.get(self.url, {'q': '疫苗'})
+        self.assertEqual(sorted(self.ids(response)), sorted([self.in_content.pk, self.unrelated.pk]))
+        self.assertEqual(self.client.get(self.url, {'q': '地震'}).data['count'], 0)
+
+    def test_index_picks_up_late_commits(self):
+        self.client.get(self.url, {'q': '疫苗'})
+        # 其他进程的事务晚于已同步的记录提交: updated_at 早于索引的同步时间戳
+        stamp = Detection.objects.get(pk=self.in_content.pk).updated_at
+        late = Detection.objects.create(user=self.user, title='疫苗晚提交', content='content')
+        Detection.objects.filter(pk=late.pk).update(updated_at=stamp - timedelta(hours=1))
+        Detection.objects.filter(pk=self.unrelated.pk).update(title='疫苗演练', updated_at=stamp - timedelta(seconds=1))
+        response = self.client.get(self.url, {'q': '疫苗'})
+        self.assertEqual(sorted(self.ids(response)), sorted([self.in_title.pk, self.in_content.pk, late.pk, self.unrelated.pk]))
+
+    def test_pagination(self):
+        response = self.client.get(self.url, {'q': '疫苗', 'page_size': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.ids(response), [self.in_content.pk])
+        self.assertIsNone(response.data['next'])
+
+
+class NearDuplicateIndexTests(TestCase):
+    """
+    MinHash LSH 近似重复索引: 改动标点和个别字词的转发能命中，只索引已完成的检测，随修改和删除同步
+    """
+    ORIGINAL = ('紧急通知：明天起全市停水三天', '自来水公司发布消息，因管道检修，全市将于明天起停水三天，请市民提前储水，转发告知亲友。')
+    REPOST = ('紧急通知!!明天起全市停水三天', '自来水公司发布消息,因管道检修,全市将于明天起停水三天,请广大市民提前储水，转发告知亲友')
+
+    def setUp(self):
+        get_duplicate_index().clear()
+        self.user = get_user_model().objects.create_user(username='dup', email='dup@example.com', password='dup-password')
+        self.original = Detection.objects.create(
+            user=self.user, title=self.ORIGINAL[0], content=self.ORIGINAL[1],
+            status=Detection.STATUS_COMPLETED, result=Detection.RESULT_FAKE, confidence_score=0.9,
+        )
+        Detection.objects.create(
+            user=self.user, title='学校组织地震疏散演练', content='本周五上午全校师生参加地震应急疏散演练。',
+            status=Detection.STATUS_COMPLETED, result=Detection.RESULT_REAL,
+        )
+
+    def test_signature_similarity(self):
+        original = minhash_signature(' '.join(self.ORIGINAL))
+        self.assertGreater((original == minhash_signature(' '.join(self.REPOST))).mean(), 0.8)
+        self.assertLess((original == minhash_signature('学校组织地震疏散演练')).mean(), 0.2)
+        self.assertIsNone(minhash_signature(' ，。'))
+
+    def test_finds_reposts(self):
+        matches = find_near_duplicates(*self.REPOST, threshold=0.8)
+        self.assertEqual([match['detection_id'] for match in matches], [self.original.pk])
+        self.assertEqual(matches[0]['result'], Detection.RESULT_FAKE)
+        self.assertFalse(matches[0]['has_image'])
+        self.assertEqual(find_near_duplicates(*self.REPOST, threshold=0.8, exclude=self.original.pk), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.assertEqual(len(find_near_duplicates(*self.REPOST, threshold=0.8)), 1)
+        self.original.status = Detection.STATUS_PROCESSING
+        self.original.save()
+        self.assertEqual(find_near_duplicates(*self.REPOST, threshold=0.8), [])
+
+        self.original.status = Detection.STATUS_COMPLETED
+        self.original.save()
+        self.assertEqual(len(find_near_duplicates(*self.REPOST, threshold=0.8)), 1)
+        self.original.delete()
+        self.assertEqual(find_near_duplicates(*self.REPOST, threshold=0.8), [])
+        self.assertEqual(len(get_duplicate_index()), 1)
+
+    def test_index_picks_up_late_commits(self):
+        Detection.objects.filter(pk=self.original.pk).update(status=Detection.STATUS_PROCESSING)
+        # 规范化后没有文本的记录不进入索引，也不应导致每次同步都重新读取
+        Detection.objects.create(user=self.user, title='！！', content='', status=Detection.STATUS_COMPLETED)
+        self.assertEqual(find_near_duplicates(*self.REPOST, threshold=0.8), [])
+        index = get_duplicate_index()
+        self.assertEqual((len(index), len(index.unindexed)), (1, 1))
+
+        # 其他进程的事务晚于已同步的记录提交: updated_at 早于索引的同步时间戳
+        stamp = Detection.objects.get(pk=self.original.pk).updated_at
+        Detection.objects.filter(pk=self.original.pk).update(
+            status=Detection.STATUS_COMPLETED, updated_at=stamp - timedelta(hours=1))
+        self.assertEqual([match['detection_id'] for match in find_near_duplicates(*self.REPOST, threshold=0.8)],
+                         [self.original.pk])
+
+    def check_repost(self, user):
+        """ 由检测器对 user 提交的转发做近似重复预检 (开启沿用结论)，返回 (检测器, 预检结果, 沿用的匹配) """
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSettings.set_value('near_duplicate_reuse', True)
+        repost = Detection.objects.create(user=user, title=self.REPOST[0], content=self.REPOST[1])
+        detector = make_detector(repost.pk)
+        return (detector, *detector._check_near_duplicates())
+
+    def test_detector_keeps_own_matches(self):
+        _, near_duplicate, best = self.check_repost(self.user)
+        self.assertEqual(best['detection_id'], self.original.pk)
+        self.assertEqual(near_duplicate['matches'][0]['detection_id'], self.original.pk)
+        self.assertEqual(near_duplicate['reused_from'], self.original.pk)
+
+    def test_detector_hides_other_users_matches(self):
+        other = get_user_model().objects.create_user(username='dup-other', email='dup-other@example.com',
+                                                     password='dup-password')
+        detector, near_duplicate, best = self.check_repost(other)
+        # 沿用判断仍使用其他用户的检测，但保存的结果不包含其 ID 和时间
+        self.assertEqual(best['detection_id'], self.original.pk)
+        self.assertEqual(near_duplicate['matches'], [{'similarity': best['similarity'], 'result': Detection.RESULT_FAKE}])
+        self.assertIsNone(near_duplicate['reused_from'])
+
+        detector._reuse_near_duplicate(near_duplicate, best, time.time())
+        repost = Detection.objects.get(pk=detector.detection_id)
+        self.assertEqual(repost.result, Detection.RESULT_FAKE)
+        saved = json.dumps(repost.analysis_result)
+        self.assertNotIn('detection_id', saved)
+        self.assertNotIn(f'detection {self.original.pk}', saved)
+        self.assertNotIn(self.original.created_at.isoformat(), saved)
+
+
+def make_test_image(seed, size=(320, 240)):
+    """ 随机色块组成的测试图像 """
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 120)],
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return image
+
+
+def make_detector(detection_id):
+    """ 不加载模型的检测器 (模型注册表返回空快照) """
+    from detection.services.detector import FakeNewsDetector
+
+    bundle = {'version': None, 'device': 'cpu', 'model': None, 'tokenizer': None, 'image_transform': None}
+    with mock.patch('detection.services.detector.get_registry') as registry:
+        registry.return_value.snapshot.return_value = bundle
+        return FakeNewsDetector(detection_id)
+
+
+def image_upload(image, name='news.jpg', quality=90):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageHashTests(SimpleTestCase):
+    """
+    感知哈希对缩放和重新压缩稳定，多索引哈希表的查询结果与逐个比较一致
+    """
+
+    def test_hashes_survive_resize_and_recompression(self):
+        image = make_test_image(1)
+        buffer = BytesIO()
+        image.resize((200, 150)).save(buffer, format='JPEG', quality=40)
+        repost = Image.open(BytesIO(buffer.getvalue())).convert('RGB')
+        original_phash, original_dhash = compute_hashes(image)
+        repost_phash, repost_dhash = compute_hashes(repost)
+        self.assertLessEqual(hamming_distance(original_phash, repost_phash), 6)
+        self.assertLessEqual(hamming_distance(original_dhash, repost_dhash), 10)
+        self.assertGreater(hamming_distance(original_phash, compute_hashes(make_test_image(2))[0]), 16)
+
+    def test_multi_index_matches_brute_force(self):
+        rng = random.Random(0)
+        index = HammingIndex()
+        hashes = {}
+        base = rng.getrandbits(64)
+        for pk in range(1, 2001):
+            # 一半是 base 翻转少量位，一半是随机值
+            value = base ^ sum(1 << bit for bit in rng.sample(range(64), rng.randrange(12))) if pk % 2 else rng.getrandbits(64)
+            hashes[pk] = value
+            index.add(pk, value, 0)
+        for radius in (0, 3, 8, 11):
+            expected = sorted((hamming_distance(value, base), pk) for pk, value in hashes.items()
+                              if hamming_distance(value, base) <= radius)
+            self.assertEqual([(distance, pk) for pk, distance, _ in index.query(base, radius)], expected)
+        self.assertEqual(to_signed((1 << 64) - 1), -1)
+
+
+@unittest.skipUnless(importlib.util.find_spec('torchvision'), 'torchvision 未安装')
+class FastImagePreprocessorTests(SimpleTestCase):
+    """
+    快速图像预处理与其替代的 torchvision 变换 (get_image_transforms) 输出一致
+    draft 解码先在 DCT 域缩小，只要求平均误差很小
+    """
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'news.jpg')
+        make_test_image(5, size=(1600, 1200)).save(self.path, quality=90)
+
+    def preprocess(self, use_draft):
+        from detection.ml.data_utils import get_image_transforms
+        from detection.ml.fast_image import FastImagePreprocessor
+
+        preprocessor = FastImagePreprocessor.for_backbone(settings.IMAGE_MODEL_NAME, settings.IMAGE_MODEL_INPUT_SIZE,
+                                                          use_draft=use_draft)
+        images, available = preprocessor.to_batch([preprocessor.load(self.path), None], 'cpu')
+        with Image.open(self.path) as image:
+            expected = get_image_transforms(settings.IMAGE_MODEL_NAME, settings.IMAGE_MODEL_INPUT_SIZE)(image.convert('RGB'))
+        self.assertEqual(available.tolist(), [True, False])
+        self.assertEqual(float(images[1].abs().max()), 0.0)
+        return (images[0] - expected).abs()
+
+    def test_matches_torchvision_without_draft(self):
+        self.assertLess(float(self.preprocess(use_draft=False).max()), 1e-4)
+
+    def test_draft_close_to_torchvision(self):
+        self.assertLess(float(self.preprocess(use_draft=True).mean()), 0.01)
+
+    def test_loaders_apply_exif_orientation(self):
+        from detection.ml.data_utils import get_image_transforms, preprocess_image
+        from detection.ml.fast_image import FastImagePreprocessor
+
+        # 像素按横向存储，EXIF 方向 6 表示显示时顺时针旋转 90 度 (竖向)
+        upright = make_test_image(6, size=(600, 900))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        path = os.path.join(tempfile.mkdtemp(), 'rotated.jpg')
+        upright.transpose(Image.Transpose.ROTATE_90).save(path, quality=95, exif=exif)
+
+        preprocessor = FastImagePreprocessor.for_backbone(settings.IMAGE_MODEL_NAME, settings.IMAGE_MODEL_INPUT_SIZE,
+                                                          use_draft=False)
+        expected = preprocessor.from_image(upright).astype(np.float32)
+        self.assertLess(np.abs(preprocessor.load(path).astype(np.float32) - expected).mean(), 4)
+
+        transform = get_image_transforms(settings.IMAGE_MODEL_NAME, settings.IMAGE_MODEL_INPUT_SIZE)
+        image, available = preprocess_image(path, transform, 'cpu')
+        self.assertTrue(bool(available[0]))
+        self.assertLess(float((image[0] - transform(upright)).abs().mean()), 0.05)
+
+
+@override_settings(IMAGE_MODEL_INPUT_SIZE=224, LLM_IMAGE_MAX_SIDE=256)
+class ImageArtifactTests(SimpleTestCase):
+    """
+    上传的 JPEG 只在启用 JPEG_DRAFT_DECODING 时以 draft 模式缩小解码
+    """
+
+    def test_draft_decoding_follows_setting(self):
+        upload = image_upload(make_test_image(3, size=(2000, 1600)))
+        with override_settings(JPEG_DRAFT_DECODING=True):
+            self.assertEqual(ImageArtifact.open(upload).size, (500, 400))
+        with override_settings(JPEG_DRAFT_DECODING=False):
+            self.assertEqual(ImageArtifact.open(upload).size, (2000, 1600))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_MATCH_MAX_DISTANCE=8)
+class ImageMatchApiTests(TestCase):
+    """
+    similar_images / image_lookup 接口: 返回重新发布的已知图像，普通用户看不到其他用户的检测记录
+    """
+
+    def setUp(self):
+        get_image_index().clear()
+        self.user = get_user_model().objects.create_user(username='img', email='img@example.com', password='img-password')
+        self.other = get_user_model().objects.create_user(username='img2', email='img2@example.com', password='img-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.image = make_test_image(7)
+        self.original = Detection.objects.create(
+            user=self.other, title='原图', content='content', image=image_upload(self.image),
+            status=Detection.STATUS_COMPLETED, result=Detection.RESULT_FAKE,
+        )
+        record_detection_image(self.original, self.image)
+        phash_value, dhash_value = compute_hashes(self.image.resize((160, 120)))
+        ImageFingerprint.objects.create(
+            source=ImageFingerprint.SOURCE_DATASET, dataset_path='processed/images/a.jpg',
+            label=Detection.RESULT_FAKE, phash=to_signed(phash_value), dhash=to_signed(dhash_value),
+        )
+        self.repost = Detection.objects.create(
+            user=self.user, title='转发', content='content', image=image_upload(self.image, quality=50),
+        )
+
+    def test_similar_images(self):
+        # 没有指纹时从存储的图像计算
+        response = self.client.get(reverse('detection-similar-images', args=[self.repost.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['source'] for match in response.data], [ImageFingerprint.SOURCE_DATASET])
+        self.assertEqual(response.data[0]['label'], Detection.RESULT_FAKE)
+        self.assertTrue(ImageFingerprint.objects.filter(detection=self.repost).exists())
+
+        staff = get_user_model().objects.create_user(
+            username='staff', email='staff@example.com', password='staff-password', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get(reverse('detection-similar-images', args=[self.repost.pk]))
+        self.assertEqual({match['detection_id'] for match in response.data}, {self.original.pk, None})
+
+        response = self.client.get(reverse('detection-similar-images', args=[self.repost.pk]), {'radius': 99})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detector_hides_other_users_matches(self):
+        detector = make_detector(self.repost.pk)
+        image_match = detector._check_image_matches(open_image_artifact(self.repost.image.path))
+        self.assertEqual(image_match['fake_count'], 2)
+        self.assertEqual(sorted(image_match['matches'], key=lambda match: match['source']), [
+            {'source': ImageFingerprint.SOURCE_DATASET, 'detection_id': None, 'dataset_path': 'processed/images/a.jpg',
+             'label': Detection.RESULT_FAKE, 'confidence_score': None,
+             'distance': mock.ANY, 'dhash_distance': mock.ANY},
+            {'source': ImageFingerprint.SOURCE_DETECTION, 'label': Detection.RESULT_FAKE,
+             'distance': mock.ANY, 'dhash_distance': mock.ANY},
+        ])
+
+        # 本用户自己的检测保留完整信息
+        own = Detection.objects.create(
+            user=self.user, title='再次转发', content='content', image=image_upload(self.image, quality=70),
+        )
+        image_match = make_detector(own.pk)._check_image_matches(open_image_artifact(own.image.path))
+        self.assertIn(self.repost.pk, [match.get('detection_id') for match in image_match['matches']])
+
+    def test_index_picks_up_late_commits(self):
+        index = get_image_index()
+        index.refresh()
+        phash_value, dhash_value = compute_hashes(make_test_image(9))
+
+        def fingerprint(pk):
+            return ImageFingerprint.objects.create(
+                pk=pk, source=ImageFingerprint.SOURCE_DATASET, dataset_path=f'processed/images/{pk}.jpg',
+                phash=to_signed(phash_value), dhash=to_signed(dhash_value),
+            )
+
+        # 并发事务中主键较小的指纹晚于主键较大的指纹提交
+        newest = fingerprint(index.watermark + 5000).pk
+        index.refresh()
+        # 回看窗口内
+        fingerprint(newest - 10)
+        index.refresh()
+        self.assertEqual({pk for pk, _, _ in index.query(phash_value, 0)}, {newest, newest - 10})
+        # 窗口之外: 记录数不一致时补上
+        with mock.patch('detection.services.image_hash.SYNC_PK_LAG', 0):
+            fingerprint(newest - 4000)
+            index.refresh()
+        self.assertEqual({pk for pk, _, _ in index.query(phash_value, 0)}, {newest, newest - 10, newest - 4000})
+
+    def test_image_lookup(self):
+        url = reverse('detection-image-lookup')
+        response = self.client.post(url, {'image': image_upload(self.image.resize((256, 192)))}, format='multipart')
+        self.assertEqual([match['dataset_path'] for match in response.data], ['processed/images/a.jpg'])
+        response = self.client.post(url, {'image': image_upload(make_test_image(8))}, format='multipart')
+        self.assertEqual(response.data, [])
+        response = self.client.post(url, {'image': SimpleUploadedFile('a.jpg', b'not an image')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class EmbeddingIndexTests(TestCase):
+    """
+    融合特征相似度索引: flat 结果与暴力计算一致，ivfpq 重排后找回最近邻，增量同步新增和删除的特征
+    """
+
+    def setUp(self):
+        self.version = 'test-version'
+        get_embedding_index(self.version).clear()
+        self.user = get_user_model().objects.create_user(username='emb', email='emb@example.com', password='emb-password')
+        rng = np.random.RandomState(0)
+        topics = rng.randn(8, 32)
+        self.vectors = topics[rng.randint(8, size=600)] + 0.5 * rng.randn(600, 32)
+        FeatureEmbedding.objects.bulk_create([
+            FeatureEmbedding(
+                source=FeatureEmbedding.SOURCE_DATASET, dataset_id=str(i), text=f'条目 {i}',
+                label=Detection.RESULT_FAKE if i % 2 else Detection.RESULT_REAL,
+                model_version=self.version, dim=32, vector=encode_vector(vector),
+            )
+            for i, vector in enumerate(self.vectors)
+        ])
+        self.detection = Detection.objects.create(user=self.user, title='查询', content='content')
+        self.query = record_detection_embedding(self.detection, self.version, self.vectors[5] + 0.05 * rng.randn(32))
+
+    def expected(self, k):
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        query = np.frombuffer(self.query.vector, dtype=np.float16).astype(np.float32)
+        return [str(i) for i in top_k(normalized @ query, k).tolist()]
+
+    def test_flat_matches_brute_force(self):
+        cases = find_similar_cases(self.query, k=10)
+        self.assertEqual(cases['index'], 'flat')
+        found = [item['dataset_id'] for item in cases['training_items']]
+        self.assertEqual(found[0], '5')
+        # float16 存储只影响并列附近的次序
+        self.assertGreaterEqual(len(set(found) & set(self.expected(10))), 9)
+        self.assertEqual(cases['detections'], [])
+
+    @override_settings(EMBEDDING_INDEX='ivfpq', EMBEDDING_IVF_MIN_ROWS=100, EMBEDDING_IVF_LISTS=8,
+                       EMBEDDING_IVF_PROBE=4, EMBEDDING_PQ_SUBVECTORS=8)
+    def test_ivfpq_rerank(self):
+        cases = find_similar_cases(self.query, k=10)
+        self.assertEqual(cases['index'], 'ivfpq')
+        found = [item['dataset_id'] for item in cases['training_items']]
+        self.assertEqual(found[0], '5')
+        self.assertGreaterEqual(len(set(found) & set(self.expected(10))), 8)
+        similarities = [item['similarity'] for item in cases['training_items']]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+    def test_incremental_refresh(self):
+        find_similar_cases(self.query, k=5)
+        other = Detection.objects.create(user=self.user, title='相似的检测', content='content',
+                                         result=Detection.RESULT_FAKE)
+        record_detection_embedding(other, self.version, self.vectors[5])
+        cases = find_similar_cases(self.query, k=5)
+        self.assertEqual([item['detection_id'] for item in cases['detections']], [other.pk])
+        # 只返回指定用户的检测记录
+        stranger = get_user_model().objects.create_user(username='emb2', email='emb2@example.com', password='emb-password')
+        self.assertEqual(find_similar_cases(self.query, k=5, user=stranger)['detections'], [])
+
+        FeatureEmbedding.objects.filter(dataset_id='5').delete()
+        cases = find_similar_cases(self.query, k=5)
+        self.assertNotIn('5', [item['dataset_id'] for item in cases['training_items']])
+        self.assertEqual(len(get_embedding_index(self.version)), 601)
+
+    def test_index_picks_up_late_commits(self):
+        index = get_embedding_index(self.version)
+        find_similar_cases(self.query, k=5)
+
+        def embedding(pk, vector):
+            return FeatureEmbedding.objects.create(
+                pk=pk, source=FeatureEmbedding.SOURCE_DATASET, dataset_id=f'late-{pk}', model_version=self.version,
+                dim=32, vector=encode_vector(vector),
+            )
+
+        # 并发事务中主键较小的特征晚于主键较大的特征提交
+        newest = embedding(index.watermark + 5000, self.vectors[7]).pk
+        find_similar_cases(self.query, k=5)
+        embedding(newest - 10, self.vectors[5])
+        with mock.patch('detection.services.embedding_index.SYNC_PK_LAG', 0):
+            embedding(newest - 4000, self.vectors[5])
+            find_similar_cases(self.query, k=5)
+        self.assertEqual(len(index), 604)
+        found = [item['dataset_id'] for item in find_similar_cases(self.query, k=3)['training_items']]
+        # 与条目 5 的特征相同
+        self.assertEqual(set(found), {'5', f'late-{newest - 10}', f'late-{newest - 4000}'})
+
+    def test_uses_serving_model_version(self):
+        # 切换版本期间生效版本已变化，仍使用当前服务中的版本已保存的特征，不重新推理
+        registry = get_registry()
+        with mock.patch.object(registry, 'bundle', {'version': self.version}), mock.patch.object(registry, 'refresh'), \
+                mock.patch('detection.services.detection_service.compute_detection_features', side_effect=AssertionError):
+            cases = detection_service.find_similar_cases(self.detection, k=3)
+        self.assertEqual(cases['model_version'], self.version)
+        self.assertEqual(cases['training_items'][0]['dataset_id'], '5')
+
+    def test_similar_api(self):
+        get_embedding_index(get_active_version()[0]).clear()
+        record_detection_embedding(self.detection, get_active_version()[0], self.vectors[5])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('detection-similar', args=[self.detection.pk])
+        response = client.get(url, {'k': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['training_items'], [])
+        self.assertEqual(client.get(url, {'k': 0}).status_code, 400)
+        self.assertEqual(client.get(url, {'k': 'x'}).status_code, 400)
@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DetectionViewSet
+from .views import DetectionViewSet, ReadinessView, MemoryReportView, ShadowStatusView
 
 router = DefaultRouter()
 router.register(r'detections', DetectionViewSet, basename='detection')
 
 urlpatterns = [
+    path('health/ready', ReadinessView.as_view(), name='detection-health-ready'),
+    path('health/memory', MemoryReportView.as_view(), name='detection-health-memory'),
+    path('health/shadow', ShadowStatusView.as_view(), name='detection-health-shadow'),
     path('', include(router.urls)),
 ]
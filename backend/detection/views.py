@@ -2,22 +2,36 @@
 检测应用视图
 """
 import logging
-from django.db.models import Count, Avg, Q, F, Sum, Case, When, Value, IntegerField
+from datetime import datetime, time, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
 from .models import Detection
+from .pagination import DETECTION_ORDERING, DetectionCursorPagination, use_cursor_pagination
 from .serializers import (
-    DetectionSerializer, DetectionCreateSerializer, 
-    DetectionResultSerializer, DetectionStatSerializer
+    DetectionSerializer, DetectionListSerializer, DetectionCreateSerializer,
+    DetectionResultSerializer, DetectionVerificationSerializer, DetectionStatSerializer
 )
-from .services.detector import FakeNewsDetector
-from django.db.models.functions import TruncDate
-from datetime import timedelta, datetime
+from .services.detection_service import (
+    run_detection, prepare_image_artifact, get_readiness, get_memory_report, get_shadow_status,
+    find_similar_images, lookup_image, find_similar_cases
+)
+from .services.search import search_detections
+from .services.stats import compute_detection_stats
 
 logger = logging.getLogger(__name__)
 
+# similar_images / image_lookup 允许的最大 pHash 汉明距离
+MAX_IMAGE_MATCH_RADIUS = 16
+# similar 每类最多返回的条数
+MAX_SIMILAR_CASES = 50
+
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     对象级权限，只允许对象的所有者编辑
@@ -34,6 +48,37 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         # 写入权限只允许对象的所有者
         return obj.user == request.user
 
+class ReadinessView(APIView):
+    """
+    就绪探针
+    模型预热完成前返回 503，负载均衡器据此避免把流量发往冷启动的工作进程
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        registry_status = get_readiness()
+        http_status = status.HTTP_200_OK if registry_status['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(registry_status, status=http_status)
+
+class MemoryReportView(APIView):
+    """
+    当前工作进程的内存报告 (独占内存与共享内存)，仅管理员可访问
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_memory_report())
+
+class ShadowStatusView(APIView):
+    """
+    当前工作进程的影子推理统计 (已提交/完成/各类丢弃次数、剩余 CPU 预算)，仅管理员可访问
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_shadow_status())
+
 class DetectionViewSet(viewsets.ModelViewSet):
     """
     检测记录视图集
@@ -41,6 +86,8 @@ class DetectionViewSet(viewsets.ModelViewSet):
     queryset = Detection.objects.all()
     serializer_class = DetectionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    # 使用精简的列表序列化器、支持 ?fields= 的操作
+    list_actions = ('list', 'my_detections', 'search')
     
     def get_queryset(self):
         """
@@ -49,8 +96,29 @@ class DetectionViewSet(viewsets.ModelViewSet):
         user = self.request.user
         # 管理员可以查看所有记录，普通用户只能查看自己的记录
         if user.is_staff:
-            return Detection.objects.all()
-        return Detection.objects.filter(user=user)
+            queryset = Detection.objects.order_by(*DETECTION_ORDERING)
+        else:
+            queryset = Detection.objects.filter(user=user).order_by(*DETECTION_ORDERING)
+        # 列表只查询返回的列，不加载正文和完整分析结果
+        if self.action in self.list_actions:
+            return DetectionListSerializer.optimize_queryset(queryset, self.list_fields())
+        return queryset.select_related('user')
+
+    def list_fields(self):
+        """ 列表返回的字段 (?fields=) """
+        if not hasattr(self, '_list_fields'):
+            self._list_fields = DetectionListSerializer.resolve_fields(self.request.query_params.get('fields'))
+        return self._list_fields
+
+    @property
+    def paginator(self):
+        """ ?pagination=cursor 时使用键集分页，否则使用默认的页码分页 (见 pagination.py) """
+        if not hasattr(self, '_paginator'):
+            if use_cursor_pagination(self.request):
+                self._paginator = DetectionCursorPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
     
     def get_serializer_class(self):
         """
@@ -62,9 +130,16 @@ class DetectionViewSet(viewsets.ModelViewSet):
             return DetectionCreateSerializer
         if self.action == 'get_stats':
             return DetectionStatSerializer
-        # 对于 list, retrieve, update, partial_update, destroy 等，使用默认的 DetectionSerializer
+        if self.action in self.list_actions:
+            return DetectionListSerializer
+        # 对于 retrieve, update, partial_update, destroy 等，使用默认的 DetectionSerializer
         return DetectionSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.list_actions:
+            kwargs.setdefault('fields', self.list_fields())
+        return super().get_serializer(*args, **kwargs)
+
     # 覆盖 create 方法以确保返回完整序列化数据
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -84,8 +159,9 @@ class DetectionViewSet(viewsets.ModelViewSet):
         
         # 启动异步检测任务 (当前是同步的)
         try:
-            detector = FakeNewsDetector(detection.id)
-            detector.detect()
+            # 上传的图像只解码一次，本地模型和 LLM 验证共用
+            image_artifact = prepare_image_artifact(serializer.validated_data.get('image'))
+            run_detection(detection.id, image_artifact=image_artifact)
         except Exception as e:
             logger.exception(f"检测任务启动失败: {str(e)}")
             detection.status = Detection.STATUS_FAILED
@@ -101,12 +177,77 @@ class DetectionViewSet(viewsets.ModelViewSet):
         serializer = DetectionResultSerializer(detection)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def verifications(self, request, pk=None):
+        """
+        获取各模型的 LLM 验证结果 (判断理由和原始响应)，详情接口的 analysis_result 中只有汇总
+        """
+        detection = self.get_object()
+        serializer = DetectionVerificationSerializer(detection.verifications.all(), many=True)
+        return Response(serializer.data)
+    
+    def image_match_radius(self, request):
+        """ ?radius= 的 pHash 汉明距离 (0-16)，默认 IMAGE_MATCH_MAX_DISTANCE """
+        value = request.query_params.get('radius')
+        if value is None:
+            return None
+        try:
+            radius = int(value)
+        except ValueError:
+            radius = -1
+        if not 0 <= radius <= MAX_IMAGE_MATCH_RADIUS:
+            raise ValidationError({'radius': f'取值应为 0-{MAX_IMAGE_MATCH_RADIUS} 的整数'})
+        return radius
+
+    @action(detail=True, methods=['get'])
+    def similar_images(self, request, pk=None):
+        """
+        感知哈希相近的已知图像 (其他检测记录和训练数据集，见 services/image_hash.py)
+        普通用户只能看到自己的检测记录
+        """
+        detection = self.get_object()
+        if not detection.image:
+            raise ValidationError({'image': '该检测没有图像'})
+        radius = self.image_match_radius(request)
+        matches = find_similar_images(detection, user=None if request.user.is_staff else request.user, radius=radius)
+        if matches is None:
+            raise ValidationError({'image': '无法读取该检测的图像'})
+        return Response(matches)
+
+    @action(detail=False, methods=['post'])
+    def image_lookup(self, request):
+        """ 上传图像 (image)，返回感知哈希相近的已知图像，不创建检测记录 """
+        radius = self.image_match_radius(request)
+        image_artifact = prepare_image_artifact(request.FILES.get('image'))
+        if image_artifact is None:
+            raise ValidationError({'image': '请上传可以解码的图像'})
+        return Response(lookup_image(image_artifact, user=None if request.user.is_staff else request.user, radius=radius))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        融合特征最相似的已标注训练条目和历史检测 (见 services/embedding_index.py)
+        参数: k 每类返回的条数 (1-50，默认 10)；普通用户只能看到自己的检测记录
+        检测没有当前模型版本的特征时，本次请求会先执行一次推理并保存特征 (较慢，之后的请求直接复用)
+        """
+        detection = self.get_object()
+        try:
+            k = int(request.query_params.get('k', 10))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= MAX_SIMILAR_CASES:
+            raise ValidationError({'k': f'取值应为 1-{MAX_SIMILAR_CASES} 的整数'})
+        cases = find_similar_cases(detection, user=None if request.user.is_staff else request.user, k=k)
+        if cases is None:
+            return Response({'detail': '本地模型未加载，无法计算特征'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(cases)
+
     @action(detail=False, methods=['get'])
     def my_detections(self, request):
         """
         获取当前用户的所有检测记录
         """
-        detections = Detection.objects.filter(user=request.user).order_by('-created_at')
+        detections = self.get_queryset().filter(user=request.user)
         page = self.paginate_queryset(detections)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -115,6 +256,63 @@ class DetectionViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(detections, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        全文检索标题和正文，按相关度排序 (见 services/search.py)
+        参数: q 检索词 (空格分隔多个，均须出现)，status，result，
+              created_after / created_before (YYYY-MM-DD，含当天)，page，page_size
+        管理员检索全部记录，普通用户只检索自己的记录
+        """
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': '请输入检索词'})
+        filters = {}
+        for name, choices in (('status', Detection.STATUS_CHOICES), ('result', Detection.RESULT_CHOICES)):
+            value = params.get(name)
+            if value:
+                if value not in dict(choices):
+                    raise ValidationError({name: f"无效的取值: {value}"})
+                filters[name] = value
+        for name, day_offset in (('created_after', 0), ('created_before', 1)):
+            value = params.get(name)
+            if value:
+                try:
+                    day = parse_date(value)
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise ValidationError({name: '日期格式应为 YYYY-MM-DD'})
+                filters[name] = timezone.make_aware(datetime.combine(day + timedelta(days=day_offset), time.min))
+
+        try:
+            page_number = max(1, int(params.get('page', 1)))
+            page_size = max(1, min(int(params.get('page_size', api_settings.PAGE_SIZE)), 100))
+        except ValueError:
+            raise ValidationError({'page': '无效的页码'})
+        total, hits = search_detections(
+            query, user=None if request.user.is_staff else request.user,
+            offset=(page_number - 1) * page_size, limit=page_size, **filters
+        )
+
+        detections = self.get_queryset().in_bulk([pk for pk, _ in hits])
+        matched = [(detections[pk], score) for pk, score in hits if pk in detections]
+        results = self.get_serializer([detection for detection, _ in matched], many=True).data
+        for row, (_, score) in zip(results, matched):
+            row['score'] = round(float(score), 4)
+
+        url = request.build_absolute_uri()
+        return Response({
+            'count': total,
+            'next': replace_query_param(url, 'page', page_number + 1) if page_number * page_size < total else None,
+            'previous': (
+                None if page_number == 1 else
+                remove_query_param(url, 'page') if page_number == 2 else replace_query_param(url, 'page', page_number - 1)
+            ),
+            'results': results,
+        })
+    
     @action(detail=False, methods=['get'])
     def get_stats(self, request):
         """
@@ -125,129 +323,6 @@ class DetectionViewSet(viewsets.ModelViewSet):
         # 确定统计范围
         if user.is_staff and request.query_params.get('all') == 'true':
             # 管理员可以查看所有统计
-            detections = Detection.objects.all()
-        else:
-            # 普通用户只能查看自己的统计
-            detections = Detection.objects.filter(user=user)
-        
-        # 计算基本统计量
-        total_count = detections.count()
-        
-        # 如果没有检测记录，返回空统计
-        if total_count == 0:
-            return Response({
-                'total_count': 0,
-                'fake_count': 0,
-                'real_count': 0,
-                'pending_count': 0,
-                'completed_count': 0,
-                'failed_count': 0,
-                'fake_percentage': 0,
-                'real_percentage': 0,
-                'average_confidence': 0
-            })
-        
-        # 计算各类型数量
-        fake_count = detections.filter(result=Detection.RESULT_FAKE).count()
-        real_count = detections.filter(result=Detection.RESULT_REAL).count()
-        pending_count = detections.filter(status=Detection.STATUS_PENDING).count()
-        completed_count = detections.filter(status=Detection.STATUS_COMPLETED).count()
-        failed_count = detections.filter(status=Detection.STATUS_FAILED).count()
-        
-        # 计算百分比
-        fake_percentage = (fake_count / total_count) * 100 if total_count > 0 else 0
-        real_percentage = (real_count / total_count) * 100 if total_count > 0 else 0
-        
-        # 计算平均置信度
-        avg_confidence = detections.filter(
-            status=Detection.STATUS_COMPLETED
-        ).aggregate(avg=Avg('confidence_score'))['avg'] or 0
-        
-        # 添加按日期分组的数据统计
-        # 获取过去7天的日期范围
-        today = timezone.now().date()
-        dates = [(today - timedelta(days=i)) for i in range(6, -1, -1)]
-        
-        # 按日期分组查询数据 - 修复日期查询逻辑
-        # 不再使用日期过滤，而是分别计算每个日期的记录数
-        date_counts = {}
-        for date in dates:
-            start_date = datetime.combine(date, datetime.min.time())
-            end_date = datetime.combine(date, datetime.max.time())
-            start_date = timezone.make_aware(start_date)
-            end_date = timezone.make_aware(end_date)
-            
-            # 计算当天的检测数量
-            count = detections.filter(created_at__gte=start_date, created_at__lte=end_date).count()
-            date_counts[date.strftime('%Y-%m-%d')] = count
-        
-        # 如果所有日期的计数都是0，我们可能需要查看所有检测记录的日期分布
-        if all(count == 0 for count in date_counts.values()) and total_count > 0:
-            # 获取最早和最晚的检测记录日期
-            earliest = detections.order_by('created_at').first()
-            latest = detections.order_by('-created_at').first()
-            
-            if earliest and latest:
-                earliest_date = earliest.created_at.date()
-                latest_date = latest.created_at.date()
-                
-                # 计算所有检测记录的日期分布
-                real_date_counts = {}
-                date_range = []
-                for date in (earliest_date + timedelta(days=n) for n in range((latest_date - earliest_date).days + 1)):
-                    date_range.append(date)
-                    start_date = datetime.combine(date, datetime.min.time())
-                    end_date = datetime.combine(date, datetime.max.time())
-                    start_date = timezone.make_aware(start_date)
-                    end_date = timezone.make_aware(end_date)
-                    count = detections.filter(created_at__gte=start_date, created_at__lte=end_date).count()
-                    real_date_counts[date.strftime('%Y-%m-%d')] = count
-                
-                # 使用真实的日期分布，取最多7天数据
-                if len(date_range) > 0:
-                    # 最多取7天数据，优先取最近的数据
-                    if len(date_range) > 7:
-                        date_range = date_range[-7:]
-                    
-                    date_counts = {date.strftime('%Y-%m-%d'): real_date_counts.get(date.strftime('%Y-%m-%d'), 0) for date in date_range}
-                    dates = date_range
-        
-        # 生成最近日期的统计数据
-        weekly_trend = []
-        for date in dates:
-            date_str = date.strftime('%Y-%m-%d')
-            if date == today:
-                display_name = '今天'
-            elif date == today - timedelta(days=1):
-                display_name = '昨天'
-            else:
-                display_name = date_str
-                
-            weekly_trend.append({
-                'date': display_name,
-                'count': date_counts.get(date_str, 0)
-            })
-        
-        # 计算今日检测量
-        today_detections = date_counts.get(today.strftime('%Y-%m-%d'), 0)
-        
-        # 构建统计响应
-        stats = {
-            'total_count': total_count,
-            'fake_count': fake_count,
-            'real_count': real_count,
-            'pending_count': pending_count,
-            'completed_count': completed_count,
-            'failed_count': failed_count,
-            'fake_percentage': fake_percentage,
-            'real_percentage': real_percentage,
-            'average_confidence': avg_confidence,
-            'weekly_trend': weekly_trend,
-            'today_detections': today_detections,
-            'result_distribution': [
-                { 'name': '真实新闻', 'value': real_count },
-                { 'name': '虚假新闻', 'value': fake_count }
-            ]
-        }
-        
-        return Response(stats)
+            return Response(compute_detection_stats())
+        # 普通用户只能查看自己的统计
+        return Response(compute_detection_stats(user))
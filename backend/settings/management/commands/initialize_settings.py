@@ -32,6 +32,18 @@ class Command(BaseCommand):
                 'value': '0.35',
                 'value_type': 'float',
                 'description': '真实新闻阈值'
+            },
+            {
+                'key': 'near_duplicate_threshold',
+                'value': '0.85',
+                'value_type': 'float',
+                'description': '近似重复文本的相似度阈值'
+            },
+            {
+                'key': 'near_duplicate_reuse',
+                'value': 'false',
+                'value_type': 'boolean',
+                'description': '近似重复时直接沿用已有检测的结论'
             }
         ]
         
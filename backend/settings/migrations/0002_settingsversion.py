@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-19 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('settings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettingsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0, verbose_name='版本号')),
+            ],
+            options={
+                'verbose_name': '设置版本',
+                'verbose_name_plural': '设置版本',
+            },
+        ),
+    ]
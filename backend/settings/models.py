@@ -1,6 +1,17 @@
-from django.db import models
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
+logger = logging.getLogger(__name__)
+
 class SystemSettings(models.Model):
     """
     系统设置模型，用于存储全局设置
@@ -27,10 +38,25 @@ class SystemSettings(models.Model):
     def __str__(self):
         return f"{self.key}: {self.value}"
     
+    @staticmethod
+    def parse_value(value, value_type):
+        """ 把存储的字符串按值类型转换 """
+        if value_type == 'integer':
+            return int(value)
+        elif value_type == 'float':
+            return float(value)
+        elif value_type == 'boolean':
+            return value.lower() in ('true', 'yes', '1')
+        elif value_type == 'json':
+            return json.loads(value)
+        else:
+            # 字符串类型
+            return value
+
     @classmethod
     def get_value(cls, key, default=None):
         """
-        获取指定键的设置值
+        获取指定键的设置值 (经进程内缓存，见 SettingsCache)
         
         Args:
             key: 设置键名
@@ -39,22 +65,20 @@ class SystemSettings(models.Model):
         Returns:
             根据值类型转换后的设置值
         """
-        try:
-            setting = cls.objects.get(key=key)
-            if setting.value_type == 'integer':
-                return int(setting.value)
-            elif setting.value_type == 'float':
-                return float(setting.value)
-            elif setting.value_type == 'boolean':
-                return setting.value.lower() in ('true', 'yes', '1')
-            elif setting.value_type == 'json':
-                import json
-                return json.loads(setting.value)
-            else:
-                # 字符串类型
-                return setting.value
-        except cls.DoesNotExist:
-            return default
+        return settings_cache.get_many({key: default})[key]
+
+    @classmethod
+    def get_many(cls, defaults):
+        """
+        一次获取多个设置值
+
+        Args:
+            defaults: {设置键名: 默认值}
+
+        Returns:
+            {设置键名: 转换后的设置值}
+        """
+        return settings_cache.get_many(defaults)
     
     @classmethod
     def set_value(cls, key, value, value_type=None, description=None):
@@ -83,24 +107,111 @@ class SystemSettings(models.Model):
                 value = str(value)
             elif isinstance(value, (dict, list)):
                 value_type = 'json'
-                import json
                 value = json.dumps(value)
             else:
                 value_type = 'string'
                 value = str(value)
         
-        # 获取或创建设置
-        setting, created = cls.objects.update_or_create(
-            key=key,
-            defaults={
-                'value': value,
-                'value_type': value_type
-            }
-        )
-        
-        # 如果提供了描述，则更新
-        if description is not None:
-            setting.description = description
-            setting.save()
+        with transaction.atomic():
+            # 获取或创建设置
+            setting, created = cls.objects.update_or_create(
+                key=key,
+                defaults={
+                    'value': value,
+                    'value_type': value_type
+                }
+            )
+            
+            # 如果提供了描述，则更新
+            if description is not None:
+                setting.description = description
+                setting.save()
         
         return setting
+
+
+class SettingsVersion(models.Model):
+    """
+    系统设置的版本号 (单行)
+    SystemSettings 每次保存或删除都会递增版本号，各进程据此判断缓存是否过期
+    """
+    version = models.BigIntegerField(_('版本号'), default=0)
+
+    class Meta:
+        verbose_name = _('设置版本')
+        verbose_name_plural = _('设置版本')
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+class SettingsCache:
+    """
+    SystemSettings 的进程内缓存
+    - 一次查询加载全部设置项，按版本号 (SettingsVersion) 判断是否过期
+    - 距上次校验超过 SETTINGS_CACHE_TTL 秒时才查询一次版本号，未变化则继续使用缓存；
+      稳定状态下读取设置不访问数据库，其他进程的修改最多延迟 TTL 秒生效
+    - 本进程内的修改在事务提交后立即生效
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """ 丢弃缓存，下次读取时重新加载 """
+        with self._lock:
+            self._values = None
+
+    def get_many(self, defaults):
+        values = self._fresh_values()
+        result = {}
+        for key, default in defaults.items():
+            if key not in values:
+                result[key] = default
+                continue
+            value, value_type = values[key]
+            try:
+                result[key] = SystemSettings.parse_value(value, value_type)
+            except (ValueError, TypeError) as e:
+                logger.error(f"系统设置 {key} 的值 '{value}' 无法转换为 {value_type}: {e}，使用默认值")
+                result[key] = default
+        return result
+
+    def _fresh_values(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._values is not None and now - self._checked_at < settings.SETTINGS_CACHE_TTL:
+                return self._values
+            # 先读版本号再读设置项: 两次查询之间的修改会在下次校验时被发现
+            version = SettingsVersion.current()
+            if self._values is None or version != self._version:
+                self._values = {
+                    key: (value, value_type)
+                    for key, value, value_type in SystemSettings.objects.values_list('key', 'value', 'value_type')
+                }
+                self._version = version
+            self._checked_at = now
+            return self._values
+
+
+settings_cache = SettingsCache()
+
+
+@receiver(post_save, sender=SystemSettings)
+@receiver(post_delete, sender=SystemSettings)
+def bump_settings_version(sender, **kwargs):
+    """
+    设置项变化 (包括管理后台和管理命令的修改) 时递增版本号，并在事务提交后丢弃本进程的缓存
+    提交前丢弃的话，其他线程会在提交前重新加载旧值并记下旧版本号，直到 TTL 过期都读不到新值
+    """
+    SettingsVersion.bump()
+    transaction.on_commit(settings_cache.invalidate)
@@ -34,4 +34,8 @@ class ApiConfigSerializer(serializers.Serializer):
         """验证API密钥格式"""
         if value and not value.startswith('sk-or-v1-'):
             raise serializers.ValidationError("无效的OpenRouter API密钥格式")
-        return value 
\ No newline at end of file
+        return value 
+
+class ModelVersionSerializer(serializers.Serializer):
+    """切换生效模型版本序列化器"""
+    version = serializers.CharField(max_length=64)
@@ -1,3 +1,90 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .models import SettingsVersion, SystemSettings, settings_cache
+
+WEIGHT_DEFAULTS = {
+    'local_model_weight': 0.4,
+    'llm_weight': 0.6,
+    'fake_threshold': 0.65,
+    'real_threshold': 0.35,
+}
+
+
+@override_settings(SETTINGS_CACHE_TTL=60)
+class SettingsCacheTests(TestCase):
+    """
+    SystemSettings 进程内缓存: 稳定状态下不查询数据库，修改后按版本号失效
+    """
+
+    def setUp(self):
+        settings_cache.invalidate()
+        SystemSettings.set_value('local_model_weight', 0.3, 'float')
+        SystemSettings.set_value('llm_weight', 0.7, 'float')
+
+    def test_steady_state_reads_do_not_query(self):
+        # 首次读取: 版本号 + 全部设置项
+        with self.assertNumQueries(2):
+            weights = SystemSettings.get_many(WEIGHT_DEFAULTS)
+        self.assertEqual(weights, {**WEIGHT_DEFAULTS, 'local_model_weight': 0.3, 'llm_weight': 0.7})
+        with self.assertNumQueries(0):
+            SystemSettings.get_many(WEIGHT_DEFAULTS)
+            self.assertEqual(SystemSettings.get_value('llm_weight'), 0.7)
+            self.assertIsNone(SystemSettings.get_value('missing'))
+
+    def test_set_value_invalidates_local_cache(self):
+        SystemSettings.get_many(WEIGHT_DEFAULTS)
+        version = SettingsVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSettings.set_value('fake_threshold', 0.8, 'float', '虚假新闻阈值')
+        self.assertGreater(SettingsVersion.current(), version)
+        self.assertEqual(SystemSettings.get_value('fake_threshold'), 0.8)
+
+    def test_changes_from_other_processes_are_seen_after_ttl(self):
+        SystemSettings.get_many(WEIGHT_DEFAULTS)
+        # 模拟另一个进程: 修改数据库和版本号，但本进程的缓存未被直接丢弃
+        SystemSettings.objects.filter(key='llm_weight').update(value='0.5')
+        SettingsVersion.bump()
+        self.assertEqual(SystemSettings.get_value('llm_weight'), 0.7)
+        with override_settings(SETTINGS_CACHE_TTL=0):
+            self.assertEqual(SystemSettings.get_value('llm_weight'), 0.5)
+
+
+@override_settings(SETTINGS_CACHE_TTL=60)
+class SettingsCacheTransactionTests(TransactionTestCase):
+    """
+    事务中修改设置: 提交前其他线程读取旧值，提交后立即读到新值 (不等待 TTL)
+    """
+
+    def read_in_thread(self, key):
+        """ 在另一个线程 (独立的数据库连接) 中读取设置，线程中的异常在当前线程重新抛出 """
+        result = {}
+
+        def read():
+            try:
+                result['value'] = SystemSettings.get_value(key)
+            except Exception as e:
+                result['error'] = e
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+        return result['value']
+
+    def test_change_inside_atomic_is_seen_after_commit(self):
+        settings_cache.invalidate()
+        SystemSettings.set_value('llm_weight', 0.7, 'float')
+        self.assertEqual(SystemSettings.get_value('llm_weight'), 0.7)
+
+        with transaction.atomic():
+            SystemSettings.set_value('llm_weight', 0.5, 'float')
+            # 未提交的修改对其他线程不可见，此时缓存的仍是旧值
+            self.assertEqual(self.read_in_thread('llm_weight'), 0.7)
+        self.assertEqual(self.read_in_thread('llm_weight'), 0.5)
+        self.assertEqual(SystemSettings.get_value('llm_weight'), 0.5)
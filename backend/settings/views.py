@@ -3,6 +3,7 @@ import os
 import logging
 import glob
 from django.conf import settings as django_settings
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
@@ -10,7 +11,10 @@ from rest_framework.response import Response
 from .models import SystemSettings
 from .serializers import (
     SystemSettingsSerializer, ModelWeightsSerializer, 
-    ApiConfigSerializer
+    ApiConfigSerializer, ModelVersionSerializer
+)
+from detection.services.model_store import (
+    ModelStoreError, get_active_version, list_versions, promote_version
 )
 
 logger = logging.getLogger(__name__)
@@ -51,10 +55,16 @@ class SettingsViewSet(viewsets.ViewSet):
         获取模型权重设置
         """
         # 获取当前设置
-        local_model_weight = SystemSettings.get_value(self.LOCAL_MODEL_WEIGHT, self.DEFAULT_LOCAL_MODEL_WEIGHT)
-        llm_weight = SystemSettings.get_value(self.LLM_WEIGHT, self.DEFAULT_LLM_WEIGHT)
-        fake_threshold = SystemSettings.get_value(self.FAKE_THRESHOLD, self.DEFAULT_FAKE_THRESHOLD)
-        real_threshold = SystemSettings.get_value(self.REAL_THRESHOLD, self.DEFAULT_REAL_THRESHOLD)
+        weights = SystemSettings.get_many({
+            self.LOCAL_MODEL_WEIGHT: self.DEFAULT_LOCAL_MODEL_WEIGHT,
+            self.LLM_WEIGHT: self.DEFAULT_LLM_WEIGHT,
+            self.FAKE_THRESHOLD: self.DEFAULT_FAKE_THRESHOLD,
+            self.REAL_THRESHOLD: self.DEFAULT_REAL_THRESHOLD,
+        })
+        local_model_weight = weights[self.LOCAL_MODEL_WEIGHT]
+        llm_weight = weights[self.LLM_WEIGHT]
+        fake_threshold = weights[self.FAKE_THRESHOLD]
+        real_threshold = weights[self.REAL_THRESHOLD]
         openrouter_api_key = os.environ.get('OPENROUTER_API_KEY', '')  # 从环境变量获取API密钥
         use_gpu = getattr(django_settings, 'DEVICE', '') == 'cuda'
         
@@ -78,31 +88,32 @@ class SettingsViewSet(viewsets.ViewSet):
         if serializer.is_valid():
             data = serializer.validated_data
             
-            # 保存设置到数据库
-            SystemSettings.set_value(
-                self.LOCAL_MODEL_WEIGHT, 
-                data['local_model_weight'], 
-                'float',
-                '本地模型权重'
-            )
-            SystemSettings.set_value(
-                self.LLM_WEIGHT, 
-                data['llm_weight'], 
-                'float',
-                'LLM模型权重'
-            )
-            SystemSettings.set_value(
-                self.FAKE_THRESHOLD, 
-                data['fake_threshold'], 
-                'float',
-                '虚假新闻阈值'
-            )
-            SystemSettings.set_value(
-                self.REAL_THRESHOLD, 
-                data['real_threshold'], 
-                'float',
-                '真实新闻阈值'
-            )
+            # 保存设置到数据库 (同一事务，其他进程不会读到只更新了一半的权重)
+            with transaction.atomic():
+                SystemSettings.set_value(
+                    self.LOCAL_MODEL_WEIGHT, 
+                    data['local_model_weight'], 
+                    'float',
+                    '本地模型权重'
+                )
+                SystemSettings.set_value(
+                    self.LLM_WEIGHT, 
+                    data['llm_weight'], 
+                    'float',
+                    'LLM模型权重'
+                )
+                SystemSettings.set_value(
+                    self.FAKE_THRESHOLD, 
+                    data['fake_threshold'], 
+                    'float',
+                    '虚假新闻阈值'
+                )
+                SystemSettings.set_value(
+                    self.REAL_THRESHOLD, 
+                    data['real_threshold'], 
+                    'float',
+                    '真实新闻阈值'
+                )
             
             # 记录日志
             logger.info(
@@ -113,6 +124,39 @@ class SettingsViewSet(viewsets.ViewSet):
             return Response(data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['get'])
+    def model_versions(self, request):
+        """
+        获取已发布的模型版本和当前生效版本
+        """
+        active_version, _ = get_active_version()
+        return Response({
+            'active_version': active_version,
+            'versions': list_versions()
+        })
+    
+    @model_versions.mapping.post
+    def promote_model_version(self, request):
+        """
+        切换生效的模型版本
+        各工作进程在后台加载新权重，加载完成前继续使用旧版本处理检测
+        """
+        serializer = ModelVersionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        version = serializer.validated_data['version']
+        try:
+            promote_version(version)
+        except ModelStoreError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info(f"管理员 {request.user.username} 切换生效模型版本: {version}")
+        return Response({
+            'active_version': version,
+            'versions': list_versions()
+        })
+    
     @action(detail=False, methods=['get'])
     def logs(self, request):
         """
@@ -0,0 +1,146 @@
+# scripts/backbones.py
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision.models import (
+    resnet50, ResNet50_Weights,
+    mobilenet_v3_small, MobileNet_V3_Small_Weights,
+    mobilenet_v3_large, MobileNet_V3_Large_Weights,
+    efficientnet_b0, EfficientNet_B0_Weights,
+)
+from transformers import AutoConfig, AutoModel
+
+# --- Backbone Selection (shared by training, evaluation and the backend) ---
+# The backend reads the same environment variables in config/settings.py, and every
+# saved checkpoint records its backbones in the model.json sidecar.
+TEXT_MODEL_NAME = os.getenv('TEXT_MODEL_NAME', 'bert-base-chinese')
+IMAGE_MODEL_NAME = os.getenv('IMAGE_MODEL_NAME', 'resnet50')
+
+# --- Image Backbones ---
+# 'head' is the classifier attribute replaced by nn.Identity; the embedding dim is
+# inferred from the first Linear layer inside it.
+IMAGE_BACKBONES = {
+    'resnet50': {'builder': resnet50, 'weights': ResNet50_Weights.IMAGENET1K_V2, 'head': 'fc'},
+    'efficientnet_b0': {'builder': efficientnet_b0, 'weights': EfficientNet_B0_Weights.IMAGENET1K_V1, 'head': 'classifier'},
+    'mobilenet_v3_large': {'builder': mobilenet_v3_large, 'weights': MobileNet_V3_Large_Weights.IMAGENET1K_V2, 'head': 'classifier'},
+    'mobilenet_v3_small': {'builder': mobilenet_v3_small, 'weights': MobileNet_V3_Small_Weights.IMAGENET1K_V1, 'head': 'classifier'},
+}
+
+# --- Text Backbones ---
+# Any HuggingFace encoder works; these are the Chinese ones we compare by latency.
+# All of them share the bert-base-chinese vocabulary.
+TEXT_BACKBONES = {
+    'bert-base-chinese': {'layers': 12},
+    'hfl/chinese-roberta-wwm-ext': {'layers': 12},
+    'hfl/rbt6': {'layers': 6},
+    'hfl/rbt3': {'layers': 3},
+}
+
+def _replace_head(encoder, head_attr):
+    """ Replaces the classifier head with nn.Identity and returns the feature dim it consumed. """
+    head = getattr(encoder, head_attr)
+    linear = head if isinstance(head, nn.Linear) else next(m for m in head.modules() if isinstance(m, nn.Linear))
+    setattr(encoder, head_attr, nn.Identity())
+    return linear.in_features
+
+def build_image_encoder(name, pretrained=True):
+    """ Returns (encoder without classifier, embedding dim, eval transforms). """
+    if name not in IMAGE_BACKBONES:
+        raise ValueError(f"Image model '{name}' not currently supported. Available: {', '.join(IMAGE_BACKBONES)}")
+    spec = IMAGE_BACKBONES[name]
+    encoder = spec['builder'](weights=spec['weights'] if pretrained else None)
+    embedding_dim = _replace_head(encoder, spec['head'])
+    return encoder, embedding_dim, spec['weights'].transforms()
+
+def build_text_encoder(name, pretrained=True):
+    """ Returns (HuggingFace encoder, hidden size). """
+    if pretrained:
+        encoder = AutoModel.from_pretrained(name)
+    else:
+        encoder = AutoModel.from_config(AutoConfig.from_pretrained(name))
+    return encoder, encoder.config.hidden_size
+
+def image_embedding_dim(name):
+    encoder, embedding_dim, _ = build_image_encoder(name, pretrained=False)
+    return embedding_dim
+
+def text_embedding_dim(name):
+    return AutoConfig.from_pretrained(name).hidden_size
+
+# --- CPU Latency Benchmark ---
+
+def _median_latency_ms(fn, runs):
+    with torch.no_grad():
+        for _ in range(3): # warm-up
+            fn()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def benchmark_backbones(image_names, text_names, seq_len, runs):
+    """ Single-item CPU latency (ms) for each image and text backbone. """
+    rows = []
+    image = torch.randn(1, 3, 224, 224)
+    for name in image_names:
+        encoder, dim, _ = build_image_encoder(name, pretrained=False)
+        encoder.eval()
+        gflops = IMAGE_BACKBONES[name]['weights'].meta.get('_ops')
+        rows.append(('image', name, dim, gflops, _median_latency_ms(lambda: encoder(image), runs)))
+
+    input_ids = torch.ones(1, seq_len, dtype=torch.long)
+    attention_mask = torch.ones(1, seq_len, dtype=torch.long)
+    for name in text_names:
+        try:
+            encoder, dim = build_text_encoder(name, pretrained=False)
+        except Exception as e:
+            logging.warning(f"Skipping text model {name}: {e}")
+            continue
+        encoder.eval()
+        rows.append(('text', name, dim, None, _median_latency_ms(lambda: encoder(input_ids=input_ids, attention_mask=attention_mask), runs)))
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark encoder backbones on CPU and pick the ones within a latency budget.")
+    parser.add_argument('--budget_ms', type=float, default=None, help="Per-encoder CPU latency budget in milliseconds")
+    parser.add_argument('--image_models', nargs='+', default=list(IMAGE_BACKBONES))
+    parser.add_argument('--text_models', nargs='+', default=list(TEXT_BACKBONES))
+    parser.add_argument('--seq_len', type=int, default=128)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads (default: torch default)")
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    rows = benchmark_backbones(args.image_models, args.text_models, args.seq_len, args.runs)
+
+    print(f"{'Kind':<6}{'Backbone':<30}{'Dim':>6}{'GFLOPs':>8}{'CPU ms':>10}  Budget")
+    for kind, name, dim, gflops, latency_ms in rows:
+        within = '' if args.budget_ms is None else ('ok' if latency_ms <= args.budget_ms else 'over')
+        gflops_str = f"{gflops:.2f}" if gflops is not None else '-'
+        print(f"{kind:<6}{name:<30}{dim:>6}{gflops_str:>8}{latency_ms:>10.1f}  {within}")
+
+    if args.budget_ms is not None:
+        for kind in ('image', 'text'):
+            candidates = [r for r in rows if r[0] == kind and r[4] <= args.budget_ms]
+            if candidates:
+                # Largest (usually most accurate) backbone that still fits the budget
+                best = max(candidates, key=lambda r: r[4])
+                print(f"Suggested {kind} backbone within {args.budget_ms:.0f} ms: {best[1]} ({best[4]:.1f} ms)")
+            else:
+                print(f"No {kind} backbone fits within {args.budget_ms:.0f} ms")
+        print("Select them with TEXT_MODEL_NAME / IMAGE_MODEL_NAME for training, evaluation and serving.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# scripts/checkpoint_format.py
+
+import json
+import logging
+from pathlib import Path
+
+import torch
+from safetensors.torch import save_file, load_file
+
+# --- Checkpoint Storage Format ---
+# Training writes pickled fp32 state dicts (model.pth). For deployment they can be
+# converted (convert_checkpoint.py) to safetensors (model.safetensors): a flat
+# header plus raw tensor bytes, loaded without unpickling and memory-mappable.
+# Floating tensors may be stored as fp16 at rest (half the size) and are upcast to
+# fp32 on load. The model.json sidecar gets a 'weights' manifest
+#   {'format': 'safetensors', 'storage_dtype': 'float16', 'num_parameters': ...,
+#    'tensors': {name: [shape...]}}
+# so loaders can check the architecture against it before allocating the model.
+# The sidecar itself is also embedded in the safetensors metadata.
+# Mirrored by backend/detection/ml/checkpoint.py.
+
+SAFETENSORS_SUFFIX = '.safetensors'
+STORAGE_DTYPES = {'float32': torch.float32, 'float16': torch.float16}
+FP16_MAX = torch.finfo(torch.float16).max
+
+
+def is_safetensors(model_path):
+    return Path(model_path).suffix == SAFETENSORS_SUFFIX
+
+
+def tensor_manifest(state_dict, storage_dtype):
+    """ Sidecar 'weights' entry describing a stored state dict """
+    return {
+        'format': 'safetensors',
+        'storage_dtype': storage_dtype,
+        'num_parameters': sum(t.numel() for t in state_dict.values()),
+        'tensors': {name: list(t.shape) for name, t in state_dict.items()},
+    }
+
+
+def to_storage_dtype(state_dict, storage_dtype):
+    """
+    Casts the floating tensors of a state dict to the storage dtype. Tensors whose
+    values overflow fp16 stay fp32 (integer tensors, e.g. num_batches_tracked, are kept).
+    Returns (state dict, names kept in fp32).
+    """
+    dtype = STORAGE_DTYPES[storage_dtype]
+    stored, kept = {}, []
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        if tensor.is_floating_point() and dtype != tensor.dtype:
+            if dtype == torch.float16 and tensor.abs().max() > FP16_MAX:
+                kept.append(name)
+            else:
+                tensor = tensor.to(dtype)
+        # safetensors needs contiguous tensors that do not share storage
+        stored[name] = tensor.contiguous().clone()
+    return stored, kept
+
+
+def save_safetensors(state_dict, output_path, model_config, storage_dtype='float32'):
+    """ Writes state_dict as safetensors with the sidecar embedded in its metadata; returns the manifest """
+    stored, kept = to_storage_dtype(state_dict, storage_dtype)
+    if kept:
+        logging.warning(f"{len(kept)} tensors exceed the fp16 range and are stored as fp32: {kept}")
+    manifest = tensor_manifest(stored, storage_dtype)
+    metadata = {'format': 'pt', 'model_config': json.dumps({**model_config, 'weights': manifest})}
+    save_file(stored, str(output_path), metadata=metadata)
+    return manifest
+
+
+def load_state_dict(model_path, map_location='cpu'):
+    """ Loads a .pth or .safetensors state dict; fp16-at-rest tensors are upcast to fp32 """
+    if not is_safetensors(model_path):
+        return torch.load(model_path, map_location=map_location)
+    state_dict = load_file(str(model_path))
+    device = torch.device(map_location) if isinstance(map_location, str) else map_location
+    return {
+        name: (tensor.float() if tensor.dtype == torch.float16 else tensor).to(device)
+        for name, tensor in state_dict.items()
+    }
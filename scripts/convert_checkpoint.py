@@ -0,0 +1,136 @@
+# scripts/convert_checkpoint.py
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import torch
+
+from train_model import MultimodalFakeNewsModel, load_model_config, BEST_MODEL_PATH, MAX_TEXT_LEN, FUSION_OUTPUT_DIM
+from backbones import TEXT_MODEL_NAME, IMAGE_MODEL_NAME
+from precision import GUARD_KEY
+from checkpoint_format import SAFETENSORS_SUFFIX, STORAGE_DTYPES, save_safetensors, load_state_dict
+
+# --- Checkpoint Conversion ---
+# Converts a pickled training checkpoint (model.pth) to safetensors (model.safetensors)
+# plus a complete model.json sidecar with the tensor manifest (see checkpoint_format.py).
+# The converted weights are loaded back and compared with the original on a dummy
+# batch, so an fp16-at-rest conversion that changes predictions is rejected. Both files
+# are written to temporary names and only moved into place after that check passes.
+
+# Largest accepted probability difference between the original and converted model
+MAX_PROB_DIFF = 1e-3
+VERIFY_BATCH_SIZE = 4
+VERIFY_SEQ_LEN = 64
+
+
+def build_model(model_config):
+    return MultimodalFakeNewsModel(
+        text_model_name=model_config['text_model_name'],
+        image_model_name=model_config['image_model_name'],
+        fusion_output_dim=model_config['fusion_output_dim'],
+        structure=model_config.get('structure'),
+    ).eval()
+
+
+def dummy_batch(model, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    vocab_size = model.text_encoder.config.vocab_size
+    input_ids = torch.randint(0, vocab_size, (VERIFY_BATCH_SIZE, VERIFY_SEQ_LEN), generator=generator)
+    return (
+        input_ids,
+        torch.ones_like(input_ids),
+        torch.randn(VERIFY_BATCH_SIZE, 3, 224, 224, generator=generator),
+        torch.tensor([1, 1, 0, 1][:VERIFY_BATCH_SIZE]),
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert a .pth checkpoint to safetensors with a tensor manifest sidecar.")
+    parser.add_argument('model_path', type=str, nargs='?', default=str(BEST_MODEL_PATH),
+                        help=f"Pickled fp32 state dict (default: {BEST_MODEL_PATH})")
+    parser.add_argument('--output_path', type=str, default=None,
+                        help="Output .safetensors path (default: next to the input). Its .json sidecar "
+                             "must not belong to another weights file, e.g. the input's own sidecar")
+    parser.add_argument('--dtype', choices=list(STORAGE_DTYPES), default='float32',
+                        help="Storage dtype of floating tensors; float16 halves the file and is upcast to fp32 on load")
+    parser.add_argument('--max_prob_diff', type=float, default=MAX_PROB_DIFF,
+                        help="Reject the conversion if a dummy-batch probability moves by more than this")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start_time = time.time()
+    model_path = Path(args.model_path)
+    output_path = Path(args.output_path) if args.output_path else model_path.with_suffix(SAFETENSORS_SUFFIX)
+    if output_path.suffix != SAFETENSORS_SUFFIX:
+        logging.error(f"FATAL: Output path must end with {SAFETENSORS_SUFFIX}: {output_path}")
+        return 1
+
+    # The sidecar is found by stem (model.safetensors -> model.json). Refuse to replace one that
+    # describes another weights file, e.g. the .pth being converted when the output sits next to it.
+    config_path = output_path.with_suffix('.json')
+    if config_path.is_file() and 'weights' not in load_model_config(output_path):
+        logging.error(f"FATAL: {config_path} is the sidecar of another weights file (e.g. {model_path}). "
+                      f"Pass --output_path with a different name or directory.")
+        return 1
+    tmp_output_path = output_path.with_name(f".{output_path.stem}.tmp{SAFETENSORS_SUFFIX}")
+    tmp_config_path = output_path.with_name(f".{output_path.stem}.tmp.json")
+
+    # 1. Complete sidecar (older checkpoints without one use the training defaults)
+    model_config = load_model_config(model_path)
+    if model_config.get('quantization'):
+        logging.error("FATAL: INT8 checkpoints hold packed weights and cannot be stored as safetensors.")
+        return 1
+    model_config.setdefault('text_model_name', TEXT_MODEL_NAME)
+    model_config.setdefault('image_model_name', IMAGE_MODEL_NAME)
+    model_config.setdefault('fusion_output_dim', FUSION_OUTPUT_DIM)
+    model_config.setdefault('max_text_len', MAX_TEXT_LEN)
+
+    # 2. Load into the architecture the sidecar describes (strict, so it matches exactly)
+    state_dict = torch.load(model_path, map_location='cpu')
+    model = build_model(model_config)
+    model.load_state_dict(state_dict)
+    model_config['text_embedding_dim'] = model.text_embedding_dim
+    model_config['img_embedding_dim'] = model.img_embedding_dim
+    if args.dtype != 'float32' and model_config.pop(GUARD_KEY, None):
+        logging.info("Dropping the precision guard, it was measured on the fp32 weights.")
+
+    try:
+        # 3. Write safetensors and the sidecar to temporary files next to the output
+        manifest = save_safetensors(state_dict, tmp_output_path, model_config, storage_dtype=args.dtype)
+        model_config['weights'] = manifest
+        with open(tmp_config_path, 'w', encoding='utf-8') as f:
+            json.dump(model_config, f, indent=2, ensure_ascii=False)
+
+        # 4. Verify: converted weights must load strictly and give the same predictions
+        converted = build_model(model_config)
+        converted.load_state_dict(load_state_dict(tmp_output_path))
+        inputs = dummy_batch(model)
+        with torch.no_grad():
+            diff = (torch.sigmoid(model(*inputs)) - torch.sigmoid(converted(*inputs))).abs().max().item()
+        size_mb = tmp_output_path.stat().st_size / (1024 * 1024)
+        logging.info(f"{model_path} ({model_path.stat().st_size / (1024 * 1024):.1f} MB) -> {output_path} "
+                     f"({size_mb:.1f} MB, {args.dtype}), max probability difference {diff:.2e}")
+        if diff > args.max_prob_diff:
+            logging.error(f"FATAL: Probability difference {diff:.2e} exceeds {args.max_prob_diff:.0e}, discarding the output.")
+            return 1
+
+        # 5. Only a verified conversion replaces existing files
+        os.replace(tmp_output_path, output_path)
+        os.replace(tmp_config_path, config_path)
+    finally:
+        # Nothing temporary is left behind, whether verification failed or raised
+        for path in (tmp_output_path, tmp_config_path):
+            path.unlink(missing_ok=True)
+
+    logging.info(f"Sidecar written to {config_path}. Conversion took {time.time() - start_time:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
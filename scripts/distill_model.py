@@ -0,0 +1,258 @@
+# scripts/distill_model.py
+
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+from sklearn.model_selection import train_test_split
+from tqdm import tqdm
+
+from data_loader import MultimodalFakeNewsDataset, get_tokenizer, get_image_transforms
+from train_model import (
+    MultimodalFakeNewsModel,
+    evaluate_epoch,
+    save_model_config, load_model_config,
+    BASE_DIR, DATA_DIR, CSV_PATH, OUTPUT_DIR, BEST_MODEL_PATH,
+    TEXT_MODEL_NAME, IMAGE_MODEL_NAME, IMAGE_MODEL_INPUT_SIZE, MAX_TEXT_LEN,
+    FUSION_OUTPUT_DIM,
+    VALIDATION_SPLIT, TEST_SPLIT, RANDOM_SEED,
+    LEARNING_RATE_ENCODERS, LEARNING_RATE_HEAD, WEIGHT_DECAY,
+    EARLY_STOPPING_PATIENCE, LR_SCHEDULER_PATIENCE, LR_SCHEDULER_FACTOR,
+)
+from checkpoint_format import load_state_dict
+
+# --- Configuration ---
+STUDENT_MODEL_PATH = OUTPUT_DIR / 'best_student_model.pth'
+RESULTS_DIR = BASE_DIR / 'evaluation_results'
+RESULTS_DIR.mkdir(exist_ok=True)
+
+# 3-layer Chinese RoBERTa, shares the bert-base-chinese vocabulary
+STUDENT_TEXT_MODEL_NAME = 'hfl/rbt3'
+STUDENT_IMAGE_MODEL_NAME = 'mobilenet_v3_small'
+
+EPOCHS = 10
+BATCH_SIZE = 32
+TEMPERATURE = 4.0
+# Weight of the hard-label loss; the soft-target loss gets (1 - ALPHA)
+ALPHA = 0.3
+LATENCY_RUNS = 20
+
+# --- Distillation Loss ---
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    """
+    Hinton-style knowledge distillation for a single-logit binary classifier.
+    Soft targets are the teacher's temperature-scaled fake probabilities; the
+    T^2 factor keeps the soft-loss gradients on the same scale as the hard loss.
+    """
+    hard_loss = F.binary_cross_entropy_with_logits(student_logits, labels)
+    soft_targets = torch.sigmoid(teacher_logits / temperature)
+    soft_loss = F.binary_cross_entropy_with_logits(student_logits / temperature, soft_targets)
+    return alpha * hard_loss + (1 - alpha) * soft_loss * (temperature ** 2)
+
+def distill_epoch(student, teacher, data_loader, optimizer, device, temperature, alpha):
+    student.train()
+    teacher.eval()
+    total_loss = 0
+
+    for batch in tqdm(data_loader, desc="Distilling"):
+        input_ids = batch['input_ids'].to(device)
+        attention_mask = batch['attention_mask'].to(device)
+        images = batch['image'].to(device)
+        labels = batch['label'].to(device)
+        image_available = batch['image_available'].to(device)
+
+        with torch.no_grad():
+            teacher_logits = teacher(input_ids, attention_mask, images, image_available)
+
+        optimizer.zero_grad()
+        student_logits = student(input_ids, attention_mask, images, image_available)
+        loss = distillation_loss(student_logits, teacher_logits, labels, temperature, alpha)
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.item()
+
+    avg_loss = total_loss / len(data_loader)
+    logging.info(f"Distill Epoch Summary: Avg Loss: {avg_loss:.4f}")
+    return avg_loss
+
+# --- Reporting Helpers ---
+
+def measure_cpu_latency(model, batch, runs=LATENCY_RUNS):
+    """ Median single-item CPU latency in milliseconds. """
+    model = model.to('cpu').eval()
+    inputs = (
+        batch['input_ids'][:1],
+        batch['attention_mask'][:1],
+        batch['image'][:1],
+        batch['image_available'][:1],
+    )
+    timings = []
+    with torch.no_grad():
+        for _ in range(3): # warm-up
+            model(*inputs)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(*inputs)
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill the text-image teacher into a small CPU-friendly student.")
+    parser.add_argument('--teacher_path', type=str, default=str(BEST_MODEL_PATH),
+                        help=f"Teacher state dict (default: {BEST_MODEL_PATH})")
+    parser.add_argument('--output_path', type=str, default=str(STUDENT_MODEL_PATH),
+                        help=f"Where to save the student state dict (default: {STUDENT_MODEL_PATH})")
+    parser.add_argument('--student_text_model', type=str, default=STUDENT_TEXT_MODEL_NAME)
+    parser.add_argument('--student_image_model', type=str, default=STUDENT_IMAGE_MODEL_NAME)
+    parser.add_argument('--csv_path', type=str, default=str(CSV_PATH))
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--temperature', type=float, default=TEMPERATURE)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    return parser.parse_args()
+
+# --- Main Distillation Orchestration ---
+
+def main():
+    args = parse_args()
+    logging.info("--- Starting Knowledge Distillation ---")
+    start_time = time.time()
+
+    torch.manual_seed(RANDOM_SEED)
+    np.random.seed(RANDOM_SEED)
+
+    # 1. Load Data and Split (identical split to train_model.py)
+    try:
+        df = pd.read_csv(args.csv_path)
+        train_val_df, test_df = train_test_split(df, test_size=TEST_SPLIT, random_state=RANDOM_SEED, stratify=df['label'])
+        train_df, val_df = train_test_split(train_val_df, test_size=VALIDATION_SPLIT/(1-TEST_SPLIT), random_state=RANDOM_SEED, stratify=train_val_df['label'])
+        logging.info(f"Data split: Train={len(train_df)}, Val={len(val_df)}, Test={len(test_df)}")
+    except FileNotFoundError:
+        logging.error(f"FATAL: Processed CSV not found at {args.csv_path}. Run preprocess script first.")
+        return
+
+    # 2. Tokenizer: teacher and student consume the same input_ids, so vocabularies must match
+    teacher_config = load_model_config(args.teacher_path)
+    teacher_text_model = teacher_config.get('text_model_name', TEXT_MODEL_NAME)
+    tokenizer = get_tokenizer(teacher_text_model)
+    student_tokenizer = get_tokenizer(args.student_text_model)
+    if student_tokenizer.get_vocab() != tokenizer.get_vocab():
+        logging.error(f"FATAL: Student text model '{args.student_text_model}' does not share the {teacher_text_model} vocabulary.")
+        return
+
+    image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE)
+    train_image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE, augment=True)
+    train_dataset = MultimodalFakeNewsDataset(train_df, DATA_DIR, tokenizer, train_image_transform, MAX_TEXT_LEN)
+    val_dataset = MultimodalFakeNewsDataset(val_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    test_dataset = MultimodalFakeNewsDataset(test_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=2, pin_memory=True)
+    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+
+    # 3. Teacher and Student
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    logging.info(f"Using device: {device}")
+
+    teacher = MultimodalFakeNewsModel(
+        text_model_name=teacher_text_model,
+        image_model_name=teacher_config.get('image_model_name', IMAGE_MODEL_NAME),
+        fusion_output_dim=teacher_config.get('fusion_output_dim', FUSION_OUTPUT_DIM),
+        structure=teacher_config.get('structure'),
+    )
+    teacher.load_state_dict(load_state_dict(args.teacher_path))
+    teacher.to(device).eval()
+    for param in teacher.parameters():
+        param.requires_grad = False
+    logging.info(f"Teacher loaded from {args.teacher_path}")
+
+    student = MultimodalFakeNewsModel(
+        text_model_name=args.student_text_model,
+        image_model_name=args.student_image_model,
+        fusion_output_dim=FUSION_OUTPUT_DIM,
+    ).to(device)
+
+    optimizer = optim.AdamW([
+        {'params': student.text_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS * 5},
+        {'params': student.image_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS * 5},
+        {'params': student.fusion_layer.parameters(), 'lr': LEARNING_RATE_HEAD},
+        {'params': student.classifier.parameters(), 'lr': LEARNING_RATE_HEAD}
+    ], weight_decay=WEIGHT_DECAY)
+    scheduler = ReduceLROnPlateau(optimizer, mode='max', factor=LR_SCHEDULER_FACTOR, patience=LR_SCHEDULER_PATIENCE)
+    eval_loss_fn = nn.BCEWithLogitsLoss()
+
+    # 4. Distillation Loop
+    best_val_f1 = -1.0
+    epochs_no_improve = 0
+    for epoch in range(args.epochs):
+        logging.info(f"Epoch {epoch + 1}/{args.epochs}")
+        distill_epoch(student, teacher, train_loader, optimizer, device, args.temperature, args.alpha)
+        _, _, _, _, val_f1, _ = evaluate_epoch(student, val_loader, eval_loss_fn, device)
+        scheduler.step(val_f1)
+
+        if val_f1 > best_val_f1:
+            best_val_f1 = val_f1
+            epochs_no_improve = 0
+            torch.save(student.state_dict(), args.output_path)
+            logging.info(f"*** New best student saved to {args.output_path} with Val F1: {best_val_f1:.4f} ***")
+        else:
+            epochs_no_improve += 1
+            if epochs_no_improve >= EARLY_STOPPING_PATIENCE:
+                logging.info(f"--- Early stopping triggered after {epoch + 1} epochs. ---")
+                break
+
+    save_model_config(
+        args.output_path,
+        text_model_name=args.student_text_model,
+        image_model_name=args.student_image_model,
+        text_embedding_dim=student.text_embedding_dim,
+        img_embedding_dim=student.img_embedding_dim,
+    )
+
+    # 5. Accuracy / Latency Report
+    student.load_state_dict(torch.load(args.output_path, map_location='cpu'))
+    student.to(device)
+    rows = []
+    latency_batch = next(iter(test_loader))
+    for name, model, path in (('teacher', teacher, args.teacher_path), ('student', student, args.output_path)):
+        _, acc, prec, rec, f1, auc = evaluate_epoch(model, test_loader, eval_loss_fn, device)
+        latency_ms = measure_cpu_latency(model, latency_batch)
+        rows.append({
+            'model': name, 'path': path,
+            'params_m': count_parameters(model) / 1e6,
+            'accuracy': acc, 'f1': f1, 'auc': auc,
+            'cpu_latency_ms': latency_ms,
+        })
+
+    teacher_row, student_row = rows
+    lines = [
+        "--- Distillation Report (Test Set) ---",
+        f"Student: text={args.student_text_model}, image={args.student_image_model}, T={args.temperature}, alpha={args.alpha}",
+        f"{'Model':<10}{'Params(M)':>12}{'Accuracy':>10}{'F1':>8}{'AUC':>8}{'CPU ms':>10}",
+    ]
+    for row in rows:
+        lines.append(f"{row['model']:<10}{row['params_m']:>12.1f}{row['accuracy']:>10.4f}{row['f1']:>8.4f}{row['auc']:>8.4f}{row['cpu_latency_ms']:>10.1f}")
+    lines.append(f"\nSpeed-up: {teacher_row['cpu_latency_ms'] / student_row['cpu_latency_ms']:.2f}x, "
+                 f"F1 change: {student_row['f1'] - teacher_row['f1']:+.4f}")
+    report = '\n'.join(lines) + '\n'
+
+    report_path = RESULTS_DIR / 'distillation_report.txt'
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    logging.info(f"Distillation report saved to {report_path}:\n{report}")
+
+    logging.info(f"Total script duration: {(time.time() - start_time) / 60:.2f} minutes")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 # scripts/model_evaluation.py
 
 import os
+import json
 import pandas as pd
 import numpy as np
 import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import (
     accuracy_score,
     precision_score,
@@ -20,7 +20,6 @@ from sklearn.metrics import (
 from pathlib import Path
 import logging
 import time
-import joblib
 from tqdm import tqdm
 import argparse
 import matplotlib.pyplot as plt
@@ -29,7 +28,14 @@ import seaborn as sns
 # Import necessary classes and functions
 try:
     # Import only the necessary classes from train_model
-    from train_model import MultimodalFakeNewsModel, MetadataEncoder
+    from train_model import MultimodalFakeNewsModel, load_model_config
+    from quantization import quantize_model
+    # .pth or .safetensors (convert_checkpoint.py) state dicts
+    from checkpoint_format import load_state_dict
+    # Backbones default to the TEXT_MODEL_NAME / IMAGE_MODEL_NAME environment variables
+    from backbones import TEXT_MODEL_NAME, IMAGE_MODEL_NAME
+    # Same precision / memory-format handling as the backend
+    from precision import PRECISIONS, autocast_context, bf16_supported, prepare_model, prepare_images, write_precision_guard
     # Import necessary functions from data_loader
     from data_loader import (
         MultimodalFakeNewsDataset,
@@ -50,29 +56,15 @@ DATA_DIR = BASE_DIR / 'data'
 PROCESSED_DIR = DATA_DIR / 'processed'
 CSV_PATH = PROCESSED_DIR / 'processed_data.csv'
 OUTPUT_DIR = BASE_DIR / 'models'
-DEFAULT_MODEL_PATH = OUTPUT_DIR / 'best_multimodal_model.pth'
-DEFAULT_SCALER_PATH = OUTPUT_DIR / 'metadata_scaler.joblib'
+DEFAULT_MODEL_PATH = OUTPUT_DIR / 'best_text_image_model.pth'
 RESULTS_DIR = BASE_DIR / 'evaluation_results' # Directory to save evaluation outputs
 RESULTS_DIR.mkdir(exist_ok=True)
 
-# Model Parameters (Ensure these match the trained model's config)
-TEXT_MODEL_NAME = 'bert-base-chinese'
-IMAGE_MODEL_NAME = 'resnet50'
+# Model Parameters (defaults; the checkpoint's model.json sidecar takes precedence)
 IMAGE_MODEL_INPUT_SIZE = 224
 MAX_TEXT_LEN = 128
-NUM_METADATA_FEATURES = 9
-IMG_EMBEDDING_DIM = 2048
-TEXT_EMBEDDING_DIM = 768
-METADATA_EMBEDDING_DIM = 64
 FUSION_OUTPUT_DIM = 256
 
-# Metadata Columns (Ensure this matches the scaler and data)
-METADATA_COLS = [
-    'total_likes', 'total_comments', 'total_reposts', 'total_views',
-    'user_followers', 'user_following', 'user_posts', 'user_verified',
-    'user_total_favorited'
-]
-
 # Data Split Parameters (Must match training split)
 TEST_SPLIT = 0.15
 RANDOM_SEED = 42
@@ -81,35 +73,41 @@ RANDOM_SEED = 42
 # Inherit training BATCH_SIZE as a default or set a new one
 EVAL_BATCH_SIZE = 32 * 2 # Example: double the training batch size
 
+# Accuracy guard: a reduced precision is only marked safe for the backend if, on the
+# test split, it stays within these limits of the fp32 results
+MAX_F1_DROP = 0.005
+MAX_PROB_DIFF = 0.05
+
 # --- Evaluation Function ---
 
-def evaluate(model, data_loader, device):
+def evaluate(model, data_loader, device, precision='fp32', channels_last=False):
     """ Runs model inference on the data_loader and calculates metrics. """
     model.eval()
     all_preds_proba = []
     all_labels = []
     all_ids = []
 
-    logging.info("Starting evaluation...")
-    with torch.no_grad():
+    logging.info(f"Starting evaluation (precision={precision}, channels_last={channels_last})...")
+    start_time = time.time()
+    with torch.no_grad(), autocast_context(precision, device):
         for batch in tqdm(data_loader, desc="Evaluating"):
             # Move batch to device
             input_ids = batch['input_ids'].to(device)
             attention_mask = batch['attention_mask'].to(device)
-            images = batch['image'].to(device)
-            metadata = batch['metadata'].to(device)
+            images = prepare_images(batch['image'].to(device), channels_last)
             labels = batch['label'].to(device)
             image_available = batch['image_available'].to(device)
             item_ids = batch['id'] # Keep track of IDs if needed
 
             # Forward pass
-            outputs = model(input_ids, attention_mask, images, metadata, image_available)
-            probabilities = torch.sigmoid(outputs).cpu().numpy()
+            outputs = model(input_ids, attention_mask, images, image_available)
+            probabilities = torch.sigmoid(outputs.float()).cpu().numpy()
 
             all_preds_proba.extend(probabilities)
             all_labels.extend(labels.cpu().numpy())
             all_ids.extend(item_ids) # Store IDs
 
+    inference_seconds = time.time() - start_time
     logging.info("Evaluation loop finished. Calculating metrics...")
 
     # --- Calculate Metrics ---
@@ -137,7 +135,9 @@ def evaluate(model, data_loader, device):
         "F1 Score": f1,
         "AUC": auc,
         "Confusion Matrix": cm,
-        "Classification Report": class_report
+        "Classification Report": class_report,
+        "Probabilities": all_preds_proba,
+        "Inference Seconds": inference_seconds,
     }
 
     # Optionally return predictions and IDs for further analysis
@@ -146,6 +146,31 @@ def evaluate(model, data_loader, device):
     return metrics #, predictions_df
 
 
+def precision_guard(reference, candidate, max_f1_drop=MAX_F1_DROP, max_prob_diff=MAX_PROB_DIFF):
+    """ Compares a reduced-precision evaluation with the fp32 one on the same test split. """
+    prob_diff = np.abs(candidate['Probabilities'] - reference['Probabilities'])
+    f1_drop = reference['F1 Score'] - candidate['F1 Score']
+    reference_preds = reference['Probabilities'] >= 0.5
+    candidate_preds = candidate['Probabilities'] >= 0.5
+    result = {
+        'passed': bool(f1_drop <= max_f1_drop and prob_diff.max() <= max_prob_diff),
+        'f1_fp32': float(reference['F1 Score']),
+        'f1': float(candidate['F1 Score']),
+        'f1_drop': float(f1_drop),
+        'accuracy_fp32': float(reference['Accuracy']),
+        'accuracy': float(candidate['Accuracy']),
+        'max_prob_diff': float(prob_diff.max()),
+        'mean_prob_diff': float(prob_diff.mean()),
+        'flipped_predictions': int((reference_preds != candidate_preds).sum()),
+        'speedup': float(reference['Inference Seconds'] / max(candidate['Inference Seconds'], 1e-9)),
+        'max_f1_drop': max_f1_drop,
+        'max_prob_diff_limit': max_prob_diff,
+        'test_size': int(len(reference['Probabilities'])),
+        'evaluated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    return result
+
+
 def plot_confusion_matrix(cm, class_names, output_path):
     """ Plots and saves the confusion matrix. """
     try:
@@ -166,14 +191,22 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Evaluate a trained Multimodal Fake News Model.")
     parser.add_argument('--model_path', type=str, default=str(DEFAULT_MODEL_PATH),
                         help=f"Path to the trained model state dictionary (default: {DEFAULT_MODEL_PATH})")
-    parser.add_argument('--scaler_path', type=str, default=str(DEFAULT_SCALER_PATH),
-                        help=f"Path to the saved metadata scaler (default: {DEFAULT_SCALER_PATH})")
     parser.add_argument('--csv_path', type=str, default=str(CSV_PATH),
                         help=f"Path to the processed data CSV file (default: {CSV_PATH})")
     parser.add_argument('--batch_size', type=int, default=EVAL_BATCH_SIZE,
                         help=f"Batch size for evaluation (default: {EVAL_BATCH_SIZE})")
     parser.add_argument('--results_dir', type=str, default=str(RESULTS_DIR),
                         help=f"Directory to save evaluation results (default: {RESULTS_DIR})")
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32',
+                        help="Inference precision: fp32 or bf16 autocast (default: fp32)")
+    parser.add_argument('--channels_last', action='store_true',
+                        help="Run the image branch in channels_last memory format")
+    parser.add_argument('--accuracy_guard', action='store_true',
+                        help="Also evaluate fp32, compare it with --precision and record the result in the model.json sidecar (required by the backend to enable bf16)")
+    parser.add_argument('--max_f1_drop', type=float, default=MAX_F1_DROP,
+                        help=f"Accuracy guard: maximum allowed F1 drop vs fp32 (default: {MAX_F1_DROP})")
+    parser.add_argument('--max_prob_diff', type=float, default=MAX_PROB_DIFF,
+                        help=f"Accuracy guard: maximum allowed probability difference vs fp32 (default: {MAX_PROB_DIFF})")
     return parser.parse_args()
 
 
@@ -210,23 +243,16 @@ def main():
          logging.error(f"FATAL: Error loading or splitting data: {e}")
          return
 
-    # 3. Load Scaler
-    logging.info(f"Loading metadata scaler from {args.scaler_path}...")
-    try:
-        metadata_scaler = joblib.load(args.scaler_path)
-    except FileNotFoundError:
-        logging.error(f"FATAL: Metadata scaler not found at {args.scaler_path}. Evaluation requires the scaler used during training.")
-        # Option: Proceed without scaling metadata (might give poor results)
-        # metadata_scaler = None
-        # logging.warning("Proceeding without metadata scaling.")
-        return # Exit if scaler is essential
-    except Exception as e:
-         logging.error(f"FATAL: Error loading scaler: {e}")
-         return
+    # 3. Model Architecture (backbones recorded next to the checkpoint at training time)
+    model_config = load_model_config(args.model_path)
+    text_model_name = model_config.get('text_model_name', TEXT_MODEL_NAME)
+    image_model_name = model_config.get('image_model_name', IMAGE_MODEL_NAME)
+    max_text_len = model_config.get('max_text_len', MAX_TEXT_LEN)
+    logging.info(f"Model architecture: text={text_model_name}, image={image_model_name}")
 
     # 4. Setup Tokenizer and Transforms
     logging.info("Setting up tokenizer and image transforms...")
-    tokenizer = get_tokenizer(TEXT_MODEL_NAME)
+    tokenizer = get_tokenizer(text_model_name)
     # Use non-augmented transforms for evaluation
     image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE, augment=False)
 
@@ -238,9 +264,7 @@ def main():
             data_dir=DATA_DIR, # Pass the base data dir
             tokenizer=tokenizer,
             image_transform=image_transform,
-            max_len=MAX_TEXT_LEN, # Now uses the constant defined in this file
-            metadata_cols=METADATA_COLS, # Now uses the constant defined in this file
-            metadata_scaler=metadata_scaler # Use the loaded scaler (Corrected keyword argument)
+            max_len=max_text_len
         )
         test_loader = DataLoader(
             test_dataset,
@@ -256,20 +280,26 @@ def main():
 
     # 6. Load Model
     logging.info("Loading model...")
-    # Use the constants defined in this file to initialize the model structure
+    # Embedding dims are inferred from the backbones (and checked against the sidecar)
     model = MultimodalFakeNewsModel(
-        text_model_name=TEXT_MODEL_NAME,
-        image_model_name=IMAGE_MODEL_NAME,
-        num_metadata_features=NUM_METADATA_FEATURES,
-        text_embedding_dim=TEXT_EMBEDDING_DIM,
-        img_embedding_dim=IMG_EMBEDDING_DIM,
-        metadata_embedding_dim=METADATA_EMBEDDING_DIM,
-        fusion_output_dim=FUSION_OUTPUT_DIM
+        text_model_name=text_model_name,
+        image_model_name=image_model_name,
+        text_embedding_dim=model_config.get('text_embedding_dim'),
+        img_embedding_dim=model_config.get('img_embedding_dim'),
+        fusion_output_dim=model_config.get('fusion_output_dim', FUSION_OUTPUT_DIM),
+        structure=model_config.get('structure'), # pruned text encoder (prune_model.py)
     )
 
+    quantization = model_config.get('quantization')
+    if quantization:
+        # INT8 state dict from train_model.py --qat: rebuild the quantized modules first (CPU only)
+        quantize_model(model, quantization['modules'])
+        device = torch.device('cpu')
+        logging.info(f"Quantized model ({quantization['mode']}), evaluating on CPU")
+
     logging.info(f"Loading model state from: {args.model_path}")
     try:
-        model.load_state_dict(torch.load(args.model_path, map_location=device)) # Load to target device
+        model.load_state_dict(load_state_dict(args.model_path, map_location=device)) # Load to target device
         model.to(device)
         logging.info("Model loaded successfully.")
     except FileNotFoundError:
@@ -280,7 +310,21 @@ def main():
         return
 
     # 7. Perform Evaluation
-    metrics = evaluate(model, test_loader, device)
+    prepare_model(model, args.channels_last)
+    if args.precision == 'bf16' and device.type == 'cpu' and not bf16_supported():
+        logging.warning("This CPU has no native bf16 support; bf16 autocast will be emulated and slow.")
+    metrics = evaluate(model, test_loader, device, args.precision, args.channels_last)
+
+    guard = None
+    if args.accuracy_guard:
+        if args.precision == 'fp32':
+            logging.warning("--accuracy_guard has no effect with --precision fp32.")
+        else:
+            reference = evaluate(model, test_loader, device, 'fp32', args.channels_last)
+            guard = precision_guard(reference, metrics, args.max_f1_drop, args.max_prob_diff)
+            guard['channels_last'] = args.channels_last
+            write_precision_guard(args.model_path, args.precision, guard)
+            logging.info(f"Accuracy guard ({args.precision} vs fp32): {guard}")
 
     # 8. Display and Save Results
     logging.info("\n--- Test Set Evaluation Results ---")
@@ -289,6 +333,10 @@ def main():
     print(f"Recall: {metrics['Recall']:.4f}")
     print(f"F1 Score: {metrics['F1 Score']:.4f}")
     print(f"AUC: {metrics['AUC']:.4f}")
+    if guard:
+        status = "PASSED" if guard['passed'] else "FAILED"
+        print(f"\nAccuracy guard ({args.precision} vs fp32): {status} - F1 drop {guard['f1_drop']:.4f}, "
+              f"max prob diff {guard['max_prob_diff']:.4f}, flipped {guard['flipped_predictions']}, speedup {guard['speedup']:.2f}x")
     print("\nClassification Report:")
     print(metrics['Classification Report'])
     print("\nConfusion Matrix:")
@@ -303,7 +351,8 @@ def main():
         with open(results_file_path, "w", encoding="utf-8") as f:
             f.write("--- Test Set Evaluation Results ---\n")
             f.write(f"Model Path: {args.model_path}\n")
-            f.write(f"Scaler Path: {args.scaler_path}\n")
+            f.write(f"Backbones: text={text_model_name}, image={image_model_name}\n")
+            f.write(f"Precision: {args.precision}, channels_last: {args.channels_last}\n")
             f.write(f"Data CSV: {args.csv_path}\n")
             f.write(f"Evaluation Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write("------------------------------------\n")
@@ -312,6 +361,8 @@ def main():
             f.write(f"Recall: {metrics['Recall']:.4f}\n")
             f.write(f"F1 Score: {metrics['F1 Score']:.4f}\n")
             f.write(f"AUC: {metrics['AUC']:.4f}\n\n")
+            if guard:
+                f.write(f"Accuracy Guard ({args.precision} vs fp32): {json.dumps(guard)}\n\n")
             f.write("Classification Report:\n")
             f.write(metrics['Classification Report'])
             f.write("\n\nConfusion Matrix:\n")
@@ -0,0 +1,60 @@
+# scripts/precision.py
+
+import json
+import logging
+from contextlib import nullcontext
+from pathlib import Path
+
+import torch
+
+# --- Inference Precision ---
+# fp32: plain eager inference.
+# bf16: torch.autocast runs matmuls/convolutions in bfloat16 (AMX/AVX512-BF16 on recent
+#       Xeons) and keeps numerically sensitive ops (softmax, layer norm, loss) in fp32.
+# channels_last only changes the memory layout of the image branch (NHWC convolutions
+# are faster with oneDNN) and is applied independently of the precision.
+# The backend (backend/detection/ml/precision.py) applies the same settings and only
+# enables bf16 for a checkpoint whose accuracy guard, written by model_evaluation.py
+# --accuracy_guard, passed.
+
+PRECISIONS = ('fp32', 'bf16')
+GUARD_KEY = 'precision_guard'
+
+
+def bf16_supported():
+    """ True when the CPU has native bf16 instructions (otherwise bf16 is emulated and slow) """
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def autocast_context(precision, device):
+    """ Context manager running the forward pass in the requested precision """
+    if precision == 'bf16':
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def prepare_model(model, channels_last=False):
+    """ Converts the image branch to channels_last memory format if requested """
+    if channels_last:
+        model.image_encoder.to(memory_format=torch.channels_last)
+    return model
+
+
+def prepare_images(images, channels_last=False):
+    return images.contiguous(memory_format=torch.channels_last) if channels_last else images
+
+
+def write_precision_guard(model_path, precision, result):
+    """ Records the accuracy guard result for `precision` in the checkpoint's model.json sidecar """
+    config_path = Path(model_path).with_suffix('.json')
+    config = {}
+    if config_path.is_file():
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config.setdefault(GUARD_KEY, {})[precision] = result
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    logging.info(f"Precision guard for {precision} saved to {config_path}")
@@ -0,0 +1,313 @@
+# scripts/prune_model.py
+
+import argparse
+import copy
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from torch.utils.flop_counter import FlopCounterMode
+from sklearn.model_selection import train_test_split
+
+from data_loader import MultimodalFakeNewsDataset, get_tokenizer, get_image_transforms
+from train_model import (
+    MultimodalFakeNewsModel,
+    train_epoch, evaluate_epoch,
+    save_model_config, load_model_config,
+    BASE_DIR, DATA_DIR, CSV_PATH, OUTPUT_DIR, BEST_MODEL_PATH,
+    TEXT_MODEL_NAME, IMAGE_MODEL_NAME, IMAGE_MODEL_INPUT_SIZE, MAX_TEXT_LEN,
+    FUSION_OUTPUT_DIM,
+    VALIDATION_SPLIT, TEST_SPLIT, RANDOM_SEED,
+    LEARNING_RATE_ENCODERS, LEARNING_RATE_HEAD, WEIGHT_DECAY,
+)
+from distill_model import measure_cpu_latency, count_parameters
+from checkpoint_format import load_state_dict
+from pruning import encoder_layers, prune_heads, prune_ffn, drop_layers, prune_fusion
+
+# --- Configuration ---
+PRUNED_DIR = OUTPUT_DIR / 'pruned'
+RESULTS_DIR = BASE_DIR / 'evaluation_results'
+RESULTS_DIR.mkdir(exist_ok=True)
+
+# Fraction of attention heads / FFN neurons / fusion neurons removed at each level
+PRUNING_LEVELS = (0.25, 0.5, 0.75)
+FINETUNE_EPOCHS = 1
+BATCH_SIZE = 32
+
+# --- Importance Scores ---
+# First-order Taylor importance on the validation split (Michel et al., 2019 for heads):
+# |dL/d mask| for a gate multiplying each head's context vector, and |activation * grad|
+# summed over tokens for each FFN / fusion neuron. Dropout is off (eval mode) and the
+# weights get no gradients, only the gates and activations do.
+
+def compute_importance(model, data_loader, device, max_batches=None):
+    text_encoder = model.text_encoder
+    layers = encoder_layers(text_encoder)
+    num_heads = text_encoder.config.num_attention_heads
+    head_gates = torch.ones(len(layers), num_heads, device=device, requires_grad=True)
+    ffn_scores = [torch.zeros(layer.intermediate.dense.out_features, device=device) for layer in layers]
+    fusion_scores = torch.zeros(model.fusion_layer[0].out_features, device=device)
+    hooks = []
+
+    def gate_heads(index):
+        def hook(module, inputs, output):
+            context = output[0]
+            batch, seq_len, width = context.shape
+            context = context.view(batch, seq_len, num_heads, width // num_heads) * head_gates[index].view(1, 1, -1, 1)
+            return (context.view(batch, seq_len, width),) + tuple(output[1:])
+        return hook
+
+    def taylor(scores, reduce_dims):
+        def hook(module, inputs, output):
+            def accumulate(grad):
+                scores.add_((output * grad).abs().sum(dim=reduce_dims).detach())
+            output.register_hook(accumulate)
+        return hook
+
+    for i, layer in enumerate(layers):
+        hooks.append(layer.attention.self.register_forward_hook(gate_heads(i)))
+        hooks.append(layer.intermediate.register_forward_hook(taylor(ffn_scores[i], (0, 1))))
+    hooks.append(model.fusion_layer[1].register_forward_hook(taylor(fusion_scores, (0,))))
+
+    requires_grad = [p.requires_grad for p in model.parameters()]
+    for param in model.parameters():
+        param.requires_grad_(False)
+    loss_fn = nn.BCEWithLogitsLoss()
+    head_scores = torch.zeros_like(head_gates)
+    model.eval()
+    try:
+        for step, batch in enumerate(data_loader):
+            if max_batches is not None and step >= max_batches:
+                break
+            outputs = model(batch['input_ids'].to(device), batch['attention_mask'].to(device),
+                            batch['image'].to(device), batch['image_available'].to(device))
+            loss = loss_fn(outputs, batch['label'].to(device))
+            loss.backward()
+            head_scores += head_gates.grad.abs()
+            head_gates.grad = None
+    finally:
+        for hook in hooks:
+            hook.remove()
+        for param, flag in zip(model.parameters(), requires_grad):
+            param.requires_grad_(flag)
+
+    # Per-layer L2 normalisation makes head scores comparable across layers
+    head_scores = head_scores / head_scores.norm(dim=1, keepdim=True).clamp(min=1e-12)
+    return {'heads': head_scores.cpu(), 'ffn': [s.cpu() for s in ffn_scores], 'fusion': fusion_scores.cpu()}
+
+# --- Pruning ---
+
+def lowest(scores, fraction):
+    """ Indices of the round(fraction * n) lowest scores """
+    count = int(round(fraction * len(scores)))
+    return set(torch.argsort(scores)[:count].tolist())
+
+def kept_index(scores, fraction):
+    removed = lowest(scores, fraction)
+    return torch.tensor([i for i in range(len(scores)) if i not in removed], dtype=torch.long)
+
+def plan_heads(head_scores, fraction):
+    """ Globally lowest heads, keeping at least one head per layer """
+    num_layers, num_heads = head_scores.shape
+    budget = int(round(fraction * num_layers * num_heads))
+    remaining = [num_heads] * num_layers
+    heads = {layer: [] for layer in range(num_layers)}
+    for flat in torch.argsort(head_scores.flatten()).tolist():
+        if budget == 0:
+            break
+        layer, head = divmod(flat, num_heads)
+        if remaining[layer] > 1:
+            heads[layer].append(head)
+            remaining[layer] -= 1
+            budget -= 1
+    return heads
+
+def prune(model, scores, fraction, dropped_layers=(), prune_fusion_layer=True):
+    """ Pruned copy of the model and its sidecar structure (original layer/head numbering) """
+    model = copy.deepcopy(model)
+    text_encoder = model.text_encoder
+    num_layers = len(encoder_layers(text_encoder))
+    keep_layers = [i for i in range(num_layers) if i not in set(dropped_layers)]
+
+    heads = plan_heads(scores['heads'], fraction)
+    heads = {layer: h for layer, h in heads.items() if layer in keep_layers and h}
+    prune_heads(text_encoder, heads)
+    for i, layer in enumerate(encoder_layers(text_encoder)):
+        if i in keep_layers and fraction > 0:
+            prune_ffn(layer, kept_index(scores['ffn'][i], fraction))
+    if len(keep_layers) < num_layers:
+        drop_layers(text_encoder, keep_layers)
+    if prune_fusion_layer and fraction > 0:
+        prune_fusion(model, kept_index(scores['fusion'], fraction))
+
+    structure = {
+        'text_layers': keep_layers,
+        'pruned_heads': {str(layer): h for layer, h in heads.items()},
+        'intermediate_sizes': [layer.intermediate.dense.out_features for layer in encoder_layers(text_encoder)],
+    }
+    return model, structure
+
+# --- Reporting Helpers ---
+
+def count_flops(model, batch):
+    """ Forward FLOPs for a single item (matmuls and convolutions) """
+    model = model.to('cpu').eval()
+    with torch.no_grad(), FlopCounterMode(display=False) as counter:
+        model(batch['input_ids'][:1], batch['attention_mask'][:1], batch['image'][:1], batch['image_available'][:1])
+    return counter.get_total_flops()
+
+def count_heads(model):
+    return sum(layer.attention.self.num_attention_heads for layer in encoder_layers(model.text_encoder))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Structured pruning of the text encoder (heads, FFN neurons, layers) and the fusion layer.")
+    parser.add_argument('--model_path', type=str, default=str(BEST_MODEL_PATH),
+                        help=f"fp32 checkpoint to prune (default: {BEST_MODEL_PATH})")
+    parser.add_argument('--output_dir', type=str, default=str(PRUNED_DIR),
+                        help=f"Where to save the pruned checkpoints (default: {PRUNED_DIR})")
+    parser.add_argument('--csv_path', type=str, default=str(CSV_PATH))
+    parser.add_argument('--levels', type=str, default=','.join(str(l) for l in PRUNING_LEVELS),
+                        help="Comma-separated fractions of heads / FFN neurons / fusion neurons to remove")
+    parser.add_argument('--drop_layers', type=str, default='',
+                        help="Comma-separated encoder layer indices to remove entirely at every level")
+    parser.add_argument('--keep_fusion', action='store_true', help="Do not prune fusion-layer neurons")
+    parser.add_argument('--finetune_epochs', type=int, default=FINETUNE_EPOCHS)
+    parser.add_argument('--score_batches', type=int, default=None,
+                        help="Validation batches used for importance scores (default: all)")
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE)
+    return parser.parse_args()
+
+# --- Main Pruning Orchestration ---
+
+def main():
+    args = parse_args()
+    logging.info("--- Starting Structured Pruning ---")
+    start_time = time.time()
+
+    torch.manual_seed(RANDOM_SEED)
+    np.random.seed(RANDOM_SEED)
+    levels = [float(l) for l in args.levels.split(',') if l.strip()]
+    dropped_layers = [int(i) for i in args.drop_layers.split(',') if i.strip()]
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 1. Load Data and Split (identical split to train_model.py)
+    try:
+        df = pd.read_csv(args.csv_path)
+        train_val_df, test_df = train_test_split(df, test_size=TEST_SPLIT, random_state=RANDOM_SEED, stratify=df['label'])
+        train_df, val_df = train_test_split(train_val_df, test_size=VALIDATION_SPLIT/(1-TEST_SPLIT), random_state=RANDOM_SEED, stratify=train_val_df['label'])
+        logging.info(f"Data split: Train={len(train_df)}, Val={len(val_df)}, Test={len(test_df)}")
+    except FileNotFoundError:
+        logging.error(f"FATAL: Processed CSV not found at {args.csv_path}. Run preprocess script first.")
+        return
+
+    model_config = load_model_config(args.model_path)
+    if model_config.get('quantization') or model_config.get('structure'):
+        logging.error(f"FATAL: {args.model_path} is already quantized or pruned, start from an unpruned fp32 checkpoint.")
+        return
+    text_model_name = model_config.get('text_model_name', TEXT_MODEL_NAME)
+    image_model_name = model_config.get('image_model_name', IMAGE_MODEL_NAME)
+
+    tokenizer = get_tokenizer(text_model_name)
+    image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE)
+    train_image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE, augment=True)
+    train_dataset = MultimodalFakeNewsDataset(train_df, DATA_DIR, tokenizer, train_image_transform, MAX_TEXT_LEN)
+    val_dataset = MultimodalFakeNewsDataset(val_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    test_dataset = MultimodalFakeNewsDataset(test_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=2, pin_memory=True)
+    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+
+    # 2. Model and importance scores
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    logging.info(f"Using device: {device}")
+    base_model = MultimodalFakeNewsModel(
+        text_model_name=text_model_name,
+        image_model_name=image_model_name,
+        fusion_output_dim=model_config.get('fusion_output_dim', FUSION_OUTPUT_DIM),
+    )
+    base_model.load_state_dict(load_state_dict(args.model_path))
+    base_model.to(device)
+    logging.info(f"Model loaded from {args.model_path}")
+
+    logging.info("Scoring attention heads, FFN neurons and fusion neurons on the validation split...")
+    scores = compute_importance(base_model, val_loader, device, args.score_batches)
+
+    # 3. Prune, fine-tune and measure each level (level 0 = the unpruned model)
+    loss_fn = nn.BCEWithLogitsLoss()
+    latency_batch = next(iter(test_loader))
+    rows = []
+    for level in [0.0] + levels:
+        if level == 0.0:
+            model, structure, path = base_model, None, args.model_path
+        else:
+            model, structure = prune(base_model.cpu(), scores, level, dropped_layers, not args.keep_fusion)
+            model.to(device)
+            optimizer = optim.AdamW([
+                {'params': model.text_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS},
+                {'params': model.image_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS},
+                {'params': model.fusion_layer.parameters(), 'lr': LEARNING_RATE_HEAD},
+                {'params': model.classifier.parameters(), 'lr': LEARNING_RATE_HEAD}
+            ], weight_decay=WEIGHT_DECAY)
+            for epoch in range(args.finetune_epochs):
+                logging.info(f"Level {level:.0%}: fine-tuning epoch {epoch + 1}/{args.finetune_epochs}")
+                train_epoch(model, train_loader, loss_fn, optimizer, device)
+
+            path = output_dir / f'pruned_{round(level * 100)}.pth'
+            torch.save(model.state_dict(), path)
+            save_model_config(path, text_model_name, image_model_name,
+                              model.text_embedding_dim, model.img_embedding_dim,
+                              fusion_output_dim=model.classifier.in_features, structure=structure)
+            logging.info(f"Pruned model ({level:.0%}) saved to {path}")
+
+        model.to(device)
+        _, _, _, _, val_f1, _ = evaluate_epoch(model, val_loader, loss_fn, device)
+        _, test_acc, _, _, test_f1, test_auc = evaluate_epoch(model, test_loader, loss_fn, device)
+        rows.append({
+            'level': level,
+            'path': str(path),
+            'layers': len(encoder_layers(model.text_encoder)),
+            'heads': count_heads(model),
+            'ffn': sum(layer.intermediate.dense.out_features for layer in encoder_layers(model.text_encoder)),
+            'fusion': model.classifier.in_features,
+            'params_m': count_parameters(model) / 1e6,
+            'gflops': count_flops(model, latency_batch) / 1e9,
+            'cpu_latency_ms': measure_cpu_latency(model, latency_batch),
+            'val_f1': val_f1, 'test_f1': test_f1, 'test_acc': test_acc, 'test_auc': test_auc,
+        })
+        model.to(device)
+
+    # 4. Report
+    baseline = rows[0]
+    lines = [
+        "--- Structured Pruning Report ---",
+        f"Model: {args.model_path} (text={text_model_name}, image={image_model_name})",
+        f"Dropped layers: {dropped_layers or 'none'}, fusion pruned: {not args.keep_fusion}, "
+        f"fine-tune epochs: {args.finetune_epochs}",
+        f"{'Level':>6}{'Layers':>8}{'Heads':>7}{'FFN':>8}{'Fusion':>8}{'Params(M)':>11}{'GFLOPs':>9}"
+        f"{'CPU ms':>9}{'Val F1':>8}{'Test F1':>9}{'dF1':>8}",
+    ]
+    for row in rows:
+        lines.append(f"{row['level']:>6.0%}{row['layers']:>8}{row['heads']:>7}{row['ffn']:>8}{row['fusion']:>8}"
+                     f"{row['params_m']:>11.1f}{row['gflops']:>9.2f}{row['cpu_latency_ms']:>9.1f}"
+                     f"{row['val_f1']:>8.4f}{row['test_f1']:>9.4f}{row['test_f1'] - baseline['test_f1']:>+8.4f}")
+    lines.append("\nCheckpoints:")
+    for row in rows[1:]:
+        lines.append(f"  {row['level']:.0%}: {row['path']}")
+    report = '\n'.join(lines) + '\n'
+
+    report_path = RESULTS_DIR / 'pruning_report.txt'
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+    logging.info(f"Pruning report saved to {report_path}:\n{report}")
+
+    logging.info(f"Total script duration: {(time.time() - start_time) / 60:.2f} minutes")
+
+if __name__ == '__main__':
+    main()
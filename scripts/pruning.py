@@ -0,0 +1,64 @@
+# scripts/pruning.py
+
+import torch
+import torch.nn as nn
+from transformers.pytorch_utils import prune_linear_layer
+
+# --- Structured Pruning ---
+# Pruning removes rows/columns for real: attention heads shrink the query/key/value
+# and attention-output projections, FFN neurons shrink the intermediate/output dense
+# layers, dropped layers leave the encoder, and fusion neurons shrink the fusion
+# Linear and the classifier input (fusion_output_dim).
+# The result is described by a 'structure' entry in the model.json sidecar:
+#   {'text_layers': [original indices of the kept encoder layers],
+#    'pruned_heads': {original layer index: [original head indices removed]},
+#    'intermediate_sizes': [FFN width of each kept layer]}
+# plus the reduced fusion_output_dim. apply_structure() reshapes a freshly built
+# model the same way, so the pruned state dict loads with plain load_state_dict.
+# Mirrored in backend/detection/ml/pruning.py.
+
+
+def encoder_layers(text_encoder):
+    """ The transformer blocks of a BERT-style HuggingFace encoder """
+    return text_encoder.encoder.layer
+
+
+def prune_heads(text_encoder, heads):
+    """ Removes attention heads, {layer index: [head indices]} """
+    heads = {int(layer): sorted(h) for layer, h in heads.items() if h}
+    if heads:
+        text_encoder.prune_heads(heads)
+
+
+def prune_ffn(layer, keep_index):
+    """ Keeps only the FFN neurons in keep_index of one encoder layer """
+    layer.intermediate.dense = prune_linear_layer(layer.intermediate.dense, keep_index, dim=0)
+    layer.output.dense = prune_linear_layer(layer.output.dense, keep_index, dim=1)
+
+
+def drop_layers(text_encoder, keep_layers):
+    """ Keeps only the encoder layers in keep_layers (original indices, in order) """
+    layers = encoder_layers(text_encoder)
+    text_encoder.encoder.layer = nn.ModuleList([layers[i] for i in keep_layers])
+    text_encoder.config.num_hidden_layers = len(keep_layers)
+
+
+def prune_fusion(model, keep_index):
+    """ Keeps only the fusion neurons in keep_index (fusion Linear outputs = classifier inputs) """
+    model.fusion_layer[0] = prune_linear_layer(model.fusion_layer[0], keep_index, dim=0)
+    model.classifier = prune_linear_layer(model.classifier, keep_index, dim=1)
+
+
+def apply_structure(model, structure):
+    """
+    Reshapes an unpruned model to a sidecar 'structure' before its state dict is loaded.
+    Which neurons are kept does not matter here, the weights come from the checkpoint.
+    """
+    text_encoder = model.text_encoder
+    prune_heads(text_encoder, structure.get('pruned_heads', {}))
+    if 'text_layers' in structure:
+        drop_layers(text_encoder, structure['text_layers'])
+    for layer, size in zip(encoder_layers(text_encoder), structure.get('intermediate_sizes', [])):
+        if size != layer.intermediate.dense.out_features:
+            prune_ffn(layer, torch.arange(size))
+    return model
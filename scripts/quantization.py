@@ -0,0 +1,122 @@
+# scripts/quantization.py
+
+import copy
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+# --- INT8 Quantization ---
+# Deployment target is dynamic INT8 on CPU (torch.ao.nn.quantized.dynamic.Linear):
+# weights are stored as per-output-channel symmetric int8, activations are quantized
+# per tensor at run time from their min/max (7-bit, reduce_range, on x86).
+# Quantization-aware training simulates exactly that: FakeQuantLinear rounds its input
+# and weight to the int8 grid in the forward pass, and gradients flow straight through
+# the rounding (straight-through estimator), so fine-tuning learns weights that
+# survive the rounding. Only nn.Linear layers are quantized (text encoder, fusion head,
+# classifier); the CNN image branch stays fp32, dynamic quantization has no conv kernels.
+# The backend rebuilds the quantized model from the sidecar (backend/detection/ml/quantization.py).
+
+QUANTIZATION_MODE = 'dynamic_int8'
+QUANT_MODULES = ('text_encoder', 'fusion_layer', 'classifier')
+
+WEIGHT_QMIN, WEIGHT_QMAX = -128, 127
+# quantized::linear_dynamic uses reduce_range=True for qint8 weights
+ACT_QMIN, ACT_QMAX = 0, 127
+
+
+def fake_quant_weight(weight):
+    """ Per-output-channel symmetric int8 (matches per_channel_dynamic_qconfig) """
+    with torch.no_grad():
+        max_abs = weight.abs().amax(dim=1).clamp(min=1e-8)
+        scale = (max_abs / ((WEIGHT_QMAX - WEIGHT_QMIN) / 2)).float()
+        zero_point = torch.zeros_like(scale, dtype=torch.int32)
+    return torch.fake_quantize_per_channel_affine(weight, scale, zero_point, 0, WEIGHT_QMIN, WEIGHT_QMAX)
+
+
+def fake_quant_activation(x):
+    """ Per-tensor affine quantization from the tensor's own min/max, like dynamic quantization """
+    with torch.no_grad():
+        min_val = x.min().clamp(max=0)
+        max_val = x.max().clamp(min=0)
+        scale = ((max_val - min_val) / (ACT_QMAX - ACT_QMIN)).clamp(min=1e-8).float().reshape(1)
+        zero_point = (ACT_QMIN - torch.round(min_val / scale)).clamp(ACT_QMIN, ACT_QMAX).to(torch.int32).reshape(1)
+    return torch.fake_quantize_per_tensor_affine(x, scale, zero_point, ACT_QMIN, ACT_QMAX)
+
+
+class FakeQuantLinear(nn.Linear):
+    """ nn.Linear that simulates dynamic INT8 inference in its forward pass """
+
+    @classmethod
+    def from_linear(cls, linear):
+        module = cls(linear.in_features, linear.out_features, bias=linear.bias is not None,
+                     device=linear.weight.device, dtype=linear.weight.dtype)
+        module.weight = linear.weight
+        module.bias = linear.bias
+        return module
+
+    def forward(self, x):
+        return F.linear(fake_quant_activation(x), fake_quant_weight(self.weight), self.bias)
+
+
+def _replace_linears(module, convert):
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear):
+            setattr(module, name, convert(child))
+        else:
+            _replace_linears(child, convert)
+
+
+def _convert_modules(model, convert, modules):
+    for name in modules:
+        child = getattr(model, name)
+        if isinstance(child, nn.Linear):
+            setattr(model, name, convert(child))
+        else:
+            _replace_linears(child, convert)
+
+
+def prepare_qat(model, modules=QUANT_MODULES):
+    """ Swaps the nn.Linear layers of `modules` for FakeQuantLinear (in place, parameters shared) """
+    _convert_modules(model, lambda l: l if isinstance(l, FakeQuantLinear) else FakeQuantLinear.from_linear(l), modules)
+    return model
+
+
+def _to_plain_linear(linear):
+    if not isinstance(linear, FakeQuantLinear):
+        return linear
+    module = nn.Linear(linear.in_features, linear.out_features, bias=linear.bias is not None,
+                       device=linear.weight.device, dtype=linear.weight.dtype)
+    module.weight = linear.weight
+    module.bias = linear.bias
+    return module
+
+
+def quantize_model(model, modules=QUANT_MODULES):
+    """ Converts the nn.Linear layers of `modules` to dynamic INT8 (CPU only, in place) """
+    model.cpu().eval()
+    # Name only the nn.Linear layers: a qconfig on a parent would also reach e.g. nn.Embedding
+    linear_names = [
+        name for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and any(name == m or name.startswith(m + '.') for m in modules)
+    ]
+    quantize_dynamic(model, {name: per_channel_dynamic_qconfig for name in linear_names}, inplace=True)
+    return model
+
+
+def export_int8(model, output_path=None, modules=QUANT_MODULES):
+    """ INT8 copy of a (QAT-prepared or fp32) model, saved to output_path if given """
+    int8_model = copy.deepcopy(model).cpu()
+    _convert_modules(int8_model, _to_plain_linear, modules)
+    quantize_model(int8_model, modules)
+    if output_path:
+        torch.save(int8_model.state_dict(), output_path)
+        logging.info(f"INT8 model saved to {output_path}")
+    return int8_model
+
+
+def quantization_config(modules=QUANT_MODULES, **extra):
+    """ Sidecar entry telling loaders how to rebuild the quantized model """
+    return {'mode': QUANTIZATION_MODE, 'modules': list(modules), 'qscheme': 'per_channel_symmetric', **extra}
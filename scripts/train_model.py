@@ -8,17 +8,25 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, Subset
 from torch.optim.lr_scheduler import ReduceLROnPlateau
-from torchvision.models import resnet50, ResNet50_Weights
-from transformers import AutoModel, AutoTokenizer
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, roc_auc_score
 from pathlib import Path
 import logging
 import time
+import json
+import argparse
 from tqdm import tqdm
 
 # Import the modified Dataset (不包含 metadata)
 from data_loader import MultimodalFakeNewsDataset, get_tokenizer, get_image_transforms
+# Backbone registry; TEXT_MODEL_NAME / IMAGE_MODEL_NAME come from the environment
+from backbones import build_image_encoder, build_text_encoder, TEXT_MODEL_NAME, IMAGE_MODEL_NAME
+# Quantization-aware fine-tuning (--qat) and INT8 export
+from quantization import prepare_qat, export_int8, quantize_model, quantization_config
+# Pruned text encoders (prune_model.py) are rebuilt from the sidecar 'structure'
+from pruning import apply_structure
+# --init_model may also be a converted .safetensors checkpoint
+from checkpoint_format import load_state_dict
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,13 +42,10 @@ OUTPUT_DIR.mkdir(exist_ok=True)
 # BEST_MODEL_PATH = OUTPUT_DIR / 'best_multimodal_model.pth' # 可以重命名，避免覆盖旧模型
 BEST_MODEL_PATH = OUTPUT_DIR / 'best_text_image_model.pth' 
 
-TEXT_MODEL_NAME = 'bert-base-chinese'
-IMAGE_MODEL_NAME = 'resnet50'
+# TEXT_MODEL_NAME / IMAGE_MODEL_NAME: see backbones.py (embedding dims are inferred)
 IMAGE_MODEL_INPUT_SIZE = 224
 MAX_TEXT_LEN = 128
 # NUM_METADATA_FEATURES = 0 # 移除
-IMG_EMBEDDING_DIM = 2048 
-TEXT_EMBEDDING_DIM = 768 
 # METADATA_EMBEDDING_DIM = 0 # 移除
 FUSION_OUTPUT_DIM = 256 
 
@@ -56,6 +61,11 @@ EARLY_STOPPING_PATIENCE = 3
 LR_SCHEDULER_PATIENCE = 1 
 LR_SCHEDULER_FACTOR = 0.1 
 
+# Quantization-aware fine-tuning (--qat): starts from the fp32 best model, few epochs, small LR
+QAT_MODEL_PATH = OUTPUT_DIR / 'best_text_image_model_int8.pth'
+QAT_EPOCHS = 3
+QAT_LR_SCALE = 0.1
+
 # --- Model Definition (移除 MetadataEncoder 和相关逻辑) ---
 
 # 移除 MetadataEncoder 类
@@ -68,27 +78,28 @@ class MultimodalFakeNewsModel(nn.Module):
     """
     # 移除 num_metadata_features, metadata_embedding_dim 参数
     def __init__(self, text_model_name, image_model_name,
-                 text_embedding_dim, img_embedding_dim,
-                 fusion_output_dim, freeze_encoders=False):
+                 text_embedding_dim=None, img_embedding_dim=None,
+                 fusion_output_dim=FUSION_OUTPUT_DIM, freeze_encoders=False, structure=None):
         super().__init__()
         logging.info("Initializing Text-Image Multimodal Model...")
+        self.text_model_name = text_model_name
+        self.image_model_name = image_model_name
 
-        # Text Encoder (保持不变)
+        # Text Encoder (any HuggingFace encoder, dim = hidden_size)
         logging.info(f"Loading text model: {text_model_name}")
-        self.text_encoder = AutoModel.from_pretrained(text_model_name)
+        self.text_encoder, self.text_embedding_dim = build_text_encoder(text_model_name)
 
-        # Image Encoder (保持不变)
+        # Image Encoder (see backbones.IMAGE_BACKBONES, dim inferred from the removed classifier)
         logging.info(f"Loading image model: {image_model_name}")
-        if image_model_name == 'resnet50':
-            weights = ResNet50_Weights.IMAGENET1K_V2
-            self.image_encoder = resnet50(weights=weights)
-            self.image_encoder.fc = nn.Identity()
-            self.img_embedding_dim = IMG_EMBEDDING_DIM
-            self.image_transform = weights.transforms()
-            self.image_input_size = 224
-            logging.info(f"Using standard ResNet50 transforms (input size {self.image_input_size})")
-        else:
-            raise ValueError(f"Image model '{image_model_name}' not currently supported.")
+        self.image_encoder, self.img_embedding_dim, self.image_transform = build_image_encoder(image_model_name)
+        self.image_input_size = self.image_transform.crop_size[0]
+        logging.info(f"Using {image_model_name} image encoder (embedding dim {self.img_embedding_dim}, input size {self.image_input_size})")
+
+        # Explicit dims are only checked against the backbones
+        for label, expected, inferred in (('text', text_embedding_dim, self.text_embedding_dim),
+                                          ('image', img_embedding_dim, self.img_embedding_dim)):
+            if expected is not None and expected != inferred:
+                raise ValueError(f"{label} embedding dim {expected} does not match the {inferred} of its backbone.")
         
         # 移除 Metadata Encoder 初始化
         # logging.info("Initializing metadata encoder (MLP)...")
@@ -105,7 +116,7 @@ class MultimodalFakeNewsModel(nn.Module):
         # Fusion Layer (调整输入维度)
         logging.info("Initializing fusion layer...")
         # 新的融合维度只包含文本和图像
-        self.fusion_dim = text_embedding_dim + self.img_embedding_dim 
+        self.fusion_dim = self.text_embedding_dim + self.img_embedding_dim 
         self.fusion_layer = nn.Sequential(
             nn.Linear(self.fusion_dim, fusion_output_dim),
             nn.ReLU(),
@@ -116,6 +127,10 @@ class MultimodalFakeNewsModel(nn.Module):
         logging.info("Initializing classifier head...")
         self.classifier = nn.Linear(fusion_output_dim, 1)
 
+        # Pruned checkpoints: reshape the text encoder before load_state_dict (see pruning.py)
+        if structure:
+            apply_structure(self, structure)
+
     # 移除 forward 方法中的 metadata 参数
     def forward(self, input_ids, attention_mask, image, image_available):
         # Text Features (保持不变)
@@ -129,7 +144,8 @@ class MultimodalFakeNewsModel(nn.Module):
         if valid_image_mask.any():
             valid_images = image[valid_image_mask]
             valid_image_features = self.image_encoder(valid_images)
-            image_features[valid_image_mask] = valid_image_features
+            # Under bf16 autocast the encoder output is bfloat16
+            image_features[valid_image_mask] = valid_image_features.to(image_features.dtype)
 
         # 移除 Metadata Features 处理
         # metadata_features = self.metadata_encoder(metadata)
@@ -142,6 +158,42 @@ class MultimodalFakeNewsModel(nn.Module):
         logits = self.classifier(fused_output)
         return logits.squeeze(-1)
 
+def save_model_config(model_path, text_model_name, image_model_name,
+                      text_embedding_dim, img_embedding_dim,
+                      fusion_output_dim=FUSION_OUTPUT_DIM, max_text_len=MAX_TEXT_LEN, quantization=None,
+                      structure=None):
+    """
+    Writes the architecture next to the checkpoint (model.pth -> model.json) so the
+    backend can rebuild MultimodalFakeNewsModel with the right backbones and dims.
+    `quantization` (see quantization.quantization_config) marks an INT8 state dict,
+    `structure` (see pruning.py) describes a pruned text encoder.
+    """
+    config_path = Path(model_path).with_suffix('.json')
+    config = {
+        'text_model_name': text_model_name,
+        'image_model_name': image_model_name,
+        'text_embedding_dim': text_embedding_dim,
+        'img_embedding_dim': img_embedding_dim,
+        'fusion_output_dim': fusion_output_dim,
+        'max_text_len': max_text_len,
+    }
+    if structure:
+        config['structure'] = structure
+    if quantization:
+        config['quantization'] = quantization
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    logging.info(f"Model config saved to {config_path}")
+    return config_path
+
+def load_model_config(model_path):
+    """ Reads the sidecar written by save_model_config, {} if the checkpoint has none. """
+    config_path = Path(model_path).with_suffix('.json')
+    if not config_path.is_file():
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
 # --- Training and Evaluation Functions (移除 metadata 相关) ---
 
 def train_epoch(model, data_loader, loss_fn, optimizer, device):
@@ -221,7 +273,133 @@ def evaluate_epoch(model, data_loader, loss_fn, device):
 # 移除 METADATA_COLS 定义
 # METADATA_COLS = [...] 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the text-image fake news model, or fine-tune it for INT8 with --qat.")
+    parser.add_argument('--qat', action='store_true',
+                        help="Quantization-aware fine-tuning of --init_model, exports a dynamic INT8 model")
+    parser.add_argument('--init_model', type=str, default=str(BEST_MODEL_PATH),
+                        help=f"QAT: fp32 checkpoint to start from (default: {BEST_MODEL_PATH})")
+    parser.add_argument('--output_path', type=str, default=str(QAT_MODEL_PATH),
+                        help=f"QAT: where to save the INT8 state dict (default: {QAT_MODEL_PATH})")
+    parser.add_argument('--qat_epochs', type=int, default=QAT_EPOCHS)
+    parser.add_argument('--csv_path', type=str, default=str(CSV_PATH))
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE)
+    return parser.parse_args()
+
+def build_int8_model(model_config):
+    """ Empty quantized model with the sidecar's architecture, ready for load_state_dict (CPU) """
+    model = MultimodalFakeNewsModel(
+        text_model_name=model_config['text_model_name'],
+        image_model_name=model_config['image_model_name'],
+        fusion_output_dim=model_config.get('fusion_output_dim', FUSION_OUTPUT_DIM),
+        structure=model_config.get('structure'),
+    )
+    return quantize_model(model, model_config['quantization']['modules'])
+
+def run_qat(args):
+    """
+    Quantization-aware fine-tuning: starts from a trained fp32 checkpoint, fine-tunes with
+    simulated INT8 linears for a few epochs and exports the best epoch (by Val F1) as a
+    dynamic INT8 state dict + sidecar the backend loads directly.
+    The test report compares fp32, plain post-training quantization and QAT.
+    """
+    logging.info("--- Starting Quantization-Aware Fine-Tuning ---")
+    start_time = time.time()
+
+    torch.manual_seed(RANDOM_SEED)
+    np.random.seed(RANDOM_SEED)
+
+    # 1. Load Data and Split (identical split to the fp32 training run)
+    try:
+        df = pd.read_csv(args.csv_path)
+        train_val_df, test_df = train_test_split(df, test_size=TEST_SPLIT, random_state=RANDOM_SEED, stratify=df['label'])
+        train_df, val_df = train_test_split(train_val_df, test_size=VALIDATION_SPLIT/(1-TEST_SPLIT), random_state=RANDOM_SEED, stratify=train_val_df['label'])
+        logging.info(f"Data split: Train={len(train_df)}, Val={len(val_df)}, Test={len(test_df)}")
+    except FileNotFoundError:
+        logging.error(f"FATAL: Processed CSV not found at {args.csv_path}. Run preprocess script first.")
+        return
+
+    model_config = load_model_config(args.init_model)
+    if model_config.get('quantization'):
+        logging.error(f"FATAL: {args.init_model} is already quantized, start QAT from an fp32 checkpoint.")
+        return
+    text_model_name = model_config.get('text_model_name', TEXT_MODEL_NAME)
+    image_model_name = model_config.get('image_model_name', IMAGE_MODEL_NAME)
+    fusion_output_dim = model_config.get('fusion_output_dim', FUSION_OUTPUT_DIM)
+    structure = model_config.get('structure')
+
+    tokenizer = get_tokenizer(text_model_name)
+    image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE)
+    train_image_transform = get_image_transforms(input_size=IMAGE_MODEL_INPUT_SIZE, augment=True)
+    train_dataset = MultimodalFakeNewsDataset(train_df, DATA_DIR, tokenizer, train_image_transform, MAX_TEXT_LEN)
+    val_dataset = MultimodalFakeNewsDataset(val_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    test_dataset = MultimodalFakeNewsDataset(test_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
+    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=2, pin_memory=True)
+    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+
+    # 2. fp32 starting point
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    cpu = torch.device('cpu')
+    logging.info(f"Using device: {device}")
+    model = MultimodalFakeNewsModel(
+        text_model_name=text_model_name,
+        image_model_name=image_model_name,
+        fusion_output_dim=fusion_output_dim,
+        structure=structure,
+    )
+    model.load_state_dict(load_state_dict(args.init_model))
+    logging.info(f"Initial fp32 model loaded from {args.init_model}")
+    loss_fn = nn.BCEWithLogitsLoss()
+
+    results = {}
+    model.to(device)
+    results['fp32'] = evaluate_epoch(model, test_loader, loss_fn, device)
+    # Baseline: post-training dynamic quantization without fine-tuning
+    ptq_model = export_int8(model)
+    results['int8 (PTQ)'] = evaluate_epoch(ptq_model, test_loader, loss_fn, cpu)
+    del ptq_model
+
+    # 3. Fine-tune with fake-quantized linears
+    prepare_qat(model)
+    optimizer = optim.AdamW([
+        {'params': model.text_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS * QAT_LR_SCALE},
+        {'params': model.image_encoder.parameters(), 'lr': LEARNING_RATE_ENCODERS * QAT_LR_SCALE},
+        {'params': model.fusion_layer.parameters(), 'lr': LEARNING_RATE_HEAD * QAT_LR_SCALE},
+        {'params': model.classifier.parameters(), 'lr': LEARNING_RATE_HEAD * QAT_LR_SCALE}
+    ], weight_decay=WEIGHT_DECAY)
+
+    best_val_f1 = -1.0
+    for epoch in range(args.qat_epochs):
+        logging.info(f"QAT Epoch {epoch + 1}/{args.qat_epochs}")
+        train_epoch(model, train_loader, loss_fn, optimizer, device)
+        _, _, _, _, val_f1, _ = evaluate_epoch(model, val_loader, loss_fn, device)
+        if val_f1 > best_val_f1:
+            best_val_f1 = val_f1
+            export_int8(model, args.output_path)
+            save_model_config(args.output_path, text_model_name, image_model_name,
+                              model.text_embedding_dim, model.img_embedding_dim,
+                              fusion_output_dim=fusion_output_dim, structure=structure,
+                              quantization=quantization_config(qat_from=str(args.init_model)))
+            logging.info(f"*** New best QAT model saved to {args.output_path} with Val F1: {best_val_f1:.4f} at epoch {epoch + 1} ***")
+
+    # 4. Reload the export the way the backend does and compare on the test set
+    int8_model = build_int8_model(load_model_config(args.output_path))
+    int8_model.load_state_dict(torch.load(args.output_path, map_location='cpu'))
+    results['int8 (QAT)'] = evaluate_epoch(int8_model, test_loader, loss_fn, cpu)
+
+    logging.info("--- QAT Test Set Comparison ---")
+    logging.info(f"{'Model':<12}{'Accuracy':>10}{'F1':>8}{'AUC':>8}")
+    for name, (_, acc, _, _, f1, auc) in results.items():
+        logging.info(f"{name:<12}{acc:>10.4f}{f1:>8.4f}{auc:>8.4f}")
+    logging.info(f"Total QAT duration: {(time.time() - start_time) / 60:.2f} minutes")
+
 def main():
+    args = parse_args()
+    if args.qat:
+        run_qat(args)
+        return
+
     logging.info("--- Starting Model Training (Metadata Excluded) ---")
     start_time = time.time()
 
@@ -233,12 +411,12 @@ def main():
     # 1. Load Data and Split (保持不变)
     logging.info("Loading and splitting data...")
     try:
-        df = pd.read_csv(CSV_PATH)
+        df = pd.read_csv(args.csv_path)
         train_val_df, test_df = train_test_split(df, test_size=TEST_SPLIT, random_state=RANDOM_SEED, stratify=df['label'])
         train_df, val_df = train_test_split(train_val_df, test_size=VALIDATION_SPLIT/(1-TEST_SPLIT), random_state=RANDOM_SEED, stratify=train_val_df['label'])
         logging.info(f"Data split: Train={len(train_df)}, Val={len(val_df)}, Test={len(test_df)}")
     except FileNotFoundError:
-        logging.error(f"FATAL: Processed CSV not found at {CSV_PATH}. Run preprocess script first.")
+        logging.error(f"FATAL: Processed CSV not found at {args.csv_path}. Run preprocess script first.")
         return
     except Exception as e:
          logging.error(f"FATAL: Error loading or splitting data: {e}")
@@ -262,9 +440,9 @@ def main():
         val_dataset = MultimodalFakeNewsDataset(val_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
         test_dataset = MultimodalFakeNewsDataset(test_df, DATA_DIR, tokenizer, image_transform, MAX_TEXT_LEN)
 
-        train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=2, pin_memory=True)
-        val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=2, pin_memory=True)
-        test_loader = DataLoader(test_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=2, pin_memory=True)
+        train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=2, pin_memory=True)
+        val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
+        test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False, num_workers=2, pin_memory=True)
         logging.info("DataLoaders created.")
     except Exception as e:
          logging.error(f"FATAL: Error creating Datasets or DataLoaders: {e}", exc_info=True)
@@ -279,8 +457,6 @@ def main():
     model = MultimodalFakeNewsModel(
         text_model_name=TEXT_MODEL_NAME,
         image_model_name=IMAGE_MODEL_NAME,
-        text_embedding_dim=TEXT_EMBEDDING_DIM,
-        img_embedding_dim=IMG_EMBEDDING_DIM,
         fusion_output_dim=FUSION_OUTPUT_DIM,
         freeze_encoders=False 
     ).to(device)
@@ -319,6 +495,8 @@ def main():
             best_epoch = epoch + 1
             # 使用新的模型路径
             torch.save(model.state_dict(), BEST_MODEL_PATH) 
+            save_model_config(BEST_MODEL_PATH, TEXT_MODEL_NAME, IMAGE_MODEL_NAME,
+                              model.text_embedding_dim, model.img_embedding_dim)
             logging.info(f"*** New best model saved to {BEST_MODEL_PATH} with Val F1: {best_val_f1:.4f} at epoch {best_epoch} ***")
             epochs_no_improve = 0
         else: